@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of one chat message broadcast against number of connected sessions: former emit() per session,
+which encodes the packet for every session, and ChatNamespace._broadcast encoding it once.
+Sockets are in-memory, so only encoding and queueing is measured, not transports.
+Run from repository root: python -m benchmarks.broadcast_bench [session counts] [broadcasts]
+e.g. python -m benchmarks.broadcast_bench 100,1000,5000 20
+"""
+import sys
+import timeit
+from collections import deque
+from socketio import packet
+from socketio.defaultjson import default_json_dumps
+from socketioserver import ChatNamespace
+
+MESSAGE = [12345, u'Привет всем, это сообщение для проверки рассылки' * 2, u'login', '2015-06-01 12:00:00']
+
+
+class BenchSocket(object):
+    """
+    Socket with the interface used by namespace emit and broadcast, client queue is a deque
+    """
+    json_dumps = staticmethod(default_json_dumps)
+
+    def __init__(self):
+        self.session = {}
+        self.queue = deque()
+
+    def send_packet(self, pkt):
+        self.put_client_msg(packet.encode(pkt, self.json_dumps))
+
+    def put_client_msg(self, msg):
+        self.queue.append(msg)
+
+
+def former_broadcast(namespace, event, message):
+    for s in namespace._sessions.values():
+        s.emit(event, message)
+
+
+def current_broadcast(namespace, event, message):
+    ChatNamespace._broadcast(event, message)
+
+
+def create_sessions(count):
+    ChatNamespace._sessions = {}
+    sessions = []
+    for x in range(count):
+        namespace = ChatNamespace({'socketio': BenchSocket()}, '/chat')
+        ChatNamespace._sessions[namespace.uuid] = namespace
+        sessions.append(namespace)
+    return sessions
+
+
+def measure(func, sessions, broadcasts):
+    sender = sessions[0]
+
+    def broadcast():
+        func(sender, sender.CHAT_METHOD, MESSAGE)
+        for s in sessions:
+            s.socket.queue.clear()
+    return min(timeit.repeat(broadcast, number=broadcasts, repeat=3)) / broadcasts
+
+
+def main():
+    counts = [int(item) for item in (sys.argv[1] if len(sys.argv) > 1 else '100,1000,5000').split(',')]
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print("%8s %16s %16s %10s" % ('sessions', 'emit each, ms', 'encode once, ms', 'speedup'))
+    for count in counts:
+        sessions = create_sessions(count)
+        former = measure(former_broadcast, sessions, broadcasts)
+        current = measure(current_broadcast, sessions, broadcasts)
+        print("%8d %16.3f %16.3f %9.1fx" % (count, former * 1000, current * 1000, former / current))
+    ChatNamespace._sessions = {}
+
+if __name__ == '__main__':
+    main()
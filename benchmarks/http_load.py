@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP load benchmark of httpserver.ChatServer.
+By default it starts redis-server on a free port, a ChatServer with a temporary SQLite database and then runs
+every scenario with a multi-process load generator. Every client process keeps one persistent connection.
+Every client has its own client address, passed in X-Real-IP header, and the started server has rate limits
+high enough to measure handlers rather than 429 responses. A server started with --port keeps its own limits.
+Results are printed, can be saved as JSON and compared with a stored baseline.
+Run from repository root: python -m benchmarks.http_load [options]
+e.g. python -m benchmarks.http_load --duration 10 --clients 16 --output new.json --baseline base.json
+"""
+import sys
+import os
+import time
+import json
+import socket
+import shutil
+import signal
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+SCENARIOS = ('index_root', 'index_html', 'static_js', 'auth', 'registration')
+PASSWORD = 'benchpassword'
+USERS_PER_CLIENT = 1
+READ_SIZE = 65536
+COMPARED = (('rps', 1), ('p50', -1), ('p95', -1), ('p99', -1), ('errors', -1))
+# limit name: (tokens per second, bucket size) of started server
+RATE_LIMITS = {
+    'auth': (1000000.0, 1000000),
+    'registration': (1000000.0, 1000000),
+    'chat': (1000000.0, 1000000),
+}
+
+
+def get_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_port(port, timeout=10.0):
+    """
+    Wait until something listens on local port
+    :param port: TCP port
+    :param timeout: seconds
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError("Nothing listens on port {} after {} seconds".format(port, timeout))
+
+
+def start_redis(redisserver, port):
+    """
+    Start redis-server without persistence
+    :param redisserver: path to redis-server binary
+    :param port: TCP port
+    :return: Popen
+    """
+    process = subprocess.Popen([redisserver, '--port', str(port), '--bind', '127.0.0.1', '--save', '',
+                                '--appendonly', 'no'], stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    wait_port(port)
+    return process
+
+
+def serve(port, dbpath, redisport, workers):
+    """
+    Server process: run ChatServer with logging limited to warnings
+    """
+    logging.basicConfig(level=logging.WARNING)
+    import httpserver
+    httpserver.start_http('127.0.0.1', port, workers, dbpath=dbpath, redisport=redisport, ratelimits=RATE_LIMITS)
+
+
+def start_server(port, dbpath, redisport, workers):
+    """
+    Start ChatServer in child process
+    :return: Process
+    """
+    process = multiprocessing.Process(target=serve, args=(port, dbpath, redisport, workers))
+    process.start()
+    wait_port(port)
+    return process
+
+
+def stop_process(process):
+    if isinstance(process, subprocess.Popen):
+        process.terminate()
+        process.wait()
+    elif process.is_alive():
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(15)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def get_rss(pid):
+    """
+    Get resident memory of process and its children
+    :param pid: process identifier
+    :return: kilobytes
+    """
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open('/proc/{}/status'.format(pid)) as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open('/proc/{0}/task/{0}/children'.format(pid)) as children:
+                pids.extend(int(child) for child in children.read().split())
+        except (IOError, OSError, ValueError):
+            pass
+    return total
+
+
+class Client(object):
+    """
+    Persistent HTTP/1.1 connection
+    """
+
+    def __init__(self, port, address):
+        """
+        Constructor
+        :param port: server port
+        :param address: client address sent in X-Real-IP header, server trusts it from loopback proxy
+        """
+        self.port = port
+        self.address = address
+        self.sock = None
+        self.buff = b''
+
+    def connect(self):
+        self.sock = socket.create_connection(('127.0.0.1', self.port), 10)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buff = b''
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, method, url, body=b'', headers=()):
+        """
+        Send request and read response
+        :return: (status code, response headers dict)
+        """
+        if self.sock is None:
+            self.connect()
+        lines = ["%s %s HTTP/1.1" % (method, url), "Host: 127.0.0.1:%d" % self.port, "X-Real-IP: " + self.address]
+        lines.extend(headers)
+        if method == 'POST':
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+            lines.append("Content-Length: %d" % len(body))
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        while b'\r\n\r\n' not in self.buff:
+            self.read()
+        head, self.buff = self.buff.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        responseHeaders = {}
+        for line in lines[1:]:
+            key, sep, value = line.partition(':')
+            responseHeaders[key.strip().lower()] = value.strip()
+        length = int(responseHeaders.get('content-length', 0))
+        while len(self.buff) < length:
+            self.read()
+        self.buff = self.buff[length:]
+        if responseHeaders.get('connection', '').lower() == 'close':
+            self.close()
+        return status, responseHeaders
+
+    def read(self):
+        chunk = self.sock.recv(READ_SIZE)
+        if not chunk:
+            raise socket.error("Connection closed by server")
+        self.buff += chunk
+
+
+class Scenario(object):
+    """
+    Request of a scenario. Subclasses prepare state before measurement and build each request.
+    """
+    method = 'GET'
+    url = '/'
+    headers = ()
+    expected = (200,)
+
+    def __init__(self, client, number):
+        """
+        Constructor
+        :param client: Client
+        :param number: client process number, used for unique logins
+        """
+        self.client = client
+        self.number = number
+        self.counter = 0
+
+    def prepare(self):
+        pass
+
+    def get_body(self):
+        return b''
+
+    def run_once(self):
+        """
+        Send one request
+        :return: response is expected - True, else - False
+        """
+        self.counter += 1
+        status, headers = self.client.request(self.method, self.url, self.get_body(), self.headers)
+        return status in self.expected
+
+
+class IndexRootScenario(Scenario):
+    url = '/'
+
+
+class IndexHtmlScenario(Scenario):
+    url = '/index.html'
+
+
+class StaticJsScenario(Scenario):
+    url = '/js/jquery.min.js'
+    headers = ('Accept-Encoding: gzip',)
+
+
+class AuthScenario(Scenario):
+    method = 'POST'
+    url = '/auth'
+
+    def get_login(self):
+        return 'bench_auth_%d_%d' % (os.getpid(), self.number)
+
+    def prepare(self):
+        body = ('login=%s&password=%s' % (self.get_login(), PASSWORD)).encode('latin-1')
+        status, headers = self.client.request('POST', '/registration', body)
+        if status != 200:
+            raise RuntimeError("Registration of benchmark user failed with status {}".format(status))
+
+    def get_body(self):
+        return ('login=%s&password=%s' % (self.get_login(), PASSWORD)).encode('latin-1')
+
+
+class RegistrationScenario(Scenario):
+    method = 'POST'
+    url = '/registration'
+
+    def get_body(self):
+        return ('login=bench_reg_%d_%d_%d_%d&password=%s' % (os.getpid(), self.number, int(time.time()),
+                                                            self.counter, PASSWORD)).encode('latin-1')
+
+SCENARIO_CLASSES = {
+    'index_root': IndexRootScenario,
+    'index_html': IndexHtmlScenario,
+    'static_js': StaticJsScenario,
+    'auth': AuthScenario,
+    'registration': RegistrationScenario,
+}
+
+
+def load(port, scenario, number, start, duration, result):
+    """
+    Client process: send requests of scenario from start timestamp for duration seconds
+    """
+    client = Client(port, '10.0.%d.%d' % (number // 250, number % 250 + 1))
+    latencies = []
+    errors = 0
+    try:
+        job = SCENARIO_CLASSES[scenario](client, number)
+        job.prepare()
+    except Exception as err:
+        result.put(([], 1, str(err)))
+        return
+    time.sleep(max(0, start - time.time()))
+    stop = start + duration
+    while time.time() < stop:
+        begin = time.time()
+        try:
+            if not job.run_once():
+                errors += 1
+                continue
+        except (socket.error, ValueError, IndexError):
+            errors += 1
+            client.close()
+            continue
+        latencies.append(time.time() - begin)
+    client.close()
+    result.put((latencies, errors, None))
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0.0
+
+
+def run_scenario(port, scenario, clients, duration, serverpid):
+    """
+    Run scenario with several client processes
+    :return: dictionary of results
+    """
+    result = multiprocessing.Queue()
+    start = time.time() + 1.0
+    processes = [multiprocessing.Process(target=load, args=(port, scenario, x, start, duration, result))
+                 for x in range(clients)]
+    for process in processes:
+        process.start()
+    rssPeak = 0
+    while time.time() < start + duration:
+        time.sleep(0.2)
+        rssPeak = max(rssPeak, get_rss(serverpid) if serverpid else 0)
+    latencies = []
+    errors = 0
+    failures = []
+    for process in processes:
+        clientLatencies, clientErrors, failure = result.get()
+        latencies.extend(clientLatencies)
+        errors += clientErrors
+        if failure:
+            failures.append(failure)
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'clients': clients,
+        'duration': duration,
+        'requests': len(latencies),
+        'rps': len(latencies) / float(duration),
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'errors': errors,
+        'rss_kb': rssPeak,
+        'failures': failures[:3],
+    }
+
+
+def print_result(result):
+    print("%-13s %9.0f req/s  p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  errors %5d  rss %7d KB%s" % (
+        result['scenario'], result['rps'], result['p50'], result['p95'], result['p99'], result['errors'],
+        result['rss_kb'], '  ' + '; '.join(result['failures']) if result['failures'] else ''))
+
+
+def compare(results, baseline, threshold):
+    """
+    Print difference with baseline
+    :param results: list of result dictionaries
+    :param baseline: list of result dictionaries
+    :param threshold: percent of worsening reported as regression
+    :return: list of regression descriptions
+    """
+    regressions = []
+    baseResults = dict((item['scenario'], item) for item in baseline)
+    for result in results:
+        base = baseResults.get(result['scenario'])
+        if base is None:
+            continue
+        changes = []
+        for key, better in COMPARED:
+            if not base[key]:
+                changes.append("%s %s->%s" % (key, base[key], result[key]))
+                if key == 'errors' and result[key]:
+                    regressions.append("%s: errors %d" % (result['scenario'], result[key]))
+                continue
+            change = (result[key] - base[key]) * 100.0 / base[key]
+            changes.append("%s %+.1f%%" % (key, change))
+            if change * better < -threshold:
+                regressions.append("%s: %s %+.1f%%" % (result['scenario'], key, change))
+        print("%-13s %s" % (result['scenario'], '  '.join(changes)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark of ChatServer")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated: " + ', '.join(SCENARIOS))
+    parser.add_argument('--clients', type=int, default=8, help="client processes, one connection each")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument('--workers', type=int, default=0, help="pre-forked server processes, 0 - single process")
+    parser.add_argument('--port', type=int, default=None,
+                        help="benchmark already running server on this port instead of starting one")
+    parser.add_argument('--redis-server', default='redis-server', help="redis-server binary")
+    parser.add_argument('--output', help="save results to JSON file")
+    parser.add_argument('--baseline', help="compare with results saved by --output")
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent of worsening that is a regression")
+    args = parser.parse_args()
+    scenarios = [item for item in args.scenarios.split(',') if item]
+    for scenario in scenarios:
+        if scenario not in SCENARIO_CLASSES:
+            parser.error("unknown scenario {}".format(scenario))
+    processes = []
+    tempdir = None
+    serverPid = None
+    port = args.port
+    try:
+        if port is None:
+            tempdir = tempfile.mkdtemp(prefix='http_load')
+            redisPort = get_free_port()
+            processes.append(start_redis(args.redis_server, redisPort))
+            port = get_free_port()
+            server = start_server(port, os.path.join(tempdir, 'db', 'database.db'), redisPort, args.workers)
+            processes.append(server)
+            serverPid = server.pid
+        results = []
+        for scenario in scenarios:
+            result = run_scenario(port, scenario, args.clients, args.duration, serverPid)
+            print_result(result)
+            results.append(result)
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+        if tempdir is not None:
+            shutil.rmtree(tempdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compare(results, json.load(baselineFile), args.threshold)
+        if regressions:
+            print("Regressions: " + ', '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
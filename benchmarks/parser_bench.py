@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of HTTP request parsing: regex path of BaseMessage against RequestParser.
+Run from repository root: python -m benchmarks.parser_bench
+"""
+import timeit
+from http.message import Request
+from http.message import RequestParser
+
+GET_REQUEST = b"GET /js/jquery.min.js HTTP/1.1\r\n" \
+              b"Host: 127.0.0.1:9090\r\n" \
+              b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:38.0) Gecko/20100101 Firefox/38.0\r\n" \
+              b"Accept: */*\r\n" \
+              b"Accept-Language: en-US,en;q=0.5\r\n" \
+              b"Accept-Encoding: gzip, deflate\r\n" \
+              b"Referer: http://127.0.0.1:9090/chat.html\r\n" \
+              b"Cookie: chat_cookie=0123456789abcdef0123456789abcdef\r\n" \
+              b"Connection: keep-alive\r\n\r\n"
+
+
+def post_request(bodylen):
+    body = b"login=user&password=" + b"x" * max(0, bodylen - len(b"login=user&password="))
+    return b"POST /auth HTTP/1.1\r\n" \
+           b"Host: 127.0.0.1:9090\r\n" \
+           b"Content-Type: application/x-www-form-urlencoded\r\n" \
+           b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+
+
+def split(message, chunksize):
+    return [message[i:i + chunksize] for i in range(0, len(message), chunksize)]
+
+
+def regex_path(chunks):
+    """
+    Former Session.handle_read behaviour: append and rescan whole buffer on every recv
+    """
+    rbuff = b''
+    result = []
+    for chunk in chunks:
+        rbuff += chunk
+        if Request.is_message_ready(rbuff):
+            rindex = Request.get_message_len(rbuff)
+            request = Request(headers={}, params={})
+            request.from_string(rbuff[:rindex])
+            rbuff = rbuff[rindex:]
+            result.append(request)
+    return result
+
+
+def parser_path(chunks):
+    parser = RequestParser()
+    result = []
+    for chunk in chunks:
+        result.extend(parser.feed(chunk))
+    return result
+
+
+def run(name, message, chunksize, number):
+    chunks = split(message, chunksize)
+    assert len(regex_path(chunks)) == len(parser_path(chunks)) == 1
+    regexTime = min(timeit.repeat(lambda: regex_path(chunks), number=number, repeat=3)) / number
+    parserTime = min(timeit.repeat(lambda: parser_path(chunks), number=number, repeat=3)) / number
+    print("%-32s %8d bytes %6d recvs  regex: %10.1f us  parser: %10.1f us  x%.1f" % (
+        name, len(message), len(chunks), regexTime * 1e6, parserTime * 1e6, regexTime / parserTime))
+
+
+def main():
+    run("GET, single recv", GET_REQUEST, 4048, 5000)
+    run("GET, 16 byte recvs", GET_REQUEST, 16, 1000)
+    run("POST 1 KB body, single recv", post_request(1024), 4048, 2000)
+    run("POST 4 KB body, 1024 byte recvs", post_request(4 * 1024), 1024, 3)
+    run("POST 8 KB body, 4048 byte recvs", post_request(8 * 1024), 4048, 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Event loop benchmark: request latency and throughput of http.server.Session with many idle connections.
+Run from repository root: python -m benchmarks.reactor_bench [idle counts] [active clients] [seconds]
+e.g. python -m benchmarks.reactor_bench 1000,10000 20 5
+"""
+import sys
+import os
+import time
+import socket
+import signal
+import asyncore
+import resource
+import multiprocessing
+from http.reactor import Reactor
+from http.server import Server
+from http.server import Session
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+LOOPS = ('epoll', 'poll', 'select')
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def serve(loopname, ready):
+    raise_fd_limit()
+    reactor = Reactor(useepoll=loopname == 'epoll')
+    server = Server('127.0.0.1', 0, Session, map=reactor.map, keepalivetimeout=3600, maxrequests=10 ** 9)
+    server.socket.listen(1024)
+    ready.put(server.socket.getsockname()[1])
+    if loopname == 'select':
+        asyncore.loop(1.0, use_poll=False, map=reactor.map)
+    else:
+        reactor.run()
+
+
+def client(port, duration, result):
+    sock = socket.create_connection(('127.0.0.1', port))
+    latencies = []
+    errors = 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        start = time.time()
+        try:
+            sock.sendall(REQUEST)
+            data = b''
+            while b'\r\n\r\n' not in data:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise socket.error("Connection closed")
+                data += chunk
+        except socket.error:
+            errors += 1
+            sock = socket.create_connection(('127.0.0.1', port))
+            continue
+        latencies.append(time.time() - start)
+    result.put((latencies, errors))
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0.0
+
+
+def run(loopname, idle, active, duration):
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(loopname, ready))
+    server.start()
+    port = ready.get()
+    idleSockets = []
+    try:
+        for x in range(idle):
+            idleSockets.append(socket.create_connection(('127.0.0.1', port)))
+    except socket.error as err:
+        print("%-7s idle %6d: failed after %d connections: %s" % (loopname, idle, len(idleSockets), err))
+        server.terminate()
+        return
+    time.sleep(0.5)
+    result = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client, args=(port, duration, result)) for x in range(active)]
+    for process in clients:
+        process.start()
+    latencies = []
+    errors = 0
+    for process in clients:
+        clientLatencies, clientErrors = result.get()
+        latencies.extend(clientLatencies)
+        errors += clientErrors
+    for process in clients:
+        process.join()
+    alive = server.is_alive()
+    os.kill(server.pid, signal.SIGTERM)
+    server.join()
+    for sock in idleSockets:
+        sock.close()
+    latencies.sort()
+    print("%-7s idle %6d active %4d: %8.0f req/s  p50 %7.2f ms  p99 %7.2f ms  errors %d%s" % (
+        loopname, idle, active, len(latencies) / float(duration), percentile(latencies, 50) * 1000,
+        percentile(latencies, 99) * 1000, errors, '' if alive else '  (server died)'))
+
+
+def main():
+    idleCounts = [int(item) for item in (sys.argv[1] if len(sys.argv) > 1 else '0,1000,10000').split(',')]
+    active = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    limit = raise_fd_limit()
+    for idle in idleCounts:
+        if idle + active + 64 > limit:
+            print("idle %d: skipped, RLIMIT_NOFILE %d is too low" % (idle, limit))
+            continue
+        for loopname in LOOPS:
+            if loopname == 'select' and idle + active >= 1000:
+                print("%-7s idle %6d: skipped, select() is limited by FD_SETSIZE" % (loopname, idle))
+                continue
+            run(loopname, idle, active, duration)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Allocation and time per response: Response object, ResponseTemplate and former Response layout.
+Allocations are measured by tracemalloc when it is available, else by number of gc tracked objects
+and sys.getsizeof of retained objects.
+Run from repository root: python -m benchmarks.response_bench [responses]
+"""
+import sys
+import gc
+import timeit
+from http.message import Response
+from http.message import ResponseTemplate
+from http.message import BaseMessage
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CONNECTION_HEADERS = 'Connection: keep-alive\r\nKeep-Alive: timeout=15, max=99\r\n'
+NOT_FOUND = ResponseTemplate(404)
+
+
+class FormerResponse(BaseMessage):
+    """
+    Layout of Response before slots: instance dict with its own copy of status table
+    """
+
+    def __init__(self, responsecode=200):
+        BaseMessage.__init__(self, dict(Response().headers), '')
+        self.responses = dict(Response.RESPONSES)
+        self.responseCode = str(responsecode)
+        self.responseCodeName = self.responses[responsecode][0]
+        self.version = '1.0'
+
+    def __str__(self):
+        return "\r\n".join(["HTTP/%s %s %s" % (self.version, self.responseCode, self.responseCodeName),
+                            BaseMessage.__str__(self)])
+
+
+def former_response():
+    response = FormerResponse(404)
+    response.headers['Connection'] = 'keep-alive'
+    response.headers['Keep-Alive'] = 'timeout=15, max=99'
+    return response, str(response)
+
+
+def response_object():
+    response = Response(responsecode=404)
+    response.headers['Connection'] = 'keep-alive'
+    response.headers['Keep-Alive'] = 'timeout=15, max=99'
+    return response, str(response)
+
+
+def response_template():
+    return NOT_FOUND, NOT_FOUND.render('1.1', CONNECTION_HEADERS)
+
+
+def sizeof(obj):
+    """
+    Size of object with its instance dict and dict attributes
+    """
+    size = sys.getsizeof(obj)
+    attrs = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                attrs[name] = getattr(obj, name)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    for value in attrs.values():
+        if isinstance(value, dict):
+            size += sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return size
+
+
+def measure(func, count):
+    """
+    Measure allocations of count calls whose results are retained
+    :return: (bytes per call or None, gc objects per call, retained bytes of response object)
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        objects = len(gc.get_objects())
+        if tracemalloc is not None:
+            tracemalloc.start()
+        results = [func() for x in range(count)]
+        allocated = None
+        if tracemalloc is not None:
+            allocated = tracemalloc.get_traced_memory()[0] / float(count)
+            tracemalloc.stop()
+        tracked = (len(gc.get_objects()) - objects - 1) / float(count)
+    finally:
+        gc.enable()
+    return allocated, tracked, sizeof(results[0][0]) if func is not response_template else 0
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("%-18s %12s %14s %14s %14s" % ('case', 'us/response', 'traced B/resp', 'gc objs/resp',
+                                          'object bytes'))
+    for name, func in (('former Response', former_response), ('Response', response_object),
+                       ('ResponseTemplate', response_template)):
+        seconds = min(timeit.repeat(func, number=count, repeat=3)) / count
+        allocated, tracked, size = measure(func, count)
+        print("%-18s %12.2f %14s %14.1f %14d" % (name, seconds * 1e6,
+                                                 '%.0f' % allocated if allocated is not None else 'n/a',
+                                                 tracked, size))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Size and latency report of static files with and without gzip.
+Run from repository root: python -m benchmarks.static_report [static path] [bandwidth in kbit/s]
+"""
+import sys
+from http.static import StaticCache
+
+
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else 'html'
+    bandwidth = float(sys.argv[2]) if len(sys.argv) > 2 else 1024.0
+    cache = StaticCache(root)
+    print("%-36s %10s %10s %7s %10s %12s %12s" % ("url", "size", "gzip", "saved", "gzip ms",
+                                               "identity ms", "gzip ms@%dk" % bandwidth))
+    totalSize = totalGzip = 0
+    for item in cache.report():
+        size = item['size']
+        gzipSize = item['gzip_size'] if item['gzip_size'] is not None else size
+        totalSize += size
+        totalGzip += gzipSize
+        print("%-36s %10d %10d %6.1f%% %10.2f %12.1f %12.1f" % (
+            item['url'], size, gzipSize, 100.0 * (size - gzipSize) / max(size, 1), item['compress_time'] * 1000,
+            size * 8.0 / bandwidth, gzipSize * 8.0 / bandwidth))
+    print("%-36s %10d %10d %6.1f%%" % ("total", totalSize, totalGzip, 100.0 * (totalSize - totalGzip) / max(totalSize, 1)))
+
+if __name__ == '__main__':
+    main()
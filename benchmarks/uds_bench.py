@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Latency of loopback TCP and unix domain socket between a local reverse proxy and http.server.Server.
+The server listens on both sockets. Clients send keep-alive requests to the server directly and, when nginx is
+found, through nginx proxying to the TCP and to the unix socket upstream with upstream keep-alive.
+Run from repository root: python -m benchmarks.uds_bench [options]
+e.g. python -m benchmarks.uds_bench --clients 8 --duration 5 --nginx /usr/sbin/nginx
+"""
+import os
+import time
+import socket
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from distutils.spawn import find_executable
+from http.reactor import Reactor
+from http.server import Server
+from http.server import Session
+from http.server import create_unix_socket
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+
+NGINX_CONF = """
+worker_processes 1;
+daemon off;
+pid {root}/nginx.pid;
+error_log {root}/error.log;
+events {{
+    worker_connections 4096;
+}}
+http {{
+    access_log off;
+    client_body_temp_path {root}/body;
+    proxy_temp_path {root}/proxy;
+    fastcgi_temp_path {root}/fastcgi;
+    uwsgi_temp_path {root}/uwsgi;
+    scgi_temp_path {root}/scgi;
+    upstream tcp_backend {{
+        server 127.0.0.1:{port};
+        keepalive 64;
+    }}
+    upstream unix_backend {{
+        server unix:{path};
+        keepalive 64;
+    }}
+    server {{
+        listen 127.0.0.1:{tcpproxy};
+        location / {{
+            proxy_pass http://tcp_backend;
+            proxy_http_version 1.1;
+            proxy_set_header Connection "";
+            proxy_set_header X-Real-IP $remote_addr;
+        }}
+    }}
+    server {{
+        listen 127.0.0.1:{unixproxy};
+        location / {{
+            proxy_pass http://unix_backend;
+            proxy_http_version 1.1;
+            proxy_set_header Connection "";
+            proxy_set_header X-Real-IP $remote_addr;
+        }}
+    }}
+}}
+"""
+
+
+def get_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def serve(path, ready):
+    reactor = Reactor()
+    server = Server('127.0.0.1', 0, Session, map=reactor.map, keepalivetimeout=3600, maxrequests=10 ** 9)
+    server.add_listener(create_unix_socket(path))
+    ready.put(server.socket.getsockname()[1])
+    reactor.run()
+
+
+def connect(address):
+    """
+    Connect to TCP port or unix socket path
+    :param address: port or path
+    :return: socket
+    """
+    if isinstance(address, int):
+        sock = socket.create_connection(('127.0.0.1', address))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def read_response(sock, buff):
+    """
+    Read one response with Content-Length body
+    :return: rest of buffer
+    """
+    while b'\r\n\r\n' not in buff:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise socket.error("Connection closed")
+        buff += chunk
+    head, buff = buff.split(b'\r\n\r\n', 1)
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    while len(buff) < length:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise socket.error("Connection closed")
+        buff += chunk
+    return buff[length:]
+
+
+def client(address, duration, result):
+    sock = connect(address)
+    buff = b''
+    latencies = []
+    errors = 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        start = time.time()
+        try:
+            sock.sendall(REQUEST)
+            buff = read_response(sock, buff)
+        except socket.error:
+            errors += 1
+            sock.close()
+            sock = connect(address)
+            buff = b''
+            continue
+        latencies.append(time.time() - start)
+    sock.close()
+    result.put((latencies, errors))
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0.0
+
+
+def run(name, address, clients, duration):
+    result = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(address, duration, result)) for x in range(clients)]
+    for process in processes:
+        process.start()
+    latencies = []
+    errors = 0
+    for process in processes:
+        clientLatencies, clientErrors = result.get()
+        latencies.extend(clientLatencies)
+        errors += clientErrors
+    for process in processes:
+        process.join()
+    latencies.sort()
+    print("%-12s clients %4d: %8.0f req/s  p50 %7.3f ms  p99 %7.3f ms  errors %d" % (
+        name, clients, len(latencies) / float(duration), percentile(latencies, 50) * 1000,
+        percentile(latencies, 99) * 1000, errors))
+
+
+def start_nginx(nginx, root, port, path):
+    """
+    Start nginx proxying one port to TCP and one port to unix socket of server
+    :return: (Popen, TCP upstream proxy port, unix upstream proxy port)
+    """
+    tcpProxy = get_free_port()
+    unixProxy = get_free_port()
+    conf = os.path.join(root, 'nginx.conf')
+    with open(conf, 'w') as confFile:
+        confFile.write(NGINX_CONF.format(root=root, port=port, path=path, tcpproxy=tcpProxy, unixproxy=unixProxy))
+    process = subprocess.Popen([nginx, '-p', root, '-c', conf])
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', unixProxy), 0.5).close()
+            break
+        except socket.error:
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError("nginx did not start, see {}".format(os.path.join(root, 'error.log')))
+            time.sleep(0.05)
+    return process, tcpProxy, unixProxy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback TCP vs unix domain socket latency")
+    parser.add_argument('--clients', default='1,8', help="comma separated numbers of concurrent clients")
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--nginx', default=find_executable('nginx') or find_executable('nginx', '/usr/sbin'),
+                        help="nginx binary, proxied runs are skipped without it")
+    args = parser.parse_args()
+    root = tempfile.mkdtemp(prefix='uds_bench')
+    path = os.path.join(root, 'server.sock')
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(path, ready))
+    server.start()
+    nginx = None
+    try:
+        port = ready.get()
+        targets = [('direct tcp', port), ('direct unix', path)]
+        if args.nginx:
+            nginx, tcpProxy, unixProxy = start_nginx(args.nginx, root, port, path)
+            targets += [('nginx->tcp', tcpProxy), ('nginx->unix', unixProxy)]
+        else:
+            print("nginx is not found, proxied runs are skipped")
+        for clients in [int(item) for item in args.clients.split(',')]:
+            for name, address in targets:
+                run(name, address, clients, args.duration)
+    finally:
+        if nginx is not None:
+            nginx.terminate()
+            nginx.wait()
+        os.kill(server.pid, signal.SIGTERM)
+        server.join()
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import uuid
+import logging
+import gevent
+import gevent.socket
+import redis
+
+class Backplane(object):
+    """
+    Events shared by all processes of chat server through Redis pub/sub. An event is delivered to sessions of
+    its own process directly and published once, every other process delivers it to its sessions. Published
+    events carry identifier of their origin process, so the origin skips its own events coming back.
+    Subscriber is a greenlet waiting for the subscription socket with gevent, it does not block other
+    greenlets and does not poll. Events published while the subscription is lost are not delivered.
+    """
+    CHANNEL = 'chat:events'
+    RETRY = 1.0
+    MAX_RETRY = 30.0
+
+    def __init__(self, handler, connection_pool=None, host='127.0.0.1', port=6379, channel=CHANNEL):
+        """
+        Constructor
+        :param handler: function which takes event name and message, delivers event of other process
+        :param connection_pool: redis connection pool
+        :param channel: pub/sub channel
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if connection_pool:
+            self.server = redis.Redis(connection_pool=connection_pool)
+        else:
+            self.server = redis.Redis(host, port)
+        self.handler = handler
+        self.channel = channel
+        self.originId = uuid.uuid4().hex
+        self.greenlet = None
+
+    def start(self):
+        """
+        Start subscriber greenlet
+        :return: greenlet
+        """
+        self.greenlet = gevent.spawn(self.listen)
+        return self.greenlet
+
+    def stop(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    def publish(self, event, message):
+        """
+        Publish event to other processes
+        :param event: event name
+        :param message: JSON serializable event argument
+        """
+        log = self._log.getChild('publish')
+        try:
+            self.server.publish(self.channel, json.dumps([self.originId, event, message]))
+        except redis.exceptions.RedisError as err:
+            log.warning("Event %s is not published: %s", event, err)
+
+    def listen(self):
+        """
+        Deliver events of other processes, subscribe again after connection is lost or any other error
+        """
+        log = self._log.getChild('listen')
+        retry = self.RETRY
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.server.pubsub()
+                pubsub.subscribe(self.channel)
+                retry = self.RETRY
+                connection = pubsub.connection
+                while True:
+                    # replies are read from connection directly, PubSub would reconnect and block on reading
+                    if not connection.can_read():
+                        gevent.socket.wait_read(connection._sock.fileno())
+                    message = pubsub.handle_message(connection.read_response(), ignore_subscribe_messages=True)
+                    if message is not None:
+                        self.receive(message['data'])
+            except redis.exceptions.RedisError as err:
+                log.warning("Channel %s is lost: %s", self.channel, err)
+            except Exception:
+                # e.g. socket error of wait_read or undecodable reply, subscriber must not die
+                log.exception("Channel %s subscriber failed", self.channel)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+            gevent.sleep(retry)
+            retry = min(retry * 2, self.MAX_RETRY)
+
+    def receive(self, data):
+        """
+        Deliver published event unless it comes from this process
+        :param data: published data
+        """
+        log = self._log.getChild('receive')
+        try:
+            origin, event, message = json.loads(data)
+        except ValueError:
+            log.warning("Malformed event: %r", data)
+            return
+        if origin == self.originId:
+            return
+        try:
+            self.handler(event, message)
+        except Exception:
+            log.exception("Event %s is not delivered", event)
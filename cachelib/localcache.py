@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from collections import OrderedDict
+from utils import metrics
+
+REQUESTS = metrics.Counter('local_cache_requests_total', "Lookups in in-process caches", ('cache', 'result'))
+INVALIDATIONS = metrics.Counter('local_cache_invalidations_total', "Entries removed from in-process caches "
+                                                                   "by invalidation", ('cache',))
+
+class LocalCache(object):
+    """
+    Bounded in-process LRU cache with entries expiring after ttl. Safe to use from several threads.
+    """
+    MISSING = object()
+
+    def __init__(self, name, maxsize, ttl):
+        """
+        Constructor
+        :param name: cache name for metrics
+        :param maxsize: max number of entries, the least recently used entry is evicted
+        :param ttl: seconds entry is valid for
+        """
+        self.name = name
+        self.maxSize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = REQUESTS.labels(name, 'hit')
+        self.misses = REQUESTS.labels(name, 'miss')
+        self.expired = REQUESTS.labels(name, 'expired')
+        self.invalidations = INVALIDATIONS.labels(name)
+
+    def get(self, key):
+        """
+        Get value of key
+        :param key: key
+        :return: value or MISSING
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses.inc()
+                return self.MISSING
+            value, expires = entry
+            if expires <= time.time():
+                self.expired.inc()
+                return self.MISSING
+            self.entries[key] = entry
+        self.hits.inc()
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value of key
+        :param key: key
+        :param value: value
+        :param ttl: seconds entry is valid for, defaults to ttl of cache
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Invalidate key
+        :param key: key
+        :return: True if key was cached
+        """
+        with self.lock:
+            found = self.entries.pop(key, None) is not None
+        if found:
+            self.invalidations.inc()
+        return found
+
+    def clear(self):
+        """
+        Invalidate all keys
+        """
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        self.invalidations.inc(count)
+
+    def __len__(self):
+        return len(self.entries)
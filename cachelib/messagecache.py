@@ -16,7 +16,10 @@ class MessageCache(object):
         self.TIMESTAMP = 'timestamp'
         self.MESSAGE_ID = 'id'
         self.MESSAGE_KEY = 'messageid:'
+        # sorted set of message identifiers scored by identifier, pages are read from it by cursor
+        self.INDEX_KEY = 'messageindex'
         self.MESSAGE_TIMEOUT = 86400
+        self.MAX_INDEX_SIZE = 100000
 
     def add_message(self, messageid, message, userlogin, timestamp):
         """
@@ -33,6 +36,8 @@ class MessageCache(object):
             pipe.hmset(messageKey, {self.MESSAGE_ID: messageid, self.MESSAGE: message,
                                     self.USER_LOGIN: userlogin, self.TIMESTAMP: timestamp})
             pipe.expire(messageKey, self.MESSAGE_TIMEOUT)
+            pipe.zadd(self.INDEX_KEY, messageid, messageid)
+            pipe.zremrangebyrank(self.INDEX_KEY, 0, -self.MAX_INDEX_SIZE - 1)
             pipe.execute()
 
     def delete_message(self, messageid):
@@ -41,21 +46,51 @@ class MessageCache(object):
         :param messageid: message identifier
         :return:
         """
-        self.server.delete(self._get_message_key(messageid))
+        with self.server.pipeline() as pipe:
+            pipe.multi()
+            pipe.delete(self._get_message_key(messageid))
+            pipe.zrem(self.INDEX_KEY, messageid)
+            pipe.execute()
 
-    def get_message_list(self):
+    def get_messages(self, before=None, count=50):
         """
-        Get message list
-        :return:
+        Get page of messages older than cursor, O(log n + count)
+        :param before: message identifier cursor, the latest messages if None
+        :param count: max number of messages
+        :return: list of [id, message, user login, timestamp] sorted from old to new
         """
-        keyList = self.server.keys('{}*'.format(self.MESSAGE_KEY))
-        result = []
-        for key in keyList:
-            messageInfo = self.server.hmget(key, self.MESSAGE_ID, self.MESSAGE, self.USER_LOGIN, self.TIMESTAMP)
-            result.append(messageInfo)
-        result.sort(key=lambda r: r[3])
+        maxScore = '+inf' if before is None else '({}'.format(int(before))
+        idList = self.server.zrevrangebyscore(self.INDEX_KEY, maxScore, '-inf', start=0, num=count)
+        if not idList:
+            return []
+        with self.server.pipeline(transaction=False) as pipe:
+            for messageId in idList:
+                pipe.hmget(self._get_message_key(messageId), self.MESSAGE_ID, self.MESSAGE, self.USER_LOGIN,
+                           self.TIMESTAMP)
+            infoList = pipe.execute()
+        result = [messageInfo for messageInfo in reversed(infoList) if messageInfo[0] is not None]
+        if len(result) < len(idList):
+            # expired messages stay in the index until a page reaches them
+            expiredList = [messageId for messageId, messageInfo in zip(idList, infoList) if messageInfo[0] is None]
+            self.server.zrem(self.INDEX_KEY, *expiredList)
         return result
 
+    def build_index(self):
+        """
+        Index cached messages stored before the index existed, does nothing if the index exists
+        :return: number of indexed messages
+        """
+        if self.server.exists(self.INDEX_KEY):
+            return 0
+        count = 0
+        with self.server.pipeline(transaction=False) as pipe:
+            for key in self.server.scan_iter('{}*'.format(self.MESSAGE_KEY)):
+                messageId = key[len(self.MESSAGE_KEY):]
+                pipe.zadd(self.INDEX_KEY, messageId, messageId)
+                count += 1
+            pipe.execute()
+        return count
+
     def _get_message_key(self, messageid):
         return "{}{}".format(self.MESSAGE_KEY, messageid)
 
@@ -64,12 +99,12 @@ def main():
     cache = MessageCache()
     import time
     import datetime
-    print(cache.get_message_list())
+    print(cache.get_messages())
     return
     import random
     for x in xrange(1, 100):
         cache.add_message(x, "Message %s" % x, "Login %s" % (random.randint(1, 5)), datetime.datetime.utcnow())
-        messageList = cache.get_message_list()
+        messageList = cache.get_messages()
         print(messageList)
         for item in messageList:
             ts = datetime.datetime.strptime(item[3],'%Y-%m-%d %H:%M:%S.%f')
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import uuid
+import logging
+import gevent
+import redis
+
+# KEYS - worker users hash, cluster user counts hash, logins hash; ARGV - user id, login
+# Returns number of workers with the user, 0 - user was already registered by this worker
+JOIN = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], 1) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+return redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+"""
+
+# KEYS - worker users hash, cluster user counts hash, logins hash; ARGV - user id
+# Returns number of workers with the user, -1 - user was not registered by this worker
+LEAVE = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local count = redis.call('HINCRBY', KEYS[2], ARGV[1], -1)
+if count <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 0
+end
+return count
+"""
+
+# KEYS - workers sorted set; ARGV - worker id, ttl
+# Refreshes heartbeat of worker by clock of Redis, so clocks of workers do not matter. Writes after TIME need
+# effects replication, it is the default since Redis 5 and is turned on explicitly before it.
+# Returns 1 if the worker was not registered, and identifiers of workers whose heartbeat has expired
+HEARTBEAT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local added = redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+return {added, redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)}
+"""
+
+# KEYS - workers sorted set, cluster user counts hash, logins hash, users hash of expired worker
+# ARGV - expired worker id
+# Removes users of worker unless it has refreshed its heartbeat since. Returns logins of users who are not online
+# anymore
+REAP = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local expires = redis.call('ZSCORE', KEYS[1], ARGV[1])
+local time = redis.call('TIME')
+if expires and tonumber(expires) > tonumber(time[1]) + tonumber(time[2]) / 1000000 then
+    return {}
+end
+local exited = {}
+for _, user in ipairs(redis.call('HKEYS', KEYS[4])) do
+    if redis.call('HINCRBY', KEYS[2], user, -1) <= 0 then
+        local login = redis.call('HGET', KEYS[3], user)
+        if login then
+            table.insert(exited, login)
+        end
+        redis.call('HDEL', KEYS[2], user)
+        redis.call('HDEL', KEYS[3], user)
+    end
+end
+redis.call('DEL', KEYS[4])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return exited
+"""
+
+class PresenceRegistry(object):
+    """
+    Online users of all processes of chat server in Redis. Every worker registers a user once, when the first
+    session of the user in the worker opens, and counts of workers by user are kept cluster-wide, so a user
+    enters when the count goes 0 -> 1 and exits when it goes 1 -> 0. Workers refresh their heartbeat every
+    HEARTBEAT_INTERVAL, users of a worker whose heartbeat is older than TTL are removed by other workers.
+    Online logins are kept locally and updated by enter and exit events and by every heartbeat, so sessions
+    get the online list without asking Redis.
+    Keys share hash tag of KEY_PREFIX, so the scripts work on Redis Cluster too.
+    """
+    KEY_PREFIX = '{presence}:'
+    HEARTBEAT_INTERVAL = 5.0
+    TTL = 15.0
+
+    def __init__(self, users, onenter, onexit, connection_pool=None, host='127.0.0.1', port=6379,
+                 interval=HEARTBEAT_INTERVAL, ttl=TTL):
+        """
+        Constructor
+        :param users: function returning dictionary of user id to login of users with sessions in this worker
+        :param onenter: function which takes login of user entered again after this worker was removed
+        :param onexit: function which takes login of user removed with a dead worker
+        :param connection_pool: redis connection pool
+        :param interval: seconds between heartbeats
+        :param ttl: seconds after the last heartbeat worker is removed
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if connection_pool:
+            self.server = redis.Redis(connection_pool=connection_pool)
+        else:
+            self.server = redis.Redis(host, port)
+        self.joinScript = self.server.register_script(JOIN)
+        self.leaveScript = self.server.register_script(LEAVE)
+        self.heartbeatScript = self.server.register_script(HEARTBEAT)
+        self.reapScript = self.server.register_script(REAP)
+        self.users = users
+        self.onEnter = onenter
+        self.onExit = onexit
+        self.interval = interval
+        self.ttl = ttl
+        self.workerId = uuid.uuid4().hex
+        self.workersKey = self.KEY_PREFIX + 'workers'
+        self.countsKey = self.KEY_PREFIX + 'users'
+        self.loginsKey = self.KEY_PREFIX + 'logins'
+        self.workerKey = self._get_worker_key(self.workerId)
+        self.registered = False
+        self.online = set()
+        self.version = 0
+        self.snapshot = ()
+        self.snapshotVersion = 0
+        self.greenlet = None
+
+    def start(self):
+        """
+        Start heartbeat greenlet, the first heartbeat registers worker
+        :return: greenlet
+        """
+        self.greenlet = gevent.spawn(self.run)
+        return self.greenlet
+
+    def stop(self):
+        """
+        Stop heartbeat and remove this worker with its users
+        :return: logins of users who are not online anymore
+        """
+        log = self._log.getChild('stop')
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
+        exited = [login for userId, login in self.users().items() if self.leave(userId)]
+        try:
+            with self.server.pipeline() as pipe:
+                pipe.multi()
+                pipe.delete(self.workerKey)
+                pipe.zrem(self.workersKey, self.workerId)
+                pipe.execute()
+        except redis.exceptions.RedisError as err:
+            log.warning("Worker %s is not removed: %s", self.workerId, err)
+        self.registered = False
+        return exited
+
+    def join(self, userid, login):
+        """
+        Register user of this worker
+        :param userid: user identifier
+        :param login: user login
+        :return: True if user has entered the cluster
+        """
+        log = self._log.getChild('join')
+        try:
+            entered = self.joinScript(keys=[self.workerKey, self.countsKey, self.loginsKey],
+                                      args=[userid, login]) == 1
+        except redis.exceptions.RedisError as err:
+            log.warning("User %s is not registered: %s", userid, err)
+            entered = self._to_text(login) not in self.online
+        self.add_online(login)
+        return entered
+
+    def leave(self, userid):
+        """
+        Unregister user of this worker
+        :param userid: user identifier
+        :return: True if user has exited the cluster
+        """
+        log = self._log.getChild('leave')
+        try:
+            return self.leaveScript(keys=[self.workerKey, self.countsKey, self.loginsKey], args=[userid]) == 0
+        except redis.exceptions.RedisError as err:
+            log.warning("User %s is not unregistered: %s", userid, err)
+            return True
+
+    def heartbeat(self):
+        """
+        Refresh heartbeat, remove dead workers and update online logins
+        """
+        added, expired = self.heartbeatScript(keys=[self.workersKey], args=[self.workerId, self.ttl])
+        if added and self.registered:
+            # this worker missed its heartbeats and was removed by other ones
+            self._log.warning("Worker %s was removed, registering its users again", self.workerId)
+            for userId, login in self.users().items():
+                if self.join(userId, login):
+                    self.onEnter(login)
+        self.registered = True
+        for workerId in expired:
+            exited = self.reapScript(keys=[self.workersKey, self.countsKey, self.loginsKey,
+                                           self._get_worker_key(workerId)], args=[workerId])
+            for login in exited:
+                self.onExit(self._to_text(login))
+        self.set_online(self.server.hvals(self.loginsKey))
+
+    def run(self):
+        log = self._log.getChild('run')
+        while True:
+            try:
+                self.heartbeat()
+            except redis.exceptions.RedisError as err:
+                log.warning("Heartbeat failed: %s", err)
+            gevent.sleep(self.interval)
+
+    def add_online(self, login):
+        login = self._to_text(login)
+        if login not in self.online:
+            self.online.add(login)
+            self.version += 1
+
+    def discard_online(self, login):
+        login = self._to_text(login)
+        if login in self.online:
+            self.online.discard(login)
+            self.version += 1
+
+    def set_online(self, logins):
+        logins = set(self._to_text(login) for login in logins)
+        if logins != self.online:
+            self.online = logins
+            self.version += 1
+
+    def get_snapshot(self):
+        """
+        Get online logins of the cluster
+        :return: (version, tuple of logins)
+        """
+        if self.snapshotVersion != self.version:
+            self.snapshot = tuple(self.online)
+            self.snapshotVersion = self.version
+        return self.version, self.snapshot
+
+    def _to_text(self, login):
+        return login.decode('utf-8') if isinstance(login, bytes) else login
+
+    def _get_worker_key(self, workerid):
+        return "{}worker:{}".format(self.KEY_PREFIX, workerid)
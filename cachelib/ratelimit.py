@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import logging
+import threading
+import redis
+from cachelib.sessioncache import BaseSessionException
+from cachelib.localcache import LocalCache
+from utils import metrics
+
+CHECKS = metrics.Counter('rate_limit_checks_total', "Rate limit checks", ('limit', 'result'))
+
+# KEYS[1] - bucket key
+# ARGV - rate (tokens per second), burst (bucket size), requested tokens
+# Refills bucket by clock of Redis, so clocks of application hosts do not matter. Writes after TIME need
+# effects replication, it is the default since Redis 5 and is turned on explicitly before it.
+# Returns number of granted tokens, 0 - bucket is empty, and seconds until the next token as string
+TOKEN_BUCKET = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+local updated = tonumber(bucket[2])
+if tokens == nil or updated == nil then
+    tokens = burst
+    updated = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local granted = math.min(requested, math.floor(tokens))
+local retry = 0
+if granted < 1 then
+    granted = 0
+    retry = (1 - tokens) / rate
+else
+    tokens = tokens - granted
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {granted, tostring(retry)}
+"""
+
+class RateLimited(BaseSessionException):
+    """
+    Too many requests exception.
+    """
+    def __init__(self, retryafter=1, errorMsg="Too many requests, try again later.", errno=429):
+        BaseSessionException.__init__(self, errorMsg=errorMsg, errno=errno)
+        self.retryAfter = retryafter
+
+    def get_retry_after(self):
+        """
+        Get value of Retry-After header
+        :return: whole seconds
+        """
+        return max(1, int(math.ceil(self.retryAfter)))
+
+
+class RateLimiter(object):
+    """
+    Token buckets shared by all processes through Redis. A bucket is checked and updated by one Lua script call.
+    Every call takes a lease of up to LEASE_SHARE of bucket size, and the leased tokens are spent locally, so
+    traffic well under the limit asks Redis once per lease. After a refusal the key is refused locally until
+    the next token is due, the refusal expires then. Leased tokens expire after LEASE_TTL, at most a lease
+    per process is not spent.
+    If Redis is not available requests are allowed.
+    """
+    KEY_PREFIX = 'ratelimit:'
+    LEASE_SHARE = 0.25
+    LEASE_TTL = 1.0
+    LOCAL_SIZE = 10000
+
+    def __init__(self, limits, connection_pool=None, host='127.0.0.1', port=6379, localsize=LOCAL_SIZE):
+        """
+        Constructor
+        :param limits: dictionary of limit name to (tokens per second, bucket size)
+        :param connection_pool: redis connection pool
+        :param localsize: max number of locally kept leases
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        if connection_pool:
+            self.server = redis.Redis(connection_pool=connection_pool)
+        else:
+            self.server = redis.Redis(host, port)
+        self.tokenBucket = self.server.register_script(TOKEN_BUCKET)
+        self.limits = dict(limits)
+        self.leases = LocalCache('rate_limit', localsize, self.LEASE_TTL)
+        self.lock = threading.Lock()
+
+    def check(self, name, key):
+        """
+        Take a token from bucket of key
+        :param name: limit name
+        :param key: client address, user identifier or other key limited separately
+        :raise RateLimited: bucket is empty
+        """
+        log = self._log.getChild('check')
+        rate, burst = self.limits[name]
+        leaseKey = (name, key)
+        now = time.time()
+        with self.lock:
+            lease = self.leases.get(leaseKey)
+            if lease is not LocalCache.MISSING:
+                if lease[0] >= 1:
+                    lease[0] -= 1
+                    CHECKS.labels(name, 'local').inc()
+                    return
+                if lease[1] > now:
+                    CHECKS.labels(name, 'local_refused').inc()
+                    raise RateLimited(lease[1] - now)
+        try:
+            granted, retry = self.tokenBucket(keys=[self._get_bucket_key(name, key)],
+                                              args=[rate, burst, max(1, int(burst * self.LEASE_SHARE))])
+        except redis.exceptions.RedisError as err:
+            log.warning("Limit %s is not checked: %s", name, err)
+            CHECKS.labels(name, 'error').inc()
+            return
+        granted = int(granted)
+        retry = float(retry)
+        with self.lock:
+            if granted:
+                self.leases.set(leaseKey, [granted - 1, 0])
+            else:
+                self.leases.set(leaseKey, [0, now + retry], retry)
+        if not granted:
+            CHECKS.labels(name, 'refused').inc()
+            raise RateLimited(retry)
+        CHECKS.labels(name, 'allowed').inc()
+
+    def _get_bucket_key(self, name, key):
+        return "{}{}:{}".format(self.KEY_PREFIX, name, key)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from cachelib.sessioncache import SessionCache
 from cachelib.messagecache import MessageCache
+from cachelib.localcache import LocalCache
+from cachelib.ratelimit import RateLimiter
 import sqlalchemy
 from sqlalchemy.orm import sessionmaker
 from error import error
@@ -10,26 +12,75 @@ from models.chat import Message
 from models.chat import ForbiddenWord
 from cachelib import sessioncache
 from utils import validator
+from utils import metrics
+from utils import tracing
 import re
+import time
+import threading
+import functools
 import logging
+import redis
+
+CALL_DURATION = metrics.Histogram('db_call_duration_seconds', "Duration of SQL and Redis calls",
+                                  ('backend', 'call'))
+
+def timed(backend, call):
+    """
+    Decorator recording duration of database handler method
+    :param backend: 'sql' or 'redis', time is also added to the span of this name in current request trace
+    :param call: method name
+    :return: decorator
+    """
+    return metrics.timed(CALL_DURATION.labels(backend, call), functools.partial(tracing.add, backend))
 
 class DatabaseHandler(object):
     """
-    Class to handle with database
+    Class to handle with database.
+    Authorized cookies are cached in process for AUTH_CACHE_TTL and unknown cookies for UNAUTHORIZED_TTL.
+    Closed sessions are published to INVALIDATION_CHANNEL, so that every process drops them from its cache.
     """
+    AUTH_CACHE_SIZE = 10000
+    AUTH_CACHE_TTL = 60
+    UNAUTHORIZED_TTL = 5
+    INVALIDATION_CHANNEL = 'auth:invalidate'
+    INVALIDATION_RETRY = 1.0
+    INVALIDATION_MAX_RETRY = 30.0
+    HISTORY_PAGE_SIZE = 50
+    MAX_HISTORY_PAGE_SIZE = 200
+    # limit name: (tokens per second, bucket size)
+    RATE_LIMITS = {
+        'auth': (0.5, 10),
+        'registration': (0.05, 3),
+        'chat': (1.0, 10),
+    }
 
-    def __init__(self, dbengine, redis_connection_pool):
+    def __init__(self, dbengine, redis_connection_pool, authcachesize=AUTH_CACHE_SIZE, authcachettl=AUTH_CACHE_TTL,
+                 unauthorizedttl=UNAUTHORIZED_TTL, ratelimits=None):
         """
         Constructor
         :param dbengine: engine with database
         :param redis_connection_pool: redis connection pool
+        :param authcachesize: max number of cached cookies of each kind
+        :param authcachettl: seconds authorized cookie is cached for
+        :param unauthorizedttl: seconds unknown cookie is cached for
+        :param ratelimits: dictionary of limit name to (tokens per second, bucket size), defaults to RATE_LIMITS
         """
         self._log = logging.getLogger(self.__class__.__name__)
         self.dbEngine = dbengine
         self.redisConnectionPool = redis_connection_pool
         self.sessionCache = SessionCache(self.redisConnectionPool)
         self.messageCache = MessageCache(self.redisConnectionPool)
+        self.build_message_index()
+        self.rateLimiter = RateLimiter(ratelimits or self.RATE_LIMITS, self.redisConnectionPool)
+        self.authCache = LocalCache('auth', authcachesize, authcachettl)
+        self.unauthorizedCache = LocalCache('unauthorized', authcachesize, unauthorizedttl)
+        # incremented by every invalidation, lookup started before it does not fill the cache
+        self.authGeneration = 0
+        self.invalidationThread = threading.Thread(target=self.listen_invalidations, name='auth-invalidation')
+        self.invalidationThread.daemon = True
+        self.invalidationThread.start()
 
+    @timed('sql', 'register_user')
     def register_user(self, login, password):
         """
         Register user
@@ -48,6 +99,7 @@ class DatabaseHandler(object):
         finally:
             session.close()
 
+    @timed('sql', 'get_user')
     def get_user(self, login, password):
         """
         Get user by login and password
@@ -66,6 +118,7 @@ class DatabaseHandler(object):
         finally:
             session.close()
 
+    @timed('sql', 'get_user_by_id')
     def get_user_by_id(self, userid):
         """
         Get user by identifier
@@ -89,30 +142,133 @@ class DatabaseHandler(object):
         except sessioncache.Unauthorized as err:
             return None
 
+    @timed('redis', 'set_session')
     def set_session(self, userid):
         """
         Set HTTP session
         :param userid: user identifier
         :return: cookie
         """
-        return self.sessionCache.set_session(userid)
+        cookie = self.sessionCache.set_session(userid)
+        self.unauthorizedCache.delete(cookie)
+        return cookie
 
+    @timed('redis', 'close_session')
     def close_session(self, cookie):
         """
         Log out
         :param cookie: http cookie
         :return:
         """
-        self.sessionCache.close_session(cookie)
+        try:
+            self.sessionCache.close_session(cookie)
+        finally:
+            self.invalidate_cookies([cookie])
+
+    @timed('redis', 'close_all_session')
+    def close_all_session(self, userid):
+        """
+        Log out all sessions of user
+        :param userid: user identifier
+        :return:
+        """
+        cookies = self.sessionCache.get_cookie_set_by_userId(userid)
+        try:
+            self.sessionCache.close_all_session(userId=userid)
+        finally:
+            self.invalidate_cookies(cookies)
 
     def get_authorized_user_id(self, cookie):
         """
-        Get authorized user identifier
+        Get authorized user identifier, Redis is asked only if cookie is not cached
         :param cookie: HTTP cookie
         :return: user identifier
+        :raise Unauthorized: session of cookie is not found
         """
+        userId = self.authCache.get(cookie)
+        if userId is not LocalCache.MISSING:
+            return userId
+        if self.unauthorizedCache.get(cookie) is not LocalCache.MISSING:
+            raise sessioncache.Unauthorized
+        generation = self.authGeneration
+        try:
+            userId = self._get_authorized_user_id(cookie)
+        except sessioncache.Unauthorized:
+            self.unauthorizedCache.set(cookie, True)
+            raise
+        if generation == self.authGeneration:
+            self.authCache.set(cookie, userId)
+        return userId
+
+    @timed('redis', 'get_authorized_user_id')
+    def _get_authorized_user_id(self, cookie):
         return self.sessionCache.get_authorized_user_id(cookie)
 
+    def check_rate_limit(self, name, key):
+        """
+        Take a token from rate limit bucket
+        :param name: limit name from RATE_LIMITS
+        :param key: client address or user identifier
+        :raise RateLimited: too many requests
+        """
+        with tracing.span('rate_limit'):
+            self.rateLimiter.check(name, key)
+
+    def invalidate_cookies(self, cookies):
+        """
+        Drop cookies from cache of this process and publish them to other processes
+        :param cookies: iterable of cookies
+        """
+        cookies = [cookie for cookie in cookies if cookie]
+        if not cookies:
+            return
+        self._drop_cookies(cookies)
+        self.sessionCache.server.publish(self.INVALIDATION_CHANNEL, ' '.join(cookies))
+
+    def clear_auth_cache(self):
+        """
+        Drop all cached cookies
+        """
+        self.authGeneration += 1
+        self.authCache.clear()
+        self.unauthorizedCache.clear()
+
+    def listen_invalidations(self):
+        """
+        Drop cookies published by other processes. Invalidations published while the channel is not subscribed
+        are lost, so the whole cache is dropped after subscribing and after losing the subscription. The channel is
+        subscribed again after connection is lost or any other error.
+        """
+        log = self._log.getChild('listen_invalidations')
+        retry = self.INVALIDATION_RETRY
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.sessionCache.server.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                self.clear_auth_cache()
+                retry = self.INVALIDATION_RETRY
+                for message in pubsub.listen():
+                    self._drop_cookies(message['data'].split())
+            except redis.exceptions.RedisError as err:
+                log.warning("Invalidation channel %s is lost: %s", self.INVALIDATION_CHANNEL, err)
+            except Exception:
+                # e.g. malformed message, listener must not die while other processes serve logged out cookies
+                log.exception("Invalidation channel %s listener failed", self.INVALIDATION_CHANNEL)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+            self.clear_auth_cache()
+            time.sleep(retry)
+            retry = min(retry * 2, self.INVALIDATION_MAX_RETRY)
+
+    def _drop_cookies(self, cookies):
+        self.authGeneration += 1
+        for cookie in cookies:
+            self.authCache.delete(cookie)
+            self.unauthorizedCache.delete(cookie)
+
+    @timed('sql', 'store_msg')
     def store_msg(self, msg, userid, login):
         """
         Store message from user
@@ -138,6 +294,7 @@ class DatabaseHandler(object):
         session.close()
         return message
 
+    @timed('redis', 'remove_msg')
     def remove_msg(self, messageid):
         """
         Remove message
@@ -146,13 +303,31 @@ class DatabaseHandler(object):
         """
         self.messageCache.delete_message(messageid)
 
-    def get_message_list(self):
+    @timed('redis', 'get_message_list')
+    def get_message_list(self, before=None, count=HISTORY_PAGE_SIZE):
         """
-        Get message list
-        :return:
+        Get page of message history
+        :param before: message identifier, only older messages are returned; the latest messages if None
+        :param count: page size, limited by MAX_HISTORY_PAGE_SIZE
+        :return: list of [id, message, user login, timestamp] sorted from old to new
         """
-        return self.messageCache.get_message_list()
+        count = max(1, min(int(count), self.MAX_HISTORY_PAGE_SIZE))
+        return self.messageCache.get_messages(before, count)
+
+    def build_message_index(self):
+        """
+        Index messages cached before message history was paginated
+        """
+        log = self._log.getChild('build_message_index')
+        try:
+            count = self.messageCache.build_index()
+        except redis.exceptions.RedisError as err:
+            log.warning("Message index is not built: %s", err)
+            return
+        if count:
+            log.info("%d cached messages are indexed", count)
 
+    @timed('sql', 'get_user_top_list')
     def get_user_top_list(self):
         """
         Get the most active users
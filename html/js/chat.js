@@ -10,6 +10,11 @@
     var $user_info = $('#user-info');
     var $top_users = $("#top-users");
     var $msgTable = $("table.message-list tbody");
+    var $chatBox = $("#chat-box-div");
+    // Older messages are requested by pages, the cursor is identifier of the oldest shown message
+    var historyPageSize = 50;
+    var $historyRow = $('<tr><td><p class="history">Загрузить предыдущие сообщения</p></td><td></td></tr>');
+    var historyLoading = false;
 
     // Bind the chat form
     $chat_form.bind('submit', function() {
@@ -32,9 +37,23 @@
         $.each(msg, function(index,value ) {
             add_msg(value)
         });
+        render_history_row(msg.length);
         scroll_down();
         message_hover();
     });
+    socket.on('history', function(msg) {
+        historyLoading = false;
+        var box = $chatBox[0];
+        var height = box.scrollHeight;
+        $historyRow.detach();
+        $msgTable.prepend($.map(msg, function(value, index) {
+            return get_msg_element(value)[0];
+        }));
+        render_history_row(msg.length);
+        // keep the messages user was reading in place
+        box.scrollTop += box.scrollHeight - height;
+        message_hover();
+    });
     socket.on('top_list', function(msg) {
         topUsers = msg;
         render_top_users();
@@ -59,11 +78,31 @@
         scroll_down();
         message_hover();
     });
+    socket.on('rate_limit', function(retryAfter) {
+        $msgTable.append($('<tr><td>Слишком много сообщений, повторите через ' + retryAfter + ' с</td><td></td></tr>'));
+        scroll_down();
+    });
     socket.on('remove_msg', function(messageid) {
         var $row = $('tr[messageid="' + messageid + '"]');
         $row.html("<td>Сообщение удалено</td><td></td>");
     });
 
+    $historyRow.find('p.history').click(function () {
+        var oldestId = $msgTable.find('tr[messageid]').first().attr('messageid');
+        if (!historyLoading && oldestId) {
+            historyLoading = true;
+            socket.emit('history', oldestId, historyPageSize);
+        }
+    });
+
+    function render_history_row(count) {
+        if (count >= historyPageSize) {
+            $msgTable.prepend($historyRow);
+        } else {
+            $historyRow.detach();
+        }
+    }
+
     function add_msg(msg){
         var $newMsgElement = get_msg_element(msg);
         $msgTable.append($newMsgElement);
@@ -1,11 +1,28 @@
 # -*- coding: utf-8 -*-
 import re
 import time
+from email.utils import formatdate
+
+_dateCache = (0, '')
+
+def get_http_date():
+    """
+    Get value of Date header. It is formatted at most once per second.
+    :return: date in RFC 1123 format
+    """
+    global _dateCache
+    now = int(time.time())
+    second, value = _dateCache
+    if second != now:
+        value = formatdate(now, usegmt=True)
+        _dateCache = (now, value)
+    return value
 
 class BaseMessage(object):
     """
     HTTP base message structure class
     """
+    __slots__ = ('headers', '_body')
     CONTENT_LEN = 'Content-Length'
     CONTENT_LEN_NAME = 'content_length'
     CONTENT_NAME = 'content'
@@ -14,13 +31,13 @@ class BaseMessage(object):
     NO_CONTENT_MATCH = re.compile(r"^.*(\r?\n){2}$", re.DOTALL)
     HEADERS_MATCH = re.compile(r"(?P<key>.*?): (?P<value>.*?)\r?\n")
 
-    def __init__(self, headers={}, body=''):
+    def __init__(self, headers=None, body=''):
         """
         Constructor
-        :param headers: http headers
+        :param headers: http headers, dictionary is owned by message
         :param body: http body
         """
-        self.headers = headers
+        self.headers = headers if headers is not None else {}
         self.content = body
 
     @property
@@ -85,6 +102,7 @@ class Request(BaseMessage):
     """
     HTTP request class
     """
+    __slots__ = ('method', 'version', '_url', 'path', 'query', 'params', 'routeParams', 'started', 'received')
     COOKIE = 'Cookie'
     METHOD = 'method'
     URL = 'url'
@@ -93,20 +111,32 @@ class Request(BaseMessage):
     REQUEST_INFO_MATCH = re.compile(r"^(?P<%s>.*?) (?P<%s>.*?) HTTP/(?P<%s>.*?)\r?\n" % (METHOD, URL, VERSION),
                                    re.DOTALL)
 
-    def __init__(self, headers={}, body='', method='GET', version='1.0', url='/', params={}):
+    def __init__(self, headers=None, body='', method='GET', version='1.0', url='/', params=None):
         """
         Constructor
         :param headers: HTTP headers
         :param body: HTTP content
         :param method: HTTP method
         :param version: HTTP version
-        :param url: HTTP url
+        :param url: HTTP url, it is split to path and query string
         """
         BaseMessage.__init__(self, headers, body)
         self.method = method
         self.version = version
         self.url = url
-        self.params = params
+        self.params = params if params is not None else {}
+        self.routeParams = None
+        self.started = None
+        self.received = None
+
+    @property
+    def url(self):
+        return self._url
+
+    @url.setter
+    def url(self, value):
+        self._url = value
+        self.path, sep, self.query = value.partition('?')
 
     def from_string(self, message):
         info = self.REQUEST_INFO_MATCH.findall(message)
@@ -153,10 +183,159 @@ class Request(BaseMessage):
         """
         return self.params[name]
 
+class HeadersTooLarge(ValueError):
+    """
+    Request line and headers exceed size limit
+    """
+    pass
+
+
+class BodyTooLarge(ValueError):
+    """
+    Request body exceeds size limit
+    """
+    pass
+
+
+class RequestParser(object):
+    """
+    Incremental HTTP request parser.
+    Bytes are fed as they arrive from the socket. The header terminator is searched only in the
+    newly received data, the request line and headers are parsed once and then the body bytes are
+    counted until Content-Length is reached.
+    Parser remembers when the current request started and when its body started, so that the session
+    can apply read deadlines.
+    """
+    HEADERS_END = b'\r\n\r\n'
+    BARE_HEADERS_END = b'\n\n'
+    HEADERS_STATE = 0
+    BODY_STATE = 1
+    MAX_HEADER_SIZE = 8192
+    MAX_BODY_SIZE = 1048576
+
+    def __init__(self, maxheadersize=MAX_HEADER_SIZE, maxbodysize=MAX_BODY_SIZE):
+        """
+        Constructor
+        :param maxheadersize: max bytes of request line and headers
+        :param maxbodysize: max bytes of request body
+        """
+        self.maxHeaderSize = maxheadersize
+        self.maxBodySize = maxbodysize
+        self.buff = bytearray()
+        self.reset()
+
+    def reset(self):
+        """
+        Prepare parser for the next request on the connection
+        """
+        self.state = self.HEADERS_STATE
+        self.scanned = 0
+        self.request = None
+        self.contentLength = 0
+        self.bodyChunks = []
+        self.bodyLen = 0
+        self.started = None
+        self.bodyStarted = None
+
+    def feed(self, data):
+        """
+        Feed received bytes to parser
+        :param data: received bytes
+        :return: list of complete requests
+        :raise HeadersTooLarge: if headers exceed limit
+        :raise BodyTooLarge: if Content-Length exceeds limit
+        :raise ValueError: if request is malformed
+        """
+        self.buff += data
+        requestList = []
+        while self.buff:
+            if self.started is None:
+                self.started = time.time()
+            if self.state == self.HEADERS_STATE:
+                if not self._parse_headers():
+                    break
+            if self.state == self.BODY_STATE:
+                if not self._consume_body():
+                    break
+                self.request.started = self.started
+                self.request.received = time.time()
+                requestList.append(self.request)
+                self.reset()
+        return requestList
+
+    def _find_headers_end(self):
+        """
+        Find end of headers block in not scanned part of buffer
+        :return: (index of the end of block, terminator length) or (-1, 0)
+        """
+        start = max(0, self.scanned - len(self.HEADERS_END) + 1)
+        index = self.buff.find(self.HEADERS_END, start)
+        bareIndex = self.buff.find(self.BARE_HEADERS_END, start, index if index >= 0 else len(self.buff))
+        if bareIndex >= 0:
+            return bareIndex, len(self.BARE_HEADERS_END)
+        if index >= 0:
+            return index, len(self.HEADERS_END)
+        self.scanned = len(self.buff)
+        return -1, 0
+
+    def _parse_headers(self):
+        """
+        Parse request line and headers
+        :return: headers are complete - True, else - False
+        """
+        index, terminatorLen = self._find_headers_end()
+        if index < 0:
+            if len(self.buff) > self.maxHeaderSize:
+                raise HeadersTooLarge("Headers are longer than {} bytes.".format(self.maxHeaderSize))
+            return False
+        if index > self.maxHeaderSize:
+            raise HeadersTooLarge("Headers are longer than {} bytes.".format(self.maxHeaderSize))
+        lines = bytes(self.buff[:index]).split(b'\n')
+        del self.buff[:index + terminatorLen]
+        info = lines[0].rstrip(b'\r').split(b' ')
+        if len(info) != 3 or not info[2].startswith(b'HTTP/'):
+            raise ValueError("Message has not HTTP method info.")
+        headers = {}
+        for line in lines[1:]:
+            key, sep, value = line.rstrip(b'\r').partition(b':')
+            if sep:
+                headers[key.strip().title()] = value.strip()
+        try:
+            self.contentLength = int(headers.get(BaseMessage.CONTENT_LEN, 0))
+        except ValueError:
+            raise ValueError("Content-Length is not a number.")
+        if self.contentLength < 0:
+            raise ValueError("Content-Length is negative.")
+        if self.contentLength > self.maxBodySize:
+            raise BodyTooLarge("Content-Length {} is bigger than {}.".format(self.contentLength, self.maxBodySize))
+        self.request = Request(headers=headers, method=info[0], url=info[1], version=info[2][len(b'HTTP/'):],
+                               params={})
+        self.state = self.BODY_STATE
+        self.bodyStarted = time.time()
+        return True
+
+    def _consume_body(self):
+        """
+        Count body bytes
+        :return: body is complete - True, else - False
+        """
+        need = self.contentLength - self.bodyLen
+        if need:
+            chunk = bytes(self.buff[:need])
+            del self.buff[:need]
+            self.bodyChunks.append(chunk)
+            self.bodyLen += len(chunk)
+        if self.bodyLen < self.contentLength:
+            return False
+        self.request.content = b''.join(self.bodyChunks)
+        self.request.parse_params()
+        return True
+
 class Response(BaseMessage):
     """
     HTTP response class
     """
+    __slots__ = ('_responseCode', '_responseCodeName', 'version')
     SET_COOKIE = 'Set-Cookie'
     COOKIE_PATH = 'Path'
     COOKIE_HTTP_ONLY = 'HttpOnly'
@@ -166,24 +345,9 @@ class Response(BaseMessage):
     VERSION = 'version'
     RESPONSE_INFO_MATH = re.compile(r"^HTTP/(?P<%s>.*?) (?P<%s>.*?) (?P<%s>.*?)\r?\n" % (VERSION, STATUS_CODE,
                                                                                         STATUS_NAME), re.DOTALL)
-
-    def __init__(self, headers={
-        "Date": time.strftime("%a, %d-%b-%Y %T GMT", time.gmtime(time.time())),
-        "Server": "Python asyncio server",
-        "Content-Type": "text/html; charset=utf-8",
-
-    },
-                 body='', responsecode=200, version='1.0'):
-        """
-        Constructor
-        :param headers: HTTP header
-        :param body: HTTP content
-        :param responsecode: HTTP response code
-        :param statusName: HTTP response shortcut
-        :param version: HTTP version
-        """
-        BaseMessage.__init__(self, headers, body)
-        self.responses = {
+    SERVER = "Python asyncio server"
+    CONTENT_TYPE = "text/html; charset=utf-8"
+    RESPONSES = {
         100: ('Continue', 'Request received, please continue'),
         101: ('Switching Protocols',
               'Switching to new protocol; obey Upgrade header'),
@@ -255,7 +419,23 @@ class Response(BaseMessage):
         505: ('HTTP Version Not Supported', 'Cannot fulfill request.'),
         511: ('Network Authentication Required',
               'The client needs to authenticate to gain network access.'),
-        }
+    }
+
+    def __init__(self, headers=None, body='', responsecode=200, version='1.0'):
+        """
+        Constructor
+        :param headers: HTTP headers added to default ones
+        :param body: HTTP content
+        :param responsecode: HTTP response code
+        :param version: HTTP version
+        """
+        BaseMessage.__init__(self, {
+            "Date": get_http_date(),
+            "Server": self.SERVER,
+            "Content-Type": self.CONTENT_TYPE,
+        }, body)
+        if headers:
+            self.headers.update(headers)
         self.responseCode = responsecode
         self.version = version
 
@@ -266,7 +446,7 @@ class Response(BaseMessage):
     @responseCode.setter
     def responseCode(self, value):
         self._responseCode = str(value)
-        self._responseCodeName = self.responses.get(int(value))[0]
+        self._responseCodeName = self.RESPONSES[int(value)][0]
 
     @property
     def responseCodeName(self):
@@ -298,4 +478,35 @@ class Response(BaseMessage):
 
     def __str__(self):
         return "\r\n".join(["HTTP/%s %s %s" % (self.version, self.responseCode, self.responseCodeName),
-                            BaseMessage.__str__(self)])
\ No newline at end of file
+                            BaseMessage.__str__(self)])
+
+class ResponseTemplate(object):
+    """
+    Fixed response serialized once. Only version, Date and connection headers are filled in when it is sent.
+    """
+    __slots__ = ('responseCode', 'status', 'tail')
+    DATE_PREFIX = 'Date: '
+
+    def __init__(self, responsecode, headers=None, body=''):
+        """
+        Constructor
+        :param responsecode: HTTP response code
+        :param headers: HTTP headers added to default ones, except Date
+        :param body: HTTP content
+        """
+        response = Response(headers, body, responsecode)
+        del response.headers['Date']
+        self.responseCode = responsecode
+        self.status = " %s %s\r\n" % (response.responseCode, response.responseCodeName)
+        self.tail = "\r\n\r\n".join(["\r\n".join([": ".join([k, v]) for k, v in response.headers.items()]),
+                                     response.content])
+
+    def render(self, version, headers=''):
+        """
+        Build response bytes
+        :param version: HTTP version
+        :param headers: extra header lines, every line ends with CRLF
+        :return: response in str type
+        """
+        return ''.join(['HTTP/', version, self.status, self.DATE_PREFIX, get_http_date(), '\r\n', headers,
+                        self.tail])
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import errno
+import signal
+import logging
+
+class Master(object):
+    """
+    Pre-fork process manager. It forks worker processes, respawns crashed ones and stops them all on SIGTERM/SIGINT.
+    """
+    STOP_TIMEOUT = 10
+    RESPAWN_DELAY = 1.0
+
+    def __init__(self, workers, target, args=(), kwargs=None, stoptimeout=STOP_TIMEOUT):
+        """
+        Constructor
+        :param workers: number of worker processes
+        :param target: worker function, it is called in child process
+        :param args: worker function arguments
+        :param kwargs: worker function keyword arguments
+        :param stoptimeout: seconds to wait for workers after SIGTERM before killing them
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        self.workerCount = workers
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.stopTimeout = stoptimeout
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self, number):
+        """
+        Fork worker process
+        :param number: worker number
+        """
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (number, time.time())
+            self._log.info("Worker %d started, pid: %d", number, pid)
+            return
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        code = 0
+        try:
+            self.target(*self.args, **self.kwargs)
+        except Exception:
+            self._log.exception("Worker %d failed", number)
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        """
+        Start workers and watch them until SIGTERM or SIGINT
+        """
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        for number in range(self.workerCount):
+            self.spawn(number)
+        while not self.stopping and self.workers:
+            try:
+                pid, status = os.wait()
+            except OSError as err:
+                if err.errno == errno.EINTR:
+                    continue
+                raise
+            number, started = self.workers.pop(pid, (None, 0))
+            if number is None or self.stopping:
+                continue
+            self._log.warning("Worker %d (pid: %d) exited with status %d, respawning", number, pid, status)
+            if time.time() - started < self.RESPAWN_DELAY:
+                time.sleep(self.RESPAWN_DELAY)
+            self.spawn(number)
+        self.stop()
+
+    def stop(self):
+        """
+        Send SIGTERM to workers, wait for them and kill the rest after stop timeout
+        """
+        self._log.info("Stopping %d workers", len(self.workers))
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.time() + self.stopTimeout
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.workers:
+            self._log.warning("Killing %d workers", len(self.workers))
+            self.signal_workers(signal.SIGKILL)
+            while self.workers:
+                self.reap()
+                time.sleep(0.1)
+
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except OSError as err:
+                if err.errno == errno.ESRCH:
+                    self.workers.pop(pid, None)
+
+    def reap(self):
+        """
+        Collect exited workers without blocking
+        """
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as err:
+                if err.errno == errno.ECHILD:
+                    self.workers.clear()
+                    return
+                raise
+            if not pid:
+                return
+            self.workers.pop(pid, None)
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+import asyncore
+import select
+import heapq
+import time
+import math
+import os
+import errno
+import fcntl
+import threading
+import logging
+from collections import deque
+
+class Timer(object):
+    """
+    Scheduled call of reactor
+    """
+
+    def __init__(self, deadline, callback, args):
+        """
+        Constructor
+        :param deadline: timestamp to run callback at
+        :param callback: callable
+        :param args: callback arguments
+        """
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+
+class WheelTimer(object):
+    """
+    Scheduled call of timer wheel
+    """
+    __slots__ = ('wheel', 'tick', 'callback', 'args', 'slot')
+
+    def __init__(self, wheel, tick, callback, args):
+        """
+        Constructor
+        :param wheel: TimerWheel
+        :param tick: number of tick to run callback at
+        :param callback: callable
+        :param args: callback arguments
+        """
+        self.wheel = wheel
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.count -= 1
+
+
+class TimerWheel(object):
+    """
+    Hashed timing wheel for coarse connection timeouts. Scheduling and cancelling cost O(1) and a tick only
+    visits its own slot, so thousands of idle connections do not cost anything until their timeouts expire.
+    Timers fire at the first tick boundary after their deadline.
+    """
+    TICK = 0.25
+    SLOTS = 512
+
+    def __init__(self, tick=TICK, slots=SLOTS):
+        """
+        Constructor
+        :param tick: seconds per slot
+        :param slots: number of slots, timers further than tick * slots wait for several turns of wheel
+        """
+        self.tick = tick
+        self.slots = [set() for x in range(slots)]
+        self.current = int(time.time() / tick)
+        self.count = 0
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedule call
+        :param delay: seconds to wait
+        :param callback: callable
+        :param args: callback arguments
+        :return: WheelTimer
+        """
+        tick = max(int(math.ceil((time.time() + delay) / self.tick)), self.current + 1)
+        timer = WheelTimer(self, tick, callback, args)
+        timer.slot = self.slots[tick % len(self.slots)]
+        timer.slot.add(timer)
+        self.count += 1
+        return timer
+
+    def get_deadline(self):
+        """
+        Get time of next tick which has to be processed
+        :return: timestamp or None if wheel is empty
+        """
+        if not self.count:
+            return None
+        return (self.current + 1) * self.tick
+
+    def advance(self, now):
+        """
+        Run timers of all ticks passed since the last call
+        :param now: current timestamp
+        :return: list of (callback, args) of expired timers
+        """
+        target = int(now / self.tick)
+        expired = []
+        if target <= self.current:
+            return expired
+        for tick in range(self.current + 1, self.current + 1 + min(target - self.current, len(self.slots))):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            for timer in [timer for timer in slot if timer.tick <= target]:
+                slot.discard(timer)
+                timer.slot = None
+                self.count -= 1
+                expired.append((timer.callback, timer.args))
+        self.current = target
+        return expired
+
+
+class SocketMap(dict):
+    """
+    asyncore socket map which registers added dispatchers in reactor
+    """
+
+    def __init__(self, reactor):
+        dict.__init__(self)
+        self.reactor = reactor
+
+    def __setitem__(self, fd, dispatcher):
+        dict.__setitem__(self, fd, dispatcher)
+        self.reactor.register(fd, dispatcher)
+
+    def __delitem__(self, fd):
+        dict.__delitem__(self, fd)
+        self.reactor.unregister(fd)
+
+
+class Waker(asyncore.file_dispatcher):
+    """
+    Pipe which wakes reactor up from other threads
+    """
+    READ_SIZE = 4096
+
+    def __init__(self, map):
+        self.readDrained = True
+        readFd, self.writeFd = os.pipe()
+        fcntl.fcntl(self.writeFd, fcntl.F_SETFL, fcntl.fcntl(self.writeFd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, readFd, map)
+        os.close(readFd)
+
+    def wake(self):
+        try:
+            os.write(self.writeFd, b'x')
+        except OSError:
+            pass
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            while len(self.recv(self.READ_SIZE)) == self.READ_SIZE:
+                pass
+        except OSError:
+            pass
+        self.readDrained = True
+
+
+class Reactor(object):
+    """
+    Event loop for asyncore dispatchers.
+    Sockets are registered once in edge-triggered epoll. A dispatcher stays in the read ready set until it reports
+    that its socket is drained by setting readDrained, and it is told about writability by writeReady attribute,
+    so an iteration costs O(ready sockets). Where epoll is not available, asyncore.poll2 is used,
+    which is level-triggered and is not limited by FD_SETSIZE.
+    """
+    READ_EVENTS = select.POLLIN | select.POLLPRI
+    CLOSE_EVENTS = select.POLLHUP | select.POLLERR | select.POLLNVAL
+
+    def __init__(self, useepoll=True):
+        """
+        Constructor
+        :param useepoll: use epoll if it is available, else poll
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        self.map = SocketMap(self)
+        self.epoll = select.epoll() if useepoll and hasattr(select, 'epoll') else None
+        self.readReady = set()
+        self.timers = []
+        self.wheel = TimerWheel()
+        self.callbacks = deque()
+        self.callbacksLock = threading.Lock()
+        self.waker = Waker(self.map)
+        self.running = False
+
+    def register(self, fd, dispatcher):
+        """
+        Start watching socket
+        :param fd: file descriptor
+        :param dispatcher: asyncore dispatcher
+        """
+        if self.epoll is not None:
+            dispatcher.writeReady = False
+            self.epoll.register(fd, select.EPOLLIN | select.EPOLLOUT | select.EPOLLPRI | select.EPOLLET)
+
+    def unregister(self, fd):
+        """
+        Stop watching socket
+        :param fd: file descriptor
+        """
+        self.readReady.discard(fd)
+        if self.epoll is not None:
+            try:
+                self.epoll.unregister(fd)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedule call
+        :param delay: seconds to wait
+        :param callback: callable
+        :param args: callback arguments
+        :return: Timer
+        """
+        timer = Timer(time.time() + delay, callback, args)
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def call_later_coarse(self, delay, callback, *args):
+        """
+        Schedule call on timer wheel. It is cheaper than call_later and fires up to one wheel tick late,
+        which suits timeouts.
+        :param delay: seconds to wait
+        :param callback: callable
+        :param args: callback arguments
+        :return: WheelTimer
+        """
+        return self.wheel.schedule(delay, callback, *args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Schedule call from any thread. Callback is run by reactor thread on its next iteration.
+        :param callback: callable
+        :param args: callback arguments
+        """
+        with self.callbacksLock:
+            wake = not self.callbacks
+            self.callbacks.append((callback, args))
+        if wake:
+            self.waker.wake()
+
+    def run_callbacks(self):
+        """
+        Run callbacks scheduled from other threads
+        """
+        with self.callbacksLock:
+            callbacks, self.callbacks = self.callbacks, deque()
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception:
+                self._log.exception("Callback %r failed", callback)
+
+    def run_timers(self):
+        """
+        Run expired timers
+        """
+        now = time.time()
+        while self.timers and self.timers[0].deadline <= now:
+            timer = heapq.heappop(self.timers)
+            if not timer.cancelled:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    self._log.exception("Timer callback %r failed", timer.callback)
+        for callback, args in self.wheel.advance(now):
+            try:
+                callback(*args)
+            except Exception:
+                self._log.exception("Timer callback %r failed", callback)
+
+    def get_timeout(self, timeout):
+        """
+        Get time to wait for events
+        :param timeout: max timeout
+        :return: seconds
+        """
+        if self.callbacks:
+            return 0
+        for fd in self.readReady:
+            dispatcher = self.map.get(fd)
+            if dispatcher is not None and dispatcher.readable():
+                return 0
+        while self.timers and self.timers[0].cancelled:
+            heapq.heappop(self.timers)
+        now = time.time()
+        if self.timers:
+            timeout = min(timeout, max(0, self.timers[0].deadline - now))
+        deadline = self.wheel.get_deadline()
+        if deadline is not None:
+            timeout = min(timeout, max(0, deadline - now))
+        return timeout
+
+    def poll(self, timeout):
+        """
+        Wait for socket events and dispatch them
+        :param timeout: seconds
+        """
+        if self.epoll is None:
+            asyncore.poll2(timeout, self.map)
+            return
+        try:
+            events = self.epoll.poll(timeout)
+        except (IOError, OSError) as err:
+            if err.errno == errno.EINTR:
+                return
+            raise
+        for fd, flags in events:
+            dispatcher = self.map.get(fd)
+            if dispatcher is None:
+                continue
+            if flags & self.CLOSE_EVENTS:
+                asyncore.readwrite(dispatcher, flags)
+                continue
+            if flags & self.READ_EVENTS:
+                self.readReady.add(fd)
+            if flags & select.POLLOUT:
+                dispatcher.writeReady = True
+                if dispatcher.writable():
+                    asyncore.write(dispatcher)
+        for fd in list(self.readReady):
+            dispatcher = self.map.get(fd)
+            if dispatcher is None:
+                self.readReady.discard(fd)
+            elif dispatcher.readable():
+                asyncore.read(dispatcher)
+                if getattr(dispatcher, 'readDrained', True):
+                    self.readReady.discard(fd)
+
+    def run_once(self, timeout=1.0):
+        """
+        Run one loop iteration
+        :param timeout: max seconds to wait for events
+        """
+        self.poll(self.get_timeout(timeout))
+        self.run_callbacks()
+        self.run_timers()
+
+    def run(self, timeout=1.0):
+        """
+        Run loop until stop() is called
+        :param timeout: max seconds to wait for events
+        """
+        self.running = True
+        while self.running:
+            self.run_once(timeout)
+
+    def stop(self):
+        self.running = False
+
+_reactor = None
+
+def get_reactor():
+    """
+    Get default reactor
+    :return: Reactor
+    """
+    global _reactor
+    if _reactor is None:
+        _reactor = Reactor()
+    return _reactor
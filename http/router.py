@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import re
+
+class RouteNotFound(LookupError):
+    """
+    No route matches request path
+    """
+    pass
+
+
+class MethodNotAllowed(RouteNotFound):
+    """
+    Route matches request path, but not request method
+    """
+
+    def __init__(self, allowed):
+        """
+        Constructor
+        :param allowed: sorted list of methods allowed for the path
+        """
+        RouteNotFound.__init__(self, "Method is not allowed, allowed: {}".format(', '.join(allowed)))
+        self.allowed = allowed
+
+
+class MethodNotImplemented(RouteNotFound):
+    """
+    Router has no route for request method at all
+    """
+    pass
+
+
+class Route(object):
+    """
+    Request handler bound to path
+    """
+    EXACT = 'exact'
+    PREFIX = 'prefix'
+    PATTERN = 'pattern'
+    FALLBACK = 'fallback'
+
+    def __init__(self, kind, path, handler, blocking=False, name=None):
+        """
+        Constructor
+        :param kind: EXACT, PREFIX, PATTERN or FALLBACK
+        :param path: path, path prefix or regexp
+        :param handler: function which takes session and request, it is stored unbound
+        :param blocking: handler blocks and has to run in worker pool
+        :param name: route name for metrics and logs, defaults to path
+        """
+        self.kind = kind
+        self.path = path
+        self.handler = handler
+        self.blocking = blocking
+        self.name = name or path
+
+
+class Router(object):
+    """
+    Route table compiled once for all connections.
+    Exact paths are found by one dict lookup, then patterns are checked in the order they were added and
+    prefixes are checked from the longest one. Every path keeps a table of routes by method, so a request whose
+    path matches a route of other method is told which methods are allowed. Fallback routes, e.g. static files,
+    get requests which match no path; a request whose method has no fallback route is not found.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = []
+        self.patterns = []
+        self.fallbacks = {}
+        self.methods = set()
+
+    def add(self, method, path, handler, blocking=False, name=None):
+        """
+        Add exact path route
+        :param method: HTTP method
+        :param path: url path
+        :param handler: function which takes session and request
+        :param blocking: handler has to run in worker pool
+        :param name: route name for metrics and logs, defaults to path
+        :return: Route
+        """
+        route = Route(Route.EXACT, path, handler, blocking, name)
+        self._add_method(self.exact.setdefault(path, {}), method, route)
+        return route
+
+    def add_prefix(self, method, prefix, handler, blocking=False, name=None):
+        """
+        Add route for all paths starting with prefix
+        :param method: HTTP method
+        :param prefix: url path prefix
+        :param handler: function which takes session and request
+        :param blocking: handler has to run in worker pool
+        :param name: route name for metrics and logs, defaults to path
+        :return: Route
+        """
+        route = Route(Route.PREFIX, prefix, handler, blocking, name)
+        for item, methods in self.prefixes:
+            if item == prefix:
+                break
+        else:
+            methods = {}
+            self.prefixes.append((prefix, methods))
+            self.prefixes.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self._add_method(methods, method, route)
+        return route
+
+    def add_pattern(self, method, pattern, handler, blocking=False, name=None):
+        """
+        Add route for paths matching regexp, named groups are passed to handler in request.routeParams
+        :param method: HTTP method
+        :param pattern: regexp matching whole path
+        :param handler: function which takes session and request
+        :param blocking: handler has to run in worker pool
+        :param name: route name for metrics and logs, defaults to path
+        :return: Route
+        """
+        route = Route(Route.PATTERN, pattern, handler, blocking, name)
+        for regexp, methods in self.patterns:
+            if regexp.pattern == pattern + '$':
+                break
+        else:
+            regexp = re.compile(pattern + '$')
+            methods = {}
+            self.patterns.append((regexp, methods))
+        self._add_method(methods, method, route)
+        return route
+
+    def add_fallback(self, method, handler, blocking=False, name=None):
+        """
+        Add route for paths which match no other route
+        :param method: HTTP method
+        :param handler: function which takes session and request
+        :param blocking: handler has to run in worker pool
+        :param name: route name for metrics and logs, defaults to path
+        :return: Route
+        """
+        route = Route(Route.FALLBACK, '/', handler, blocking, name)
+        self._add_method(self.fallbacks, method, route)
+        return route
+
+    def _add_method(self, methods, method, route):
+        method = method.upper()
+        methods[method] = route
+        self.methods.add(method)
+
+    def match(self, method, path):
+        """
+        Find route of request
+        :param method: HTTP method
+        :param path: url path without query string
+        :return: (Route, dictionary of pattern groups or None)
+        :raise MethodNotImplemented: no route has method
+        :raise MethodNotAllowed: path is routed for other methods
+        :raise RouteNotFound: path is not routed
+        """
+        method = method.upper()
+        if method not in self.methods:
+            raise MethodNotImplemented("Method {} is not implemented".format(method))
+        methods = self.exact.get(path)
+        if methods is not None:
+            return self._select(methods, method), None
+        for regexp, methods in self.patterns:
+            found = regexp.match(path)
+            if found is not None:
+                return self._select(methods, method), found.groupdict()
+        for prefix, methods in self.prefixes:
+            if path.startswith(prefix):
+                return self._select(methods, method), None
+        route = self.fallbacks.get(method)
+        if route is None:
+            raise RouteNotFound("Path {} is not found".format(path))
+        return route, None
+
+    def _select(self, methods, method):
+        route = methods.get(method)
+        if route is None:
+            raise MethodNotAllowed(sorted(methods))
+        return route
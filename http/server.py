@@ -1,33 +1,492 @@
 import asyncore
 import socket
+import errno
+import time
+import os
+import stat
+from collections import deque
 from http.message import Response
-from http.message import Request
-import gevent
+from http.message import ResponseTemplate
+from http.message import RequestParser
+from http.message import HeadersTooLarge
+from http.message import BodyTooLarge
+from http.reactor import get_reactor
+from utils import metrics
+from utils.tracing import Trace
 import logging
 
+# Linux value, Python 2 socket module does not export it
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+BACKLOG = socket.SOMAXCONN
+UNIX_SOCKET_MODE = 0o660
+
+REQUESTS = metrics.Counter('http_requests_total', "HTTP requests by route and response code", ('route', 'code'))
+REQUEST_DURATION = metrics.Histogram('http_request_duration_seconds',
+                                     "Time from taking request off the queue to queueing its response", ('route',))
+READ_BYTES = metrics.Counter('http_read_bytes_total', "Bytes received from clients")
+WRITTEN_BYTES = metrics.Counter('http_written_bytes_total', "Bytes sent to clients")
+ACCEPTED = metrics.Counter('http_connections_accepted_total', "Accepted connections")
+REJECTED = metrics.Counter('http_connections_rejected_total', "Connections rejected by connection limits")
+OPEN_CONNECTIONS = metrics.Gauge('http_connections_open', "Open connections", func=lambda: len(Session.sessions))
+PAUSED_CONNECTIONS = metrics.Gauge('http_connections_paused', "Connections paused by write backpressure",
+                                   func=lambda: Session.pausedSessions)
+PAUSES = metrics.Counter('http_connection_pauses_total', "Pauses of reading requests by write backpressure")
+BUSY_CONNECTIONS = metrics.Gauge('http_connections_busy', "Connections waiting for worker pool",
+                                 func=lambda: sum(1 for session in Session.sessions.values() if session.busy))
+
+def create_listening_socket(host, port, reuseport=False, backlog=BACKLOG):
+    """
+    Create TCP socket listening for connections
+    :param host: listening host
+    :param port: listening port
+    :param reuseport: set SO_REUSEPORT so that several processes can bind the same port
+    :param backlog: listen backlog
+    :return: socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def create_unix_socket(path, mode=UNIX_SOCKET_MODE, backlog=BACKLOG):
+    """
+    Create unix domain socket listening for connections. Socket file left by a server which did not exit cleanly
+    is removed, socket file of a running server is not.
+    :param path: socket file path
+    :param mode: socket file permissions
+    :param backlog: listen backlog
+    :return: socket
+    :raise socket.error: path is used by running server or is not a socket
+    """
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise socket.error(errno.EADDRINUSE, "{} exists and is not a socket".format(path))
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.settimeout(1.0)
+        try:
+            probe.connect(path)
+        except socket.error as err:
+            if err.args[0] == errno.ECONNREFUSED:
+                os.unlink(path)
+            elif err.args[0] != errno.ENOENT:
+                raise
+        else:
+            raise socket.error(errno.EADDRINUSE, "{} is used by running server".format(path))
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # socket file is created by bind, umask keeps it from being accessible before chmod
+    umask = os.umask(0o777 & ~mode)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    os.chmod(path, mode)
+    sock.listen(backlog)
+    return sock
+
+class FileRange(object):
+    """
+    Part of file in write queue. It is copied to socket by the kernel with sendfile() where available,
+    else it is read chunk by chunk to a buffer reused by session, so file content is never loaded to a Python string.
+    """
+
+    def __init__(self, file, offset, count):
+        """
+        Constructor
+        :param file: file object opened for reading
+        :param offset: first byte to send
+        :param count: number of bytes to send
+        """
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def advance(self, sent):
+        """
+        Move range start forward
+        :param sent: number of bytes sent
+        """
+        self.offset += sent
+        self.count -= sent
+
+    def read(self, buffer):
+        """
+        Read next chunk of range
+        :param buffer: writable memoryview, its size limits the chunk
+        :return: number of bytes read, it is less than requested only if file was truncated
+        """
+        self.file.seek(self.offset)
+        return self.file.readinto(buffer[:min(len(buffer), self.count)])
+
+    def close(self):
+        self.file.close()
+
 class Session(asyncore.dispatcher):
     """
     HTTP session class
     """
     sessions = {}
+    pausedSessions = 0
+    pauseCount = 0
+    MAX_IOVEC = 64
+    FILE_CHUNK_SIZE = 65536
+    KEEP_ALIVE_TIMEOUT = 15
+    MAX_REQUESTS = 100
+    MAX_PIPELINED = 32
+    HEADER_TIMEOUT = 10
+    BODY_TIMEOUT = 30
+    SEND_TIMEOUT = 30
+    HIGH_WATER = 262144
+    LOW_WATER = 65536
+    CONNECTION = 'Connection'
+    KEEP_ALIVE = 'Keep-Alive'
+    KEEP_ALIVE_LOWER = 'keep-alive'
+    CLOSE_LOWER = 'close'
+    VERSION_1_0 = '1.0'
+    VERSION_1_1 = '1.1'
+    KEEP_ALIVE_HEADERS = 'Connection: keep-alive\r\nKeep-Alive: timeout=%d, max=%d\r\n'
+    CLOSE_HEADERS = 'Connection: close\r\n'
+    NO_ROUTE = 'none'
+    BAD_REQUEST = ResponseTemplate(400)
+    REQUEST_TIMEOUT = ResponseTemplate(408)
+    BODY_TOO_LARGE = ResponseTemplate(413)
+    HEADERS_TOO_LARGE = ResponseTemplate(431)
+    # reverse proxies on the same host, they pass client address in REAL_IP or FORWARDED_FOR header
+    TRUSTED_PROXIES = ('127.0.0.1', '::1')
+    REAL_IP = 'X-Real-Ip'
+    FORWARDED_FOR = 'X-Forwarded-For'
+    LOCAL_CLIENT = 'local'
 
-    def __init__(self, sock=None, map=None, addr=None, *args, **kwargs):
+    def __init__(self, sock=None, map=None, addr=None, keepalivetimeout=KEEP_ALIVE_TIMEOUT,
+                 maxrequests=MAX_REQUESTS, workerpool=None, maxheadersize=RequestParser.MAX_HEADER_SIZE,
+                 maxbodysize=RequestParser.MAX_BODY_SIZE, headertimeout=HEADER_TIMEOUT, bodytimeout=BODY_TIMEOUT,
+                 sendtimeout=SEND_TIMEOUT, highwater=HIGH_WATER, lowwater=LOW_WATER, slowlog=None,
+                 trustedproxies=TRUSTED_PROXIES, *args, **kwargs):
+        """
+        Constructor
+        :param sock: client socket
+        :param map: reactor socket map
+        :param addr: client address
+        :param keepalivetimeout: seconds an idle persistent connection is kept open
+        :param maxrequests: max requests served by one connection
+        :param workerpool: WorkerPool for blocking handlers, they are run in reactor thread if it is None
+        :param maxheadersize: max bytes of request line and headers, bigger requests get 431
+        :param maxbodysize: max bytes of request body, bigger requests get 413
+        :param headertimeout: seconds from the first byte of request to the end of its headers
+        :param bodytimeout: seconds from the end of headers to the end of body
+        :param sendtimeout: seconds queued output may wait for client to read any of it, e.g. while reading of
+        requests is paused by backpressure
+        :param highwater: queued output bytes at which reading of requests is paused
+        :param lowwater: queued output bytes below which reading is resumed
+        :param slowlog: SlowRequestLog, requests are traced only if it is set
+        :param trustedproxies: addresses of reverse proxies whose client address headers are trusted,
+        clients of unix socket are always trusted
+        """
         self._log = logging.getLogger(self.__class__.__name__)
         self.in_buffer_size = 4048
         self.out_buffer_size = 4048
-        self.rbuff = b''
-        self.wbuff = b''
+        self.parser = RequestParser(maxheadersize, maxbodysize)
+        self.headerTimeout = headertimeout
+        self.bodyTimeout = bodytimeout
+        self.sendTimeout = sendtimeout
+        self.requests = deque()
+        self.request = None
+        self.requestCount = 0
+        self.route = self.NO_ROUTE
+        self.responseCode = None
+        self.requestStart = 0.0
+        self.slowLog = slowlog
+        self.trace = None
+        self.traces = deque()
+        self.sentTotal = 0
+        self.keepAliveTimeout = keepalivetimeout
+        self.maxRequests = maxrequests
+        self.keepAlive = False
+        self.closing = False
+        self.badRequest = False
+        self.workerPool = workerpool
+        self.busy = False
+        self.deferred = None
+        self.lastActivity = time.time()
+        self.acceptTime = self.lastActivity
+        # the last moment output was sent or queued to empty write queue
+        self.lastSend = self.lastActivity
+        self.wqueue = deque()
+        self.wsize = 0
+        self.highWater = highwater
+        self.lowWater = lowwater
+        self.paused = False
+        self.readDrained = True
+        self.writeReady = False
+        self.trustedProxies = trustedproxies
+        self.fileBuffer = None
         self.addr = addr
+        if map is None:
+            map = get_reactor().map
+        self.reactor = map.reactor
         asyncore.dispatcher.__init__(self, sock, map)
+        if sock is not None and sock.family == socket.AF_INET:
+            # headers and body are separate sends, Nagle would hold the body until the delayed ACK
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.onClose = None
         self.sessions[id(self)] = self
+        self.timeoutDeadline = self.lastActivity + self.keepAliveTimeout
+        self.timeoutTimer = self.reactor.call_later_coarse(self.keepAliveTimeout, self.check_timeout)
+
+    def recv(self, buffer_size):
+        """
+        Receive data. Edge-triggered reactor reads again after a full read, socket which held exactly a multiple
+        of buffer size is drained then and raises EWOULDBLOCK.
+        :param buffer_size: max bytes to receive
+        :return: bytes, empty if connection is closed or socket is drained
+        """
+        try:
+            return asyncore.dispatcher.recv(self, buffer_size)
+        except socket.error as why:
+            if why.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return ''
+            raise
 
     def handle_read(self):
-        self.rbuff += self.recv(self.in_buffer_size)
-        msg = self.get_block()
-        if msg:
-            request = Request()
-            request.from_string(msg)
-            gevent.spawn(self.render, request).join()
+        data = self.recv(self.in_buffer_size)
+        self.readDrained = len(data) < self.in_buffer_size
+        if not data:
+            return
+        READ_BYTES.inc(len(data))
+        if self.closing or self.badRequest:
+            return
+        self.lastActivity = time.time()
+        try:
+            self.requests.extend(self.parser.feed(data))
+        except ValueError as err:
+            self._log.warning("Client: %s, bad request: %s", self.addr, err)
+            self.badRequest = True
+            self.requests.append(err)
+        self.process_requests()
+        self.flush()
+        if self.connected and self.parser.started is not None:
+            self.update_timeout()
+
+    def process_requests(self):
+        """
+        Render pipelined requests in order of arrival. Next request waits while previous one is deferred
+        or while the session is paused by write backpressure.
+        """
+        while self.requests and not self.closing and not self.busy and not self.paused:
+            self.request = self.requests.popleft()
+            self.route = self.NO_ROUTE
+            self.responseCode = None
+            self.requestStart = time.time()
+            if isinstance(self.request, ValueError):
+                self.keepAlive = False
+                self.write_template(self.get_parse_error_template(self.request))
+                self.request_done()
+                self.finish()
+                break
+            self.requestCount += 1
+            self.keepAlive = self.is_keep_alive(self.request) and self.requestCount < self.maxRequests
+            if self.slowLog is not None:
+                self.trace = Trace(self.request.method, self.request.url, self.addr,
+                                   self.acceptTime if self.requestCount == 1 else None, self.request.started,
+                                   self.request.received, self.requestStart)
+            self.render(self.request)
+            if not self.busy:
+                self.request_done()
+                if not self.keepAlive:
+                    self.finish()
+
+    def request_done(self):
+        """
+        Record metrics of the current request once its response is queued
+        """
+        now = time.time()
+        REQUESTS.labels(self.route, self.responseCode).inc()
+        REQUEST_DURATION.labels(self.route).observe(now - self.requestStart)
+        trace, self.trace = self.trace, None
+        if trace is not None:
+            trace.route = self.route
+            trace.code = self.responseCode
+            trace.queued = now
+            self.traces.append((self.sentTotal + self.wsize, trace))
+            self.finish_traces(now)
+
+    def finish_traces(self, now):
+        """
+        Complete traces of requests whose responses are entirely handed to the kernel
+        :param now: current timestamp
+        """
+        while self.traces and self.traces[0][0] <= self.sentTotal:
+            offset, trace = self.traces.popleft()
+            trace.flushed = now
+            self.slowLog.record(trace)
+
+    def defer(self, route, func, *args):
+        """
+        Run blocking render function in worker pool. Its output is queued when it finishes.
+        :param route: route name for pool concurrency limit
+        :param func: render function
+        :param args: function arguments
+        """
+        if self.workerPool is None:
+            func(*args)
+            return
+        self.busy = True
+        self.deferred = []
+        self.workerPool.submit(route, func, self.post_deferred_done, *args)
+
+    def post_deferred_done(self):
+        """
+        Worker thread callback, pass result to reactor thread
+        """
+        self.reactor.call_soon_threadsafe(self.deferred_done)
+
+    def deferred_done(self):
+        """
+        Queue output of deferred render function and continue with next requests
+        """
+        deferred, self.deferred = self.deferred, None
+        self.busy = False
+        if not self.connected:
+            for item in deferred:
+                if isinstance(item, FileRange):
+                    item.close()
+            self.request_done()
+            return
+        pending = self.writable()
+        for item in deferred:
+            self.wqueue.append(item)
+            self.wsize += len(item)
+        if not pending and self.writable():
+            self.start_send_timeout()
+        self.request_done()
+        self.update_paused()
+        self.lastActivity = time.time()
+        if not self.keepAlive:
+            self.finish()
+        self.process_requests()
+        self.flush()
+
+    def is_keep_alive(self, request):
+        """
+        Check if client wants persistent connection
+        :param request: http request
+        :return: bool
+        """
+        tokens = [token.strip().lower() for token in request.headers.get(self.CONNECTION, '').split(',')]
+        if request.version == self.VERSION_1_1:
+            return self.CLOSE_LOWER not in tokens
+        return self.KEEP_ALIVE_LOWER in tokens
+
+    def get_client_address(self, request):
+        """
+        Get address of client. When the peer is a trusted proxy, the address is taken from REAL_IP header
+        or from the last FORWARDED_FOR address, the one added by the proxy; addresses before it come from client.
+        :param request: http request
+        :return: IP address, or LOCAL_CLIENT for client of unix socket without proxy headers
+        """
+        peer = self.addr[0] if isinstance(self.addr, tuple) else None
+        if peer is None or peer in self.trustedProxies:
+            address = request.headers.get(self.REAL_IP) or \
+                request.headers.get(self.FORWARDED_FOR, '').rpartition(',')[2]
+            address = address.strip()
+            if address:
+                return address
+        return peer or self.LOCAL_CLIENT
+
+    def finish(self):
+        """
+        Close connection once write queue is flushed
+        """
+        self.closing = True
+        self.requests.clear()
+        if not self.writable():
+            self.handle_close()
+
+    def get_parse_error_template(self, err):
+        """
+        Get response to request parser error
+        :param err: ValueError raised by parser
+        :return: ResponseTemplate
+        """
+        if isinstance(err, HeadersTooLarge):
+            return self.HEADERS_TOO_LARGE
+        if isinstance(err, BodyTooLarge):
+            return self.BODY_TOO_LARGE
+        return self.BAD_REQUEST
+
+    def get_deadline(self):
+        """
+        Get moment when connection times out in its current state. Connection with queued output times out
+        when client reads none of it for sendTimeout, it is closed without response then.
+        :return: (timestamp or None if connection can not time out now, True if client is told about timeout)
+        """
+        if self.writable():
+            return self.lastSend + self.sendTimeout, False
+        if self.closing:
+            return self.lastActivity + self.keepAliveTimeout, False
+        if self.busy:
+            return None, False
+        if self.parser.bodyStarted is not None:
+            return self.parser.bodyStarted + self.bodyTimeout, True
+        if self.parser.started is not None:
+            return self.parser.started + self.headerTimeout, True
+        return self.lastActivity + self.keepAliveTimeout, False
+
+    def update_timeout(self):
+        """
+        Move timeout timer closer if connection state has an earlier deadline
+        """
+        deadline, notify = self.get_deadline()
+        if deadline is not None and deadline < self.timeoutDeadline:
+            self.schedule_timeout(deadline - time.time())
+
+    def start_send_timeout(self):
+        """
+        Start waiting for client to read output queued to empty write queue
+        """
+        self.lastSend = time.time()
+        if self.lastSend + self.sendTimeout < self.timeoutDeadline:
+            self.schedule_timeout(self.sendTimeout)
+
+    def schedule_timeout(self, delay):
+        """
+        Reschedule timeout timer
+        :param delay: seconds
+        """
+        self.timeoutTimer.cancel()
+        self.timeoutDeadline = time.time() + delay
+        self.timeoutTimer = self.reactor.call_later_coarse(delay, self.check_timeout)
+
+    def check_timeout(self):
+        """
+        Timeout timer callback. Close connection whose deadline has passed, else schedule next check
+        at the moment it could expire. Slow requests get 408 before closing.
+        """
+        now = time.time()
+        deadline, notify = self.get_deadline()
+        if deadline is None:
+            self.schedule_timeout(self.keepAliveTimeout)
+        elif now < deadline:
+            self.schedule_timeout(deadline - now)
+        elif notify:
+            self._log.warning("Client: %s, request timeout", self.addr)
+            self.request = None
+            self.keepAlive = False
+            self.badRequest = True
+            self.write_template(self.REQUEST_TIMEOUT)
+            self.finish()
+            self.flush()
+            if self.connected:
+                self.schedule_timeout(self.sendTimeout)
+        else:
+            self.handle_close()
 
     def render(self, request):
         """
@@ -37,59 +496,370 @@ class Session(asyncore.dispatcher):
         response = Response()
         self.write(response)
 
-    def is_block_ready(self):
+    def readable(self):
         """
-        Check reade buffer to completeness
-        :return: read buffer complete - True, else - False
+        Read requests only while they can be rendered: not while a deferred request waits for worker pool,
+        nor while write backpressure pauses the session, nor while MAX_PIPELINED parsed requests wait,
+        so a pipelining client can not make the request queue grow without bound
         """
-        return Request.is_message_ready(self.rbuff)
+        return not self.paused and not self.busy and len(self.requests) < self.MAX_PIPELINED
 
-    def get_block(self):
+    def writable(self):
+        return self.wsize > 0
+
+    def update_paused(self):
         """
-        Get http request
-        :return: http request
+        Pause reading of requests when queued output reaches high-water mark, so that a client which does not
+        read responses can not make the write queue grow without bound. Reading is resumed below low-water mark.
+        Paused session which is not drained is closed by send timeout.
         """
-        block = None
-        if self.is_block_ready():
-            rindex = Request.get_message_len(self.rbuff)
-            block = self.rbuff[:rindex]
-            self.rbuff = self.rbuff[rindex:]
-        return block
+        if self.paused:
+            if self.wsize < self.lowWater:
+                self.paused = False
+                Session.pausedSessions -= 1
+        elif self.wsize >= self.highWater:
+            self.paused = True
+            Session.pausedSessions += 1
+            Session.pauseCount += 1
+            PAUSES.inc()
 
-    def writable(self):
-        return len(self.wbuff) > 0
+    @classmethod
+    def get_backpressure_stats(cls):
+        """
+        Get write backpressure counters
+        :return: (number of sessions paused now, number of pauses since start)
+        """
+        return Session.pausedSessions, Session.pauseCount
 
     def handle_write(self):
-        self.send(self.wbuff[:self.out_buffer_size])
-        self.wbuff = self.wbuff[self.out_buffer_size:]
+        """
+        Send write queue until it is empty or socket buffer is full
+        """
+        while self.wqueue and self.connected:
+            sent, offered = self.send_head()
+            if not self.connected:
+                return
+            self.consume(sent)
+            if sent:
+                self.lastActivity = self.lastSend = time.time()
+            if sent < offered:
+                self.writeReady = False
+                break
+        if self.closing and not self.writable():
+            self.handle_close()
+        elif self.requests and not self.paused and not self.busy:
+            self.process_requests()
+            self.flush()
+
+    def send_head(self):
+        """
+        Send data from the head of write queue
+        :return: (number of bytes sent, number of bytes offered to the kernel)
+        """
+        head = self.wqueue[0]
+        if isinstance(head, FileRange):
+            return self.send_file(head)
+        if len(self.wqueue) > 1 and hasattr(self.socket, 'sendmsg'):
+            buffers = []
+            for item in self.wqueue:
+                if isinstance(item, FileRange) or len(buffers) == self.MAX_IOVEC:
+                    break
+                buffers.append(item)
+            return self.send_buffers(buffers), sum(len(buffer) for buffer in buffers)
+        return self.send(head), len(head)
+
+    def flush(self):
+        """
+        Send queued data right away if socket is known to be writable
+        """
+        if self.writeReady and self.writable():
+            self.handle_write()
+
+    def send_buffers(self, buffers):
+        """
+        Send several buffers with one scatter/gather system call
+        :param buffers: list of memoryview
+        :return: number of bytes sent
+        """
+        try:
+            return self.socket.sendmsg(buffers)
+        except socket.error as why:
+            if why.args[0] == errno.EWOULDBLOCK:
+                return 0
+            elif why.args[0] in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0
+            raise
+
+    def send_file(self, filerange):
+        """
+        Send part of file
+        :param filerange: FileRange
+        :return: (number of bytes sent, number of bytes offered to the kernel)
+        """
+        if not hasattr(os, 'sendfile'):
+            if self.fileBuffer is None:
+                self.fileBuffer = memoryview(bytearray(self.FILE_CHUNK_SIZE))
+            length = filerange.read(self.fileBuffer)
+            if not length:
+                self.abort_file(filerange)
+                return 0, filerange.count
+            return self.send(self.fileBuffer[:length]), length
+        try:
+            sent = os.sendfile(self.socket.fileno(), filerange.file.fileno(), filerange.offset, filerange.count)
+            if not sent:
+                self.abort_file(filerange)
+            return sent, filerange.count
+        except (OSError, socket.error) as why:
+            if why.args[0] == errno.EWOULDBLOCK:
+                return 0, filerange.count
+            elif why.args[0] in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0, filerange.count
+            raise
+
+    def abort_file(self, filerange):
+        """
+        Close connection whose file was truncated while it was sent, the rest of promised content can not be sent
+        :param filerange: FileRange
+        """
+        self._log.warning("Client: %s, file %s was truncated while it was sent", self.addr, filerange.file.name)
+        self.handle_close()
+
+    def consume(self, sent):
+        """
+        Drop sent bytes from the head of write queue
+        :param sent: number of bytes sent
+        """
+        self.wsize -= sent
+        self.sentTotal += sent
+        WRITTEN_BYTES.inc(sent)
+        if self.traces:
+            self.finish_traces(time.time())
+        if self.paused:
+            self.update_paused()
+        while sent:
+            head = self.wqueue[0]
+            if sent < len(head):
+                if isinstance(head, FileRange):
+                    head.advance(sent)
+                else:
+                    self.wqueue[0] = head[sent:]
+                break
+            sent -= len(head)
+            self.wqueue.popleft()
+            if isinstance(head, FileRange):
+                head.close()
 
     def handle_close(self):
         self.close()
-        del self.sessions[id(self)]
+        self.sessions.pop(id(self), None)
+        self.timeoutTimer.cancel()
+        onClose, self.onClose = self.onClose, None
+        if onClose is not None:
+            onClose(self)
+        while self.wqueue:
+            head = self.wqueue.popleft()
+            if isinstance(head, FileRange):
+                head.close()
+        self.wsize = 0
+        self.update_paused()
 
     def write(self, response):
         """
         Write response
         :param response: response
         """
-        self.wbuff += str(response)
+        if self.get_response_version() == self.VERSION_1_1:
+            response.version = self.VERSION_1_1
+        if self.keepAlive:
+            response.headers[self.CONNECTION] = self.KEEP_ALIVE_LOWER
+            response.headers[self.KEEP_ALIVE] = 'timeout=%d, max=%d' % (self.keepAliveTimeout,
+                                                                       self.maxRequests - self.requestCount)
+        else:
+            response.headers[self.CONNECTION] = self.CLOSE_LOWER
+            response.headers.pop(self.KEEP_ALIVE, None)
+        self.responseCode = response.responseCode
+        self.push(str(response))
+
+    def write_template(self, template):
+        """
+        Write precomputed response
+        :param template: ResponseTemplate
+        """
+        if self.keepAlive:
+            headers = self.KEEP_ALIVE_HEADERS % (self.keepAliveTimeout, self.maxRequests - self.requestCount)
+        else:
+            headers = self.CLOSE_HEADERS
+        self.responseCode = template.responseCode
+        self.push(template.render(self.get_response_version(), headers))
+
+    def get_response_version(self):
+        """
+        Get HTTP version of response to current request
+        :return: '1.1' for HTTP/1.1 request, else '1.0'
+        """
+        if getattr(self.request, 'version', None) == self.VERSION_1_1:
+            return self.VERSION_1_1
+        return self.VERSION_1_0
+
+    def push(self, data):
+        """
+        Put data to write queue. Data is never copied, sending advances memoryview offsets.
+        :param data: bytes
+        """
+        if data:
+            self.enqueue(memoryview(data))
+
+    def push_file(self, file, offset, count):
+        """
+        Put part of file to write queue. File is closed when it is sent or session is closed.
+        :param file: file object opened for reading
+        :param offset: first byte to send
+        :param count: number of bytes to send
+        """
+        if count > 0:
+            self.enqueue(FileRange(file, offset, count))
+        else:
+            file.close()
+
+    def enqueue(self, item):
+        """
+        Put item to write queue, or to output of deferred render function if it is running
+        :param item: memoryview or FileRange
+        """
+        if self.deferred is not None:
+            self.deferred.append(item)
+        else:
+            if not self.wsize:
+                self.start_send_timeout()
+            self.wqueue.append(item)
+            self.wsize += len(item)
+            if not self.paused and self.wsize >= self.highWater:
+                self.update_paused()
 
 class Server(asyncore.dispatcher):
+    ACCEPT_BATCH = 64
+    SHUTDOWN_TIMEOUT = 10
+    SERVICE_UNAVAILABLE = ResponseTemplate(503)
 
-    def __init__(self, host, port, handler):
+    def __init__(self, host, port, handler, map=None, sock=None, reuseport=False, backlog=BACKLOG,
+                 acceptbatch=ACCEPT_BATCH, maxconnections=None, maxperip=None,
+                 trustedproxies=Session.TRUSTED_PROXIES, **sessionoptions):
+        """
+        Constructor
+        :param host: listening host
+        :param port: listening port
+        :param handler: session class
+        :param map: reactor socket map
+        :param sock: already listening socket, e.g. shared by pre-forked processes
+        :param reuseport: bind with SO_REUSEPORT
+        :param backlog: listen backlog
+        :param acceptbatch: max connections accepted per readiness event
+        :param maxconnections: max open connections, None - unlimited
+        :param maxperip: max open connections from one client address, None - unlimited. Connections of
+        trusted proxies and unix socket are not limited: a proxy keeps connections of many clients, so the limit
+        per client has to be applied by the proxy.
+        :param trustedproxies: addresses of reverse proxies, passed to sessions
+        :param sessionoptions: keyword arguments passed to every session
+        """
         self._log = logging.getLogger(self.__class__.__name__)
         self.handler = handler
-        asyncore.dispatcher.__init__(self)
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.set_reuse_addr()
-        self.bind((host, port))
-        self.listen(5)
+        self.trustedProxies = trustedproxies
+        self.sessionOptions = sessionoptions
+        self.sessionOptions['trustedproxies'] = trustedproxies
+        self.acceptBatch = acceptbatch
+        self.maxConnections = maxconnections
+        self.maxPerIp = maxperip
+        self.connections = 0
+        self.ipConnections = {}
+        self.rejected = 0
+        self.readDrained = True
+        self.listeners = []
+        if map is None:
+            map = get_reactor().map
+        asyncore.dispatcher.__init__(self, map=map)
+        if sock is None:
+            sock = create_listening_socket(host, port, reuseport, backlog)
+        sock.setblocking(0)
+        self.set_socket(sock)
+        self.accepting = True
+
+    def add_listener(self, sock):
+        """
+        Accept connections from one more listening socket, e.g. unix domain socket next to TCP one
+        :param sock: listening socket
+        :return: Listener
+        """
+        listener = Listener(self, sock)
+        self.listeners.append(listener)
+        return listener
 
     def handle_accept(self):
-        pair = self.accept()
-        if pair is not None:
+        self.accept_connections(self)
+
+    def accept_connections(self, listener):
+        """
+        Accept pending connections of listening socket
+        :param listener: dispatcher of listening socket, the server itself or its Listener
+        """
+        for x in range(self.acceptBatch):
+            pair = listener.accept()
+            if pair is None:
+                listener.readDrained = True
+                return
             sock, addr = pair
-            self.wrap_session(sock, addr)
+            ip = addr[0] if isinstance(addr, tuple) else addr
+            if not self.is_allowed(ip):
+                self.reject(sock, addr)
+                continue
+            session = self.wrap_session(sock, addr)
+            ACCEPTED.inc()
+            self.connections += 1
+            self.ipConnections[ip] = self.ipConnections.get(ip, 0) + 1
+            session.onClose = self.release
+        listener.readDrained = False
+
+    def is_allowed(self, ip):
+        """
+        Check connection limits
+        :param ip: client address
+        :return: connection may be accepted - True, else - False
+        """
+        if self.maxConnections is not None and self.connections >= self.maxConnections:
+            return False
+        # clients of unix socket have no address, it is the local proxy
+        return self.maxPerIp is None or not ip or ip in self.trustedProxies or \
+            self.ipConnections.get(ip, 0) < self.maxPerIp
+
+    def reject(self, sock, addr):
+        """
+        Tell client that server is busy and close connection without waiting
+        :param sock: client socket
+        :param addr: client address
+        """
+        self.rejected += 1
+        REJECTED.inc()
+        self._log.warning("Client: %s, connection rejected, open connections: %d", addr, self.connections)
+        try:
+            sock.setblocking(0)
+            sock.send(self.SERVICE_UNAVAILABLE.render(Session.VERSION_1_1, Session.CLOSE_HEADERS))
+        except socket.error:
+            pass
+        sock.close()
+
+    def release(self, session):
+        """
+        Session close callback, update connection counters
+        :param session: closed session
+        """
+        ip = session.addr[0] if isinstance(session.addr, tuple) else session.addr
+        self.connections -= 1
+        count = self.ipConnections.get(ip, 0) - 1
+        if count > 0:
+            self.ipConnections[ip] = count
+        else:
+            self.ipConnections.pop(ip, None)
 
     def wrap_session(self, sock, addr, *args, **kwargs):
         """
@@ -98,12 +868,64 @@ class Server(asyncore.dispatcher):
         :param addr: client address
         :param args: args
         :param kwargs: kwargs
+        :return: session
         """
-        self.handler(sock, addr=addr)
+        return self.handler(sock, map=self._map, addr=addr, **self.sessionOptions)
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Stop accepting connections and stop reactor once sessions have sent their responses
+        :param timeout: max seconds to wait for sessions
+        """
+        self._log.info("Shutting down")
+        self.close()
+        for listener in self.listeners:
+            listener.close()
+        self.check_shutdown(time.time() + timeout)
+
+    def check_shutdown(self, deadline):
+        """
+        Stop reactor if no session has work or deadline has passed, else check again later
+        :param deadline: timestamp
+        """
+        reactor = self._map.reactor
+        if time.time() >= deadline or not any(session.busy or session.writable()
+                                              for session in Session.sessions.values()):
+            reactor.stop()
+        else:
+            reactor.call_later(0.1, self.check_shutdown, deadline)
+
+class Listener(asyncore.dispatcher):
+    """
+    Additional listening socket of server, accepted connections are handled by the server
+    """
+
+    def __init__(self, server, sock):
+        """
+        Constructor
+        :param server: Server
+        :param sock: listening socket
+        """
+        asyncore.dispatcher.__init__(self, map=server._map)
+        self.server = server
+        self.readDrained = True
+        sock.setblocking(0)
+        self.set_socket(sock)
+        self.accepting = True
+
+    def handle_accept(self):
+        self.server.accept_connections(self)
+
+def loop(timeout=1.0):
+    """
+    Run default reactor
+    :param timeout: max seconds to wait for events
+    """
+    get_reactor().run(timeout)
 
 if __name__ == '__main__':
     logging.basicConfig(format=u'%(filename)s[LINE:%(lineno)d]# %(levelname)-8s [%(asctime)s] %(name)s > %(message)s',
                        level=logging.DEBUG,
     )
     server = Server('localhost', 9090, Session)
-    asyncore.loop()
\ No newline at end of file
+    loop()
\ No newline at end of file
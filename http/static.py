@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import gzip
+import hashlib
+import posixpath
+import mimetypes
+import urllib
+import logging
+from cStringIO import StringIO
+from email.utils import formatdate
+from email.utils import parsedate_tz
+from email.utils import mktime_tz
+from utils import metrics
+
+CACHE_REQUESTS = metrics.Counter('static_cache_requests_total', "Static file lookups by result", ('result',))
+CACHE_HITS = CACHE_REQUESTS.labels('hit')
+CACHE_MISSES = CACHE_REQUESTS.labels('miss')
+CACHE_RELOADS = CACHE_REQUESTS.labels('reload')
+CACHE_FILES = metrics.Gauge('static_cache_files', "Files kept in static cache")
+
+class RangeNotSatisfiable(ValueError):
+    """
+    Requested range is out of file
+    """
+    pass
+
+
+class StaticFile(object):
+    """
+    Static file with precomputed HTTP headers. Content of small files and their gzip variant are kept in memory,
+    large files are sent from disk as they are, without gzip variant.
+    """
+    DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+    CHARSET = 'charset=utf-8'
+    GZIP = 'gzip'
+    COMPRESS_LEVEL = 9
+    COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/x-javascript', 'application/json',
+                          'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+    READ_CHUNK_SIZE = 65536
+    BYTES_UNIT = 'bytes='
+
+    def __init__(self, path, stat, large=False):
+        """
+        Constructor
+        :param path: path to file
+        :param stat: os.stat result of file
+        :param large: do not keep file content or its gzip variant in memory
+        """
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.large = large
+        self.content = None
+        mimeType = self.guess_content_type(path)
+        self.contentType = '; '.join([mimeType, self.CHARSET])
+        self.lastModified = formatdate(int(self.mtime), usegmt=True)
+        self.checked = time.time()
+        self.compressible = not large and mimeType.startswith(self.COMPRESSIBLE_TYPES)
+        self.gzipContent = None
+        self.gzipEtag = None
+        self.compressTime = 0.0
+        self.load()
+
+    def load(self):
+        """
+        Read file once: compute ETag, build gzip variant and keep content of small file
+        """
+        digest = hashlib.md5()
+        chunks = []
+        buff = StringIO()
+        gzipFile = None
+        if self.compressible:
+            gzipFile = gzip.GzipFile(filename='', mode='wb', fileobj=buff, compresslevel=self.COMPRESS_LEVEL,
+                                     mtime=int(self.mtime))
+        with self.open() as file:
+            for chunk in iter(lambda: file.read(self.READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                if gzipFile is not None:
+                    start = time.time()
+                    gzipFile.write(chunk)
+                    self.compressTime += time.time() - start
+                if not self.large:
+                    chunks.append(chunk)
+        self.etag = '"%s"' % digest.hexdigest()
+        if not self.large:
+            self.content = b''.join(chunks)
+        if gzipFile is not None:
+            gzipFile.close()
+            if buff.tell() < self.size:
+                self.gzipContent = buff.getvalue()
+                self.gzipEtag = ''.join([self.etag[:-1], '-', self.GZIP, '"'])
+
+    def open(self):
+        """
+        Open file for reading
+        :return: file object
+        """
+        return open(self.path, 'rb')
+
+    def get_range(self, request):
+        """
+        Get byte range requested by client. Only single range is supported, other forms are ignored.
+        :param request: http request
+        :return: (first byte, last byte) or None if whole file should be sent
+        :raise RangeNotSatisfiable: range is out of file
+        """
+        value = request.headers.get('Range', '').replace(' ', '')
+        if not value.startswith(self.BYTES_UNIT) or ',' in value:
+            return None
+        ifRange = request.headers.get('If-Range')
+        if ifRange is not None and ifRange not in (self.etag, self.lastModified):
+            return None
+        first, sep, last = value[len(self.BYTES_UNIT):].partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                first = max(0, self.size - int(last))
+                last = self.size - 1
+            else:
+                first = int(first)
+                last = min(int(last), self.size - 1) if last else self.size - 1
+        except ValueError:
+            return None
+        if first > last:
+            raise RangeNotSatisfiable("Range {} is not satisfiable for size {}".format(value, self.size))
+        return first, last
+
+    @classmethod
+    def accepts_gzip(cls, request):
+        """
+        Check if client accepts gzip content encoding
+        :param request: http request
+        :return: bool
+        """
+        for coding in request.headers.get('Accept-Encoding', '').split(','):
+            name, sep, params = coding.partition(';')
+            if name.strip().lower() in (cls.GZIP, '*'):
+                params = params.replace(' ', '')
+                return not params.startswith('q=') or params[2:] not in ('0', '0.0', '0.00', '0.000')
+        return False
+
+    def get_variant(self, request):
+        """
+        Choose representation of file for client. Range requests always get identity representation.
+        :param request: http request
+        :return: (content or None for large file, etag, content encoding or None)
+        """
+        if self.gzipContent is not None and 'Range' not in request.headers and self.accepts_gzip(request):
+            return self.gzipContent, self.gzipEtag, self.GZIP
+        return self.content, self.etag, None
+
+    @classmethod
+    def guess_content_type(cls, path):
+        """
+        Get HTTP content type of file
+        :param path: path to file
+        :return: Content-Type
+        """
+        return mimetypes.guess_type(urllib.pathname2url(path))[0] or cls.DEFAULT_CONTENT_TYPE
+
+    def is_changed(self, stat):
+        """
+        Check if file on disk differs from loaded one
+        :param stat: os.stat result of file
+        :return: bool
+        """
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+    def is_not_modified(self, request, etag=None):
+        """
+        Check conditional request headers against file validators
+        :param request: http request
+        :param etag: ETag of chosen representation
+        :return: client copy is fresh - True, else - False
+        """
+        etag = etag or self.etag
+        ifNoneMatch = request.headers.get('If-None-Match')
+        if ifNoneMatch is not None:
+            tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+            return '*' in tags or etag in tags or ''.join(['W/', etag]) in tags
+        ifModifiedSince = request.headers.get('If-Modified-Since')
+        if ifModifiedSince is not None:
+            parsed = parsedate_tz(ifModifiedSince)
+            return parsed is not None and int(self.mtime) <= mktime_tz(parsed)
+        return False
+
+
+class StaticCache(object):
+    """
+    In-memory cache of static files. Files are loaded once and reloaded when their mtime changes.
+    """
+    CHECK_INTERVAL = 1.0
+    LARGE_FILE_SIZE = 262144
+
+    def __init__(self, root, preload=True, checkinterval=CHECK_INTERVAL, largefilesize=LARGE_FILE_SIZE):
+        """
+        Constructor
+        :param root: static files directory
+        :param preload: load all files at once
+        :param checkinterval: min seconds between mtime checks of one file
+        :param largefilesize: files bigger than this are not kept in memory and are sent from disk
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        self.root = os.path.realpath(root)
+        self.checkInterval = checkinterval
+        self.largeFileSize = largefilesize
+        self.files = {}
+        if preload:
+            self.load_all()
+
+    def load_all(self):
+        """
+        Load all files under root directory
+        """
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                url = '/' + os.path.relpath(path, self.root).replace(os.sep, '/')
+                self.load(url, path)
+        self._log.info("Loaded %d static files from %s", len(self.files), self.root)
+
+    def load(self, url, path):
+        """
+        Load file to cache
+        :param url: HTTP url
+        :param path: path to file
+        :return: StaticFile or None if file is not available
+        """
+        try:
+            stat = os.stat(path)
+            entry = StaticFile(path, stat, large=stat.st_size > self.largeFileSize)
+        except (IOError, OSError):
+            self.files.pop(url, None)
+            CACHE_FILES.set(len(self.files))
+            return None
+        self.files[url] = entry
+        CACHE_FILES.set(len(self.files))
+        return entry
+
+    def get(self, url):
+        """
+        Get file by url
+        :param url: HTTP url, query string is ignored
+        :return: StaticFile or None if not found
+        """
+        url = url.split('?', 1)[0]
+        entry = self.files.get(url)
+        if entry is None:
+            CACHE_MISSES.inc()
+            path = self.get_path(url)
+            return self.load(url, path) if path else None
+        now = time.time()
+        if now - entry.checked >= self.checkInterval:
+            entry.checked = now
+            try:
+                stat = os.stat(entry.path)
+            except OSError:
+                self.files.pop(url, None)
+                CACHE_FILES.set(len(self.files))
+                return None
+            if entry.is_changed(stat):
+                CACHE_RELOADS.inc()
+                return self.load(url, entry.path)
+        CACHE_HITS.inc()
+        return entry
+
+    def report(self):
+        """
+        Get size report of cached files
+        :return: list of dicts with url, size, gzip size and compression time in seconds
+        """
+        result = []
+        for url, entry in sorted(self.files.items()):
+            result.append({'url': url, 'size': entry.size,
+                           'gzip_size': len(entry.gzipContent) if entry.gzipContent is not None else None,
+                           'compress_time': entry.compressTime})
+        return result
+
+    def get_path(self, url):
+        """
+        Get path to file located under root directory
+        :param url: HTTP url
+        :return: file path or None if url is out of root or not a file
+        """
+        path = os.path.realpath(os.path.join(self.root, posixpath.normpath(url).lstrip('/')))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
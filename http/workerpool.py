@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import threading
+import logging
+from collections import deque
+from Queue import Queue
+from utils import metrics
+
+QUEUE_DEPTH = metrics.Gauge('worker_pool_queue_depth', "Tasks waiting for a worker or for route limit", ('route',))
+
+class WorkerPool(object):
+    """
+    Thread pool for blocking request handlers.
+    Every task belongs to a route. When a route has as many running tasks as its limit, next tasks of the route
+    wait in the route queue and do not occupy worker threads.
+    """
+    WORKERS = 8
+
+    def __init__(self, workers=WORKERS, routelimits=None, defaultlimit=None):
+        """
+        Constructor
+        :param workers: number of threads
+        :param routelimits: dictionary where key - route, value - max running tasks of route
+        :param defaultlimit: max running tasks of route which is not in routelimits, defaults to workers
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        self.routeLimits = routelimits or {}
+        self.defaultLimit = defaultlimit or workers
+        self.tasks = Queue()
+        self.running = {}
+        self.waiting = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        for x in range(workers):
+            thread = threading.Thread(target=self.work, name="{}-{}".format(self.__class__.__name__, x))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, route, func, callback, *args):
+        """
+        Run function in worker thread
+        :param route: route name to apply concurrency limit of
+        :param func: blocking function
+        :param callback: called in worker thread after func finished
+        :param args: func arguments
+        """
+        task = (route, func, callback, args)
+        QUEUE_DEPTH.labels(route).inc()
+        with self.lock:
+            if self.running.get(route, 0) < self.routeLimits.get(route, self.defaultLimit):
+                self.running[route] = self.running.get(route, 0) + 1
+            else:
+                self.waiting.setdefault(route, deque()).append(task)
+                return
+        self.tasks.put(task)
+
+    def work(self):
+        """
+        Worker thread loop
+        """
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            route, func, callback, args = task
+            QUEUE_DEPTH.labels(route).dec()
+            try:
+                func(*args)
+            except Exception:
+                self._log.exception("Task of route %s failed", route)
+            finally:
+                callback()
+                self.release(route)
+
+    def release(self, route):
+        """
+        Start next waiting task of route or decrease number of running tasks
+        :param route: route name
+        """
+        with self.lock:
+            waiting = self.waiting.get(route)
+            if waiting:
+                task = waiting.popleft()
+            else:
+                self.running[route] -= 1
+                return
+        self.tasks.put(task)
+
+    def queue_depth(self):
+        """
+        Get number of tasks waiting for a worker or for route limit
+        :return: number of tasks
+        """
+        with self.lock:
+            return self.tasks.qsize() + sum(len(waiting) for waiting in self.waiting.values())
+
+    def stats(self):
+        """
+        Get per route counters
+        :return: dictionary where key - route, value - (running, waiting)
+        """
+        with self.lock:
+            return dict((route, (self.running.get(route, 0), len(self.waiting.get(route, ()))))
+                        for route in set(self.running) | set(self.waiting))
+
+    def stop(self):
+        """
+        Stop worker threads after queued tasks
+        """
+        for thread in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
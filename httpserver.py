@@ -1,32 +1,65 @@
 # -*- coding: utf-8 -*-
 from http.server import Server
-import gevent
 from http.server import Session
+from http.server import loop
+from http.server import create_listening_socket
+from http.server import BACKLOG
+from http.server import UNIX_SOCKET_MODE
+from http.server import create_unix_socket
+from http.prefork import Master
+from http.workerpool import WorkerPool
+from http.router import Router
+from http.router import RouteNotFound
+from http.router import MethodNotAllowed
+from http.router import MethodNotImplemented
+from http.static import StaticCache
+from http.static import RangeNotSatisfiable
 from http.message import Response
+from http.message import ResponseTemplate
+from http.message import RequestParser
 from databasehandler.dbhandler import DatabaseHandler
 from cachelib.sessioncache import Unauthorized
-import asyncore
-import urllib
-import mimetypes
 from sqlalchemy import create_engine
 from redis import ConnectionPool
 from utils import validator
+from utils import metrics
+from utils import tracing
+from utils import logger
+from utils.tracing import SlowRequestLog
 from cachelib.sessioncache import BaseSessionException
+from cachelib.ratelimit import RateLimited
 from error import error
 import os
+import time
+import json
+import signal
+import argparse
 import logging
 
 class ChatSession(Session):
-    GET_METHOD_LOWER = 'get'
-    POST_METHOD_LOWER = 'post'
+    _router = None
+    JSON_CONTENT_TYPE = 'application/json'
+    NOT_FOUND = ResponseTemplate(404)
+    NOT_IMPLEMENTED = ResponseTemplate(501)
+    FORBIDDEN = ResponseTemplate(403)
+    # loggers of per-request records: auth lookups (DEBUG) and static misses (WARNING), rate limited in main
+    HOT_LOGGERS = ('ChatSession._check_auth', 'ChatSession.get_from_static')
+    LOG_RATE = 10.0
+    LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+    ROOT_REDIRECT = ResponseTemplate(302, {'Location': '/'})
+    CHAT_REDIRECT = ResponseTemplate(302, {'Location': '/chat.html'})
+    INTERNAL_ERROR = ResponseTemplate(500, {'Content-Type': JSON_CONTENT_TYPE},
+                                      validator.create_json_response(errorCode=500, reason="Internal error."))
+    MAX_ERROR_TEMPLATES = 256
+    errorTemplates = {}
 
-    def __init__(self, sock=None, map=None, addr=None, staticpath="", cookiename="chat_cookie", *args, **kwargs):
-        Session.__init__(self, sock, map, addr, args, kwargs)
+    def __init__(self, sock=None, map=None, addr=None, staticpath="", cookiename="chat_cookie", staticcache=None,
+                 *args, **kwargs):
+        Session.__init__(self, sock, map, addr, *args, **kwargs)
         self.cookieName = cookiename
         self.staticPath = staticpath
+        self.staticCache = staticcache or StaticCache(staticpath, preload=False)
         self.dbHandler = None
-        self.set_post_urls()
-        self.set_get_urls()
 
     def set_db_handler(self, dbhandler):
         """
@@ -35,65 +68,100 @@ class ChatSession(Session):
         """
         self.dbHandler = dbhandler
 
-    def set_post_urls(self):
+    @classmethod
+    def create_router(cls):
         """
-        Set dictionary where key - regexp url, value - render method
-        :return:
+        Build route table of session class. Handlers touching database are blocking and run in worker pool.
+        :return: Router
         """
-        self.postUrlList = {
-            '/auth': self.auth,
-            '/registration': self.registration,
-        }
+        router = Router()
+        router.add('GET', '/', cls.index, blocking=True)
+        router.add('GET', '/index.html', cls.index, blocking=True)
+        router.add('GET', '/chat.html', cls.chat, blocking=True)
+        router.add('GET', '/logout', cls.log_out, blocking=True)
+        router.add('POST', '/auth', cls.auth, blocking=True)
+        router.add('POST', '/registration', cls.registration, blocking=True)
+        router.add('GET', '/metrics', cls.show_metrics)
+        router.add('GET', '/admin/slow-requests', cls.show_slow_requests)
+        router.add_fallback('GET', cls.get_from_static, name='static')
+        return router
 
-    def set_get_urls(self):
+    @classmethod
+    def get_router(cls):
         """
-        Set dictionary where key - regexp url, value - render method
-        :return:
+        Get route table of session class, it is built on the first call and shared by all connections
+        :return: Router
         """
-        self.getUrlList = {
-            '/': self.index,
-            '/index.html': self.index,
-            '/chat.html': self.chat,
-            '/logout': self.log_out,
-        }
+        if cls.__dict__.get('_router') is None:
+            cls._router = cls.create_router()
+        return cls._router
 
     def render(self, request):
         log = self._log.getChild("render")
-        method = request.method.lower()
-        if method == self.GET_METHOD_LOWER:
-            gevent.spawn(self.render_get, request).join()
-        elif method == self.POST_METHOD_LOWER:
-            gevent.spawn(self.render_post, request).join()
-        else:
+        try:
+            route, request.routeParams = self.get_router().match(request.method, request.path)
+        except MethodNotImplemented:
+            self.write_template(self.NOT_IMPLEMENTED)
+        except MethodNotAllowed as err:
             response = Response()
-            response.responseCode = 501
+            response.responseCode = 405
+            response.headers['Allow'] = ', '.join(err.allowed)
             self.write(response)
+        except RouteNotFound:
+            log.warning("Client: %s, url: %s not found", self.addr, request.url)
+            self.write_template(self.NOT_FOUND)
+        else:
+            self.route = route.name
+            if route.blocking:
+                self.defer(route.path, self.call_route, route, request)
+            else:
+                self.call_route(route, request)
 
-    def render_post(self, request):
+    def call_route(self, route, request):
         """
-        Render HTTP POST request
+        Call route handler and render its errors
+        :param route: matched route
         :param request: http request
         """
-        log = self._log.getChild("render_post")
+        log = self._log.getChild("call_route")
+        trace = self.trace
+        if trace is not None:
+            trace.handlerStart = time.time()
+            tracing.activate(trace)
         try:
-            self.postUrlList[request.url](request)
-        except KeyError:
-            response = Response()
-            response.responseCode = 404
+            route.handler(self, request)
+        except RateLimited as rErr:
+            response = Response(body=validator.create_json_response(errorCode=rErr.errno, reason=rErr.errorMsg),
+                                responsecode=429)
+            response.headers['Content-Type'] = self.JSON_CONTENT_TYPE
+            response.headers['Retry-After'] = str(rErr.get_retry_after())
             self.write(response)
         except (error.BaseException, BaseSessionException) as bErr:
-            response = Response()
-            response.responseCode = 400
-            response.content = validator.create_json_response(errorCode=bErr.errno, reason=bErr.errorMsg)
-            response.headers['Content-Type'] = 'application/json'
-            self.write(response)
+            self.write_template(self.get_error_template(bErr.errno, bErr.errorMsg))
         except Exception as err:
-            log.exception("Exception in rended: {}".format(err))
-            response = Response()
-            response.responseCode = 500
-            response.content = validator.create_json_response(errorCode=500, reason="Internal error.")
-            response.headers['Content-Type'] = 'application/json'
-            self.write(response)
+            log.exception("Exception in rended: %s", err)
+            self.write_template(self.INTERNAL_ERROR)
+        finally:
+            if trace is not None:
+                trace.handlerEnd = time.time()
+                tracing.activate(None)
+
+    @classmethod
+    def get_error_template(cls, errno, reason):
+        """
+        Get 400 response with JSON error body. Templates are kept for a limited number of distinct errors.
+        :param errno: error code
+        :param reason: error message
+        :return: ResponseTemplate
+        """
+        key = (errno, reason)
+        template = cls.errorTemplates.get(key)
+        if template is None:
+            template = ResponseTemplate(400, {'Content-Type': cls.JSON_CONTENT_TYPE},
+                                        validator.create_json_response(errorCode=errno, reason=reason))
+            if len(cls.errorTemplates) < cls.MAX_ERROR_TEMPLATES:
+                cls.errorTemplates[key] = template
+        return template
 
     def index(self, request):
         """
@@ -104,12 +172,8 @@ class ChatSession(Session):
         log = self._log.getChild("index")
         try:
             userId = self._check_auth(request)
-            response = self.get_redirect_response("/chat.html")
-            self.write(response)
+            self.write_template(self.CHAT_REDIRECT)
         except Unauthorized:
-            url = request.url
-            if url == '/':
-                url = '/index.html'
             self.get_from_static(request)
 
     def auth(self, request):
@@ -119,6 +183,7 @@ class ChatSession(Session):
         :return:
         """
         log = self._log.getChild("auth")
+        self.dbHandler.check_rate_limit('auth', self.get_client_address(request))
         login = request.get_param('login')
         password = request.get_param('password')
         user = self.dbHandler.get_user(login, password)
@@ -127,7 +192,7 @@ class ChatSession(Session):
         response.set_cookie(self.cookieName, cookie)
         response.content = validator.create_json_response(data={})
         response.headers['Content-Type'] = '; '.join(['application/json', 'charset=utf-8'])
-        log.info("Set cookie: {}, login: {}, userid: {}".format(cookie, login, user.id))
+        log.info("Set cookie: %s, login: %s, userid: %s", cookie, login, user.id)
         self.write(response)
 
     def registration(self, request):
@@ -137,6 +202,7 @@ class ChatSession(Session):
         :return:
         """
         log = self._log.getChild("registration")
+        self.dbHandler.check_rate_limit('registration', self.get_client_address(request))
         login = request.get_param('login')
         password = request.get_param('password')
         validator.is_valid_login(login)
@@ -147,7 +213,7 @@ class ChatSession(Session):
         response.set_cookie(self.cookieName, cookie)
         response.content = validator.create_json_response(data={})
         response.headers['Content-Type'] = '; '.join(['application/json', 'charset=utf-8'])
-        log.info("Set cookie: {}, login: {}, userid: {}".format(cookie, login, userId))
+        log.info("Set cookie: %s, login: %s, userid: %s", cookie, login, userId)
         self.write(response)
 
     def log_out(self, request):
@@ -159,7 +225,6 @@ class ChatSession(Session):
         log = self._log.getChild("sing_out")
         cookie = request.get_cookie(self.cookieName)
         self.dbHandler.close_session(cookie)
-        self.get_redirect_response('/')
         response = self.get_redirect_response('/')
         response.headers['Set-Cookie'] = '{}=""; ' \
                                          'expires=Thu, 01 Jan 1970 00:00:00 GMT; ' \
@@ -177,69 +242,90 @@ class ChatSession(Session):
             userId = self._check_auth(request)
             self.get_from_static(request)
         except Unauthorized:
-            response = self.get_redirect_response('/')
-            self.write(response)
+            self.write_template(self.ROOT_REDIRECT)
 
-    def render_get(self, request):
+    def show_metrics(self, request):
         """
-        Render HTTP GET request
-        :param request: request
+        Expose metrics of this process in Prometheus text format
+        :param request: http request
         """
-        log = self._log.getChild("render_get")
-        url = request.url
-        try:
-            self.getUrlList[url](request)
+        response = Response(body=metrics.REGISTRY.expose())
+        response.headers['Content-Type'] = metrics.CONTENT_TYPE
+        self.write(response)
+
+    def show_slow_requests(self, request):
+        """
+        Show the last slow request traces of this process as JSON. Only local clients are allowed, requests
+        passed by reverse proxy are checked by client address the proxy sets in X-Real-IP or X-Forwarded-For.
+        :param request: http request
+        """
+        if not self.is_local_client(request):
+            self.write_template(self.FORBIDDEN)
             return
-        except KeyError:
-            self.get_from_static(request)
-        except (error.BaseException, BaseSessionException) as bErr:
-            response = Response()
-            response.responseCode = 400
-            response.content = validator.create_json_response(errorCode=bErr.errno, reason=bErr.errorMsg)
-            response.headers['Content-Type'] = 'application/json'
-            self.write(response)
-        except Exception as err:
-            log.exception("Exception in rended: {}".format(err))
-            response = Response()
-            response.responseCode = 500
-            response.content = validator.create_json_response(errorCode=500, reason="Internal error.")
-            response.headers['Content-Type'] = 'application/json'
-            self.write(response)
+        if self.slowLog is None:
+            self.write_template(self.NOT_FOUND)
+            return
+        response = Response(body=json.dumps({'threshold': self.slowLog.threshold,
+                                             'traces': self.slowLog.get_traces()}))
+        response.headers['Content-Type'] = self.JSON_CONTENT_TYPE
+        self.write(response)
 
     def get_from_static(self, request):
         """
         Get files from static
-        :param url: HTTP url
+        :param request: http request
         :return:
         """
         log = self._log.getChild("get_from_static")
-        url = request.url
+        url = request.path
         if url == '/':
             url = '/index.html'
         cookie = request.get_cookie(self.cookieName)
+        entry = self.staticCache.get(url)
+        if entry is None:
+            log.warning("Client: %s, url: %s not found", self.addr, url)
+            self.write_template(self.NOT_FOUND)
+            return
         response = Response()
+        content, etag, encoding = entry.get_variant(request)
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = entry.lastModified
+        response.headers['Accept-Ranges'] = 'bytes'
+        if entry.compressible:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if entry.is_not_modified(request, etag):
+            response.responseCode = 304
+            del response.headers[Response.CONTENT_LEN]
+            self.write(response)
+            return
         try:
-            path = ''.join([self.staticPath, url])
-            with open(path, 'r') as file:
-                content = file.read()
-                response.content = content
-                contentType = self.get_file_content_type(path)
-                response.set_cookie(self.cookieName, cookie)
-                response.headers['Content-Type'] = '; '.join([contentType, 'charset=utf-8'])
-        except Exception as err:
-            log.warning("Client: {}, url: {} error: {}".format(self.addr, url, err))
-            response.responseCode = 404
-        finally:
+            byteRange = entry.get_range(request) if encoding is None else None
+        except RangeNotSatisfiable:
+            response.responseCode = 416
+            response.headers['Content-Range'] = 'bytes */{}'.format(entry.size)
             self.write(response)
-
-    def get_file_content_type(self, filepath):
-        """
-        Get HTTP content type of file
-        :param filepath: path to file
-        :return: Content-Type
-        """
-        url = urllib.pathname2url(filepath)
-        return mimetypes.guess_type(url)[0]
+            return
+        size = len(content) if content is not None else entry.size
+        first, last = byteRange or (0, size - 1)
+        if byteRange:
+            response.responseCode = 206
+            response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+        try:
+            file = entry.open() if content is None else None
+        except IOError as err:
+            log.warning("Client: %s, url: %s error: %s", self.addr, url, err)
+            self.write_template(self.NOT_FOUND)
+            return
+        response.set_cookie(self.cookieName, cookie)
+        response.headers['Content-Type'] = entry.contentType
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers[Response.CONTENT_LEN] = str(last - first + 1)
+        self.write(response)
+        if file is None:
+            self.push(memoryview(content)[first:last + 1])
+        else:
+            self.push_file(file, first, last - first + 1)
 
     def _check_auth(self, request):
         """
@@ -249,10 +335,20 @@ class ChatSession(Session):
         """
         log = self._log.getChild('_check_auth')
         cookie = request.get_cookie(self.cookieName)
-        userId = self.dbHandler.get_authorized_user_id(cookie)
-        log.info("Authorized user: {}, cookie: {}".format(userId, cookie))
+        with tracing.span('auth'):
+            userId = self.dbHandler.get_authorized_user_id(cookie)
+        log.debug("Authorized user: %s, cookie: %s", userId, cookie)
         return userId
 
+    def is_local_client(self, request):
+        """
+        Check if request comes from this host and not from a client of reverse proxy
+        :param request: http request
+        :return: bool
+        """
+        address = self.get_client_address(request)
+        return address == self.LOCAL_CLIENT or address in self.LOCAL_ADDRESSES
+
     def get_redirect_response(self, path='/'):
         """
         Send redirect
@@ -265,36 +361,162 @@ class ChatSession(Session):
         return response
 
 class ChatServer(Server):
+    # max running blocking handlers of route, the rest of worker pool is left to other routes
+    ROUTE_LIMITS = {'/auth': 4, '/registration': 2}
 
-    def __init__(self, host, port, handler, staticpath='', dbhandler=None):
-        Server.__init__(self, host, port, handler)
+    def __init__(self, host, port, handler, staticpath='', dbhandler=None, slowthreshold=SlowRequestLog.THRESHOLD,
+                 slowlogsize=SlowRequestLog.SIZE, **sessionoptions):
+        Server.__init__(self, host, port, handler, **sessionoptions)
+        handler.get_router()
         self.staticpath = staticpath
+        self.staticCache = StaticCache(staticpath)
         self.dbHanler = dbhandler
+        self.slowLog = SlowRequestLog(slowthreshold, slowlogsize)
 
     def wrap_session(self, sock, addr, *args, **kwargs):
-        handler = self.handler(sock, addr=addr, staticpath=self.staticpath)
+        handler = self.handler(sock, map=self._map, addr=addr, staticpath=self.staticpath,
+                               staticcache=self.staticCache, slowlog=self.slowLog, **self.sessionOptions)
         if self.dbHanler:
             handler.set_db_handler(self.dbHanler)
+        return handler
 
 def create_database(engine):
     from models.chat import Base
     Base.metadata.create_all(engine)
 
-def start_http():
-    dbpath = 'db/database.db'
+def start_worker(host, port, dbpath, redishost, redisport, sock=None, reuseport=False, unixsock=None,
+                 poolworkers=WorkerPool.WORKERS, routelimits=None, ratelimits=None, **serveroptions):
+    """
+    Run HTTP server in current process. Database engine, Redis pool and worker threads are created here,
+    so that every pre-forked process has its own ones.
+    :param host: listening host
+    :param port: listening port
+    :param dbpath: path to SQLite database
+    :param redishost: Redis host
+    :param redisport: Redis port
+    :param sock: listening socket shared by pre-forked processes
+    :param reuseport: bind own socket with SO_REUSEPORT
+    :param unixsock: listening unix domain socket, served in addition to TCP one or instead of it if port is None
+    :param poolworkers: number of threads running blocking handlers
+    :param routelimits: dictionary of route to max running handlers, defaults to ChatServer.ROUTE_LIMITS
+    :param ratelimits: dictionary of limit name to (tokens per second, bucket size),
+    defaults to DatabaseHandler.RATE_LIMITS
+    :param serveroptions: connection limits and session options passed to ChatServer
+    """
+    engine = create_engine("".join(["sqlite:///", dbpath]))
+    redisConnectionPool = ConnectionPool(host=redishost, port=int(redisport))
+    dbHandler = DatabaseHandler(engine, redisConnectionPool, ratelimits=ratelimits)
+    workerPool = WorkerPool(workers=poolworkers,
+                            routelimits=routelimits if routelimits is not None else ChatServer.ROUTE_LIMITS)
+    if port is None:
+        sock, unixsock = unixsock, None
+    server = ChatServer(host, port, ChatSession, 'html', dbHandler, sock=sock, reuseport=reuseport,
+                        workerpool=workerPool, **serveroptions)
+    if unixsock is not None:
+        server.add_listener(unixsock)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    loop()
+
+def start_http(host='0.0.0.0', port=9090, workers=0, reuseport=False, dbpath='db/database.db',
+               redishost='127.0.0.1', redisport=6379, backlog=BACKLOG, unixpath=None, unixmode=UNIX_SOCKET_MODE,
+               **serveroptions):
+    """
+    Start HTTP server
+    :param host: listening host
+    :param port: listening port
+    :param workers: number of pre-forked processes, 0 - serve in current process
+    :param reuseport: every process binds own socket with SO_REUSEPORT instead of sharing one socket
+    :param dbpath: path to SQLite database
+    :param redishost: Redis host
+    :param redisport: Redis port
+    :param backlog: listen backlog
+    :param unixpath: path of unix domain socket, e.g. for reverse proxy on the same host
+    :param unixmode: permissions of unix domain socket
+    :param serveroptions: worker pool options, rate limits, connection limits and session options passed to
+    start_worker
+    """
     if not os.path.exists(os.path.dirname(dbpath)):
         os.makedirs(os.path.dirname(dbpath))
     engine = create_engine("".join(["sqlite:///", dbpath]))
     create_database(engine)
-    redisHost = '127.0.0.1'
-    redisPort = 6379
-    redisConnectionPool = ConnectionPool(host=redisHost, port=int(redisPort))
-    dbHandler = DatabaseHandler(engine, redisConnectionPool)
-    server = ChatServer('0.0.0.0', 9090, ChatSession, 'html', dbHandler)
-    asyncore.loop()
+    engine.dispose()
+    serveroptions['backlog'] = backlog
+    unixSock = create_unix_socket(unixpath, unixmode, backlog) if unixpath else None
+    try:
+        if not workers:
+            start_worker(host, port, dbpath, redishost, redisport, unixsock=unixSock, **serveroptions)
+            return
+        sock = None if reuseport or port is None else create_listening_socket(host, port, backlog=backlog)
+        master = Master(workers, start_worker, (host, port, dbpath, redishost, redisport, sock, reuseport, unixSock),
+                        serveroptions)
+        master.run()
+    finally:
+        if unixSock is not None:
+            os.unlink(unixpath)
 
 if __name__ == '__main__':
-    logging.basicConfig(format=u'%(filename)s[LINE:%(lineno)d]# %(levelname)-8s [%(asctime)s] %(name)s > %(message)s',
-                       level=logging.DEBUG,
-    )
-    start_http()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat HTTP server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--workers', type=int, default=0, help="number of pre-forked worker processes")
+    parser.add_argument('--reuse-port', action='store_true', help="bind every worker with SO_REUSEPORT")
+    parser.add_argument('--db', default='db/database.db', help="path to SQLite database")
+    parser.add_argument('--redis-host', default='127.0.0.1')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--backlog', type=int, default=BACKLOG, help="listen backlog")
+    parser.add_argument('--unix-socket', default=None, help="also listen on unix domain socket of this path")
+    parser.add_argument('--unix-socket-mode', type=lambda value: int(value, 8), default=UNIX_SOCKET_MODE,
+                        help="octal permissions of unix domain socket")
+    parser.add_argument('--no-tcp', action='store_true', help="listen on unix domain socket only")
+    parser.add_argument('--pool-workers', type=int, default=WorkerPool.WORKERS,
+                        help="threads running blocking handlers in every process")
+    parser.add_argument('--route-limit', action='append', default=None, metavar='ROUTE=N',
+                        help="max running blocking handlers of route, e.g. /auth=4, may be repeated, "
+                             "replaces default limits")
+    parser.add_argument('--accept-batch', type=int, default=Server.ACCEPT_BATCH,
+                        help="max connections accepted per readiness event")
+    parser.add_argument('--max-connections', type=int, default=None, help="max open connections per process")
+    parser.add_argument('--max-per-ip', type=int, default=None,
+                        help="max open connections per client address, connections of trusted proxies "
+                             "and unix socket are not limited")
+    parser.add_argument('--max-header-size', type=int, default=RequestParser.MAX_HEADER_SIZE)
+    parser.add_argument('--max-body-size', type=int, default=RequestParser.MAX_BODY_SIZE)
+    parser.add_argument('--header-timeout', type=float, default=Session.HEADER_TIMEOUT,
+                        help="seconds to receive request headers")
+    parser.add_argument('--body-timeout', type=float, default=Session.BODY_TIMEOUT,
+                        help="seconds to receive request body")
+    parser.add_argument('--trusted-proxy', action='append', default=None,
+                        help="address of reverse proxy whose X-Real-IP and X-Forwarded-For headers are trusted, "
+                             "may be repeated, defaults to loopback addresses")
+    parser.add_argument('--send-timeout', type=float, default=Session.SEND_TIMEOUT,
+                        help="seconds queued response may wait for client to read any of it")
+    parser.add_argument('--slow-threshold', type=float, default=SlowRequestLog.THRESHOLD,
+                        help="seconds, slower requests are logged with phase timings")
+    parser.add_argument('--slow-log-size', type=int, default=SlowRequestLog.SIZE,
+                        help="number of slow request traces kept for /admin/slow-requests")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--log-queue-size', type=int, default=logger.QUEUE_SIZE,
+                        help="max log records waiting for writer thread, the rest is dropped")
+    parser.add_argument('--log-rate', type=float, default=ChatSession.LOG_RATE,
+                        help="max per-request log records per second of every hot path logger")
+    args = parser.parse_args()
+    if args.no_tcp and not args.unix_socket:
+        parser.error("--no-tcp requires --unix-socket")
+    routeLimits = None
+    if args.route_limit:
+        try:
+            routeLimits = dict((route, int(count)) for route, count in
+                               (item.rsplit('=', 1) for item in args.route_limit))
+        except ValueError:
+            parser.error("--route-limit must be ROUTE=N")
+    logger.configure(getattr(logging, args.log_level), queuesize=args.log_queue_size)
+    for name in ChatSession.HOT_LOGGERS:
+        logger.limit(name, rate=args.log_rate)
+    start_http(args.host, None if args.no_tcp else args.port, args.workers, args.reuse_port, args.db,
+               args.redis_host, args.redis_port, args.backlog, args.unix_socket, args.unix_socket_mode,
+               acceptbatch=args.accept_batch, maxconnections=args.max_connections,
+               maxperip=args.max_per_ip, maxheadersize=args.max_header_size, maxbodysize=args.max_body_size,
+               headertimeout=args.header_timeout, bodytimeout=args.body_timeout, sendtimeout=args.send_timeout,
+               slowthreshold=args.slow_threshold, slowlogsize=args.slow_log_size,
+               trustedproxies=tuple(args.trusted_proxy or Session.TRUSTED_PROXIES),
+               poolworkers=args.pool_workers, routelimits=routeLimits)
@@ -1,31 +1,48 @@
 import os
+import signal
 from socketio import socketio_manage
 from socketio.server import SocketIOServer
 from socketio.namespace import BaseNamespace
+from socketio import packet
+from socketio.defaultjson import default_json_dumps
 from sqlalchemy import create_engine
 from redis import ConnectionPool
 from databasehandler.dbhandler import DatabaseHandler
 import gevent
 import uuid
 import logging
+import argparse
+from cachelib.ratelimit import RateLimited
+from cachelib.backplane import Backplane
+from utils import logger
+from utils.presence import PresenceIndex
+from cachelib.presence import PresenceRegistry
 
 class ChatNamespace(BaseNamespace):
+    ENDPOINT = '/chat'
+    USER_LIST_METHOD = 'users'
+    LOGIN_INFO_METHOD = 'login_info'
+    ENTER_USER_METHOD = 'enter'
+    EXIT_USER_METHOD = 'exit'
+    MESSAGE_LIST_METHOD = 'messages'
+    TOP_LIST_METHOD = 'top_list'
+    CHAT_METHOD = 'chat'
+    REMOVE_MSG_METHOD = 'remove_msg'
+    RATE_LIMIT_METHOD = 'rate_limit'
+    HISTORY_METHOD = 'history'
     _sessions = {}
+    _presence = PresenceIndex()
+    # (presence version, encoded user list packet)
+    _userListPacket = (None, None)
     dbHandler = None
+    backplane = None
+    registry = None
     cookieName = None
 
     def __init__(self, environ, ns_name, request=None):
         self._log = logging.getLogger(self.__class__.__name__)
         self.uuid = str(uuid.uuid1())
         self.user = None
-        self.USER_LIST_METHOD = 'users'
-        self.LOGIN_INFO_METHOD = 'login_info'
-        self.ENTER_USER_METHOD = 'enter'
-        self.EXIT_USER_METHOD = 'exit'
-        self.MESSAGE_LIST_METHOD = 'messages'
-        self.TOP_LIST_METHOD = 'top_list'
-        self.CHAT_METHOD = 'chat'
-        self.REMOVE_MSG_METHOD = 'remove_msg'
         BaseNamespace.__init__(self, environ, ns_name, request)
 
     @staticmethod
@@ -42,12 +59,14 @@ class ChatNamespace(BaseNamespace):
         user = self.dbHandler.get_user_by_cookie(cookie)
         if not user:
             self.disconnect()
+            return
         self.user = user
-        if self.is_user_entered():
+        if self._presence.add(self.user.id, self.user.login, self.uuid) and \
+                (self.registry is None or self.registry.join(self.user.id, self.user.login)):
             self._broadcast(self.ENTER_USER_METHOD, self.user.login)
         self._sessions[self.uuid] = self
         self.emit(self.LOGIN_INFO_METHOD, self.user.login)
-        self.emit(self.USER_LIST_METHOD, self.get_online_user_list())
+        self.socket.put_client_msg(self.get_user_list_packet())
         messageList = self.dbHandler.get_message_list()
         self.emit(self.MESSAGE_LIST_METHOD, messageList)
         topList = self.dbHandler.get_user_top_list()
@@ -58,28 +77,31 @@ class ChatNamespace(BaseNamespace):
         Check is all sessions of user is closed
         :return: bool
         """
-        for session in self._sessions.values():
-            if session.user.id == self.user.id:
-                return False
-        return True
+        return not self._presence.is_online(self.user.id)
 
     def is_user_entered(self):
         """
         Check is it a new user
         :return:
         """
-        for session in self._sessions.values():
-            if session.user.id == self.user.id:
-                return False
-        return True
+        return not self._presence.is_online(self.user.id)
 
     def get_online_user_list(self):
         """
-        Get online users
-        :return: user list
+        Get online users of the cluster if presence registry is set, else of this process
+        :return: tuple of logins, shared snapshot
         """
-        userList = list(set([session.user.login for session in self._sessions.values()]))
-        return userList
+        return (self.registry or self._presence).get_snapshot()[1]
+
+    def get_user_list_packet(self):
+        """
+        Get encoded user list event. It is encoded once for every version of presence snapshot.
+        :return: encoded packet
+        """
+        version, userList = (self.registry or self._presence).get_snapshot()
+        if ChatNamespace._userListPacket[0] != version:
+            ChatNamespace._userListPacket = (version, self._encode_event(self.USER_LIST_METHOD, userList))
+        return ChatNamespace._userListPacket[1]
 
     def disconnect(self, *args, **kwargs):
         """
@@ -89,13 +111,19 @@ class ChatNamespace(BaseNamespace):
         :return:
         """
         if self.user:
-            del self._sessions[self.uuid]
-            if self.is_user_exit():
+            self._sessions.pop(self.uuid, None)
+            if self._presence.remove(self.user.id, self.user.login, self.uuid) and \
+                    (self.registry is None or self.registry.leave(self.user.id)):
                 self._broadcast(self.EXIT_USER_METHOD, self.user.login)
         super(ChatNamespace, self).disconnect(*args, **kwargs)
 
     def on_chat(self, message):
         self.check_auth()
+        try:
+            self.dbHandler.check_rate_limit('chat', self.user.id)
+        except RateLimited as rErr:
+            self.emit(self.RATE_LIMIT_METHOD, rErr.get_retry_after())
+            return
         gevent.spawn(self.hangle_msg, message).join()
         # self.send_msg(message)
 
@@ -105,14 +133,58 @@ class ChatNamespace(BaseNamespace):
         self._broadcast(self.CHAT_METHOD, [message.id, message.get_message(), self.user.login,
                                      message.get_str_time()])
 
+    def on_history(self, before, count=None):
+        """
+        Send page of messages older than cursor
+        :param before: identifier of the oldest message client has
+        :param count: page size
+        """
+        self.check_auth()
+        try:
+            before = int(before)
+            count = int(count or self.dbHandler.HISTORY_PAGE_SIZE)
+        except (TypeError, ValueError):
+            self._log.getChild('on_history').warning("Bad history cursor %r, count %r", before, count)
+            return
+        self.emit(self.HISTORY_METHOD, self.dbHandler.get_message_list(before, count))
+
     def on_remove_msg(self, msg):
         self.check_auth()
         self.dbHandler.remove_msg(msg)
         self._broadcast(self.REMOVE_MSG_METHOD, msg)
 
-    def _broadcast(self, event, message):
-        for s in self._sessions.values():
-            s.emit(event, message)
+    @classmethod
+    def _broadcast(cls, event, message):
+        """
+        Send event to all sessions of this process and publish it to other processes
+        :param event: event name
+        :param message: event argument
+        """
+        cls.deliver(event, message)
+        if cls.backplane is not None:
+            cls.backplane.publish(event, message)
+
+    @classmethod
+    def deliver(cls, event, message):
+        """
+        Send event to all sessions of this process. Packet is encoded once and the same string is queued
+        to every socket, instead of encoding it again by emit() of every session.
+        :param event: event name
+        :param message: event argument
+        """
+        if cls.registry is not None:
+            if event == cls.ENTER_USER_METHOD:
+                cls.registry.add_online(message)
+            elif event == cls.EXIT_USER_METHOD:
+                cls.registry.discard_online(message)
+        encoded = cls._encode_event(event, message)
+        for s in cls._sessions.values():
+            s.socket.put_client_msg(encoded)
+
+    @classmethod
+    def _encode_event(cls, event, message):
+        return packet.encode(dict(type='event', name=event, args=(message,), endpoint=cls.ENDPOINT),
+                             default_json_dumps)
 
     def get_cookie(self, cookieName):
         """
@@ -138,26 +210,52 @@ class ChatNamespace(BaseNamespace):
             self.disconnect()
             raise Exception
 
-def start_socketio():
+def start_socketio(host='', port=8080, dbpath='db/database.db', redishost='127.0.0.1', redisport=6379):
+    """
+    Start Socket.IO server. Several processes may serve the same chat, e.g. on different ports behind
+    a load balancer, events are exchanged through Redis backplane.
+    :param host: listening host
+    :param port: listening port
+    :param dbpath: path to SQLite database
+    :param redishost: Redis host
+    :param redisport: Redis port
+    """
 
     def chat(environ, start_response):
         if environ['PATH_INFO'].startswith('/socket.io'):
-            return socketio_manage(environ, {'/chat': ChatNamespace})
-    dbpath = 'db/database.db'
+            return socketio_manage(environ, {ChatNamespace.ENDPOINT: ChatNamespace})
     if not os.path.exists(os.path.dirname(dbpath)):
         os.makedirs(os.path.dirname(dbpath))
     engine = create_engine("".join(["sqlite:///", dbpath]))
-    redisHost = '127.0.0.1'
-    redisPort = 6379
-    redisConnectionPool = ConnectionPool(host=redisHost, port=int(redisPort))
+    redisConnectionPool = ConnectionPool(host=redishost, port=int(redisport))
     dbHandler = DatabaseHandler(engine, redisConnectionPool)
     ChatNamespace.set_db_handler(dbHandler)
     ChatNamespace.cookieName = 'chat_cookie'
-    sio_server = SocketIOServer(('', 8080), chat, policy_server=False)
-    sio_server.serve_forever()
+    ChatNamespace.backplane = Backplane(ChatNamespace.deliver, redisConnectionPool)
+    ChatNamespace.backplane.start()
+    ChatNamespace.registry = PresenceRegistry(
+        ChatNamespace._presence.get_users,
+        lambda login: ChatNamespace._broadcast(ChatNamespace.ENTER_USER_METHOD, login),
+        lambda login: ChatNamespace._broadcast(ChatNamespace.EXIT_USER_METHOD, login),
+        redisConnectionPool)
+    ChatNamespace.registry.start()
+    sio_server = SocketIOServer((host, port), chat, policy_server=False)
+    gevent.signal(signal.SIGTERM, sio_server.stop)
+    try:
+        sio_server.serve_forever()
+    finally:
+        # users of this worker exit right away instead of when its heartbeat expires
+        for login in ChatNamespace.registry.stop():
+            ChatNamespace._broadcast(ChatNamespace.EXIT_USER_METHOD, login)
+        ChatNamespace.backplane.stop()
 
 if __name__ == '__main__':
-    logging.basicConfig(format=u'%(filename)s[LINE:%(lineno)d]# %(levelname)-8s [%(asctime)s] %(name)s > %(message)s',
-                       level=logging.DEBUG,
-    )
-    start_socketio()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat Socket.IO server")
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default='db/database.db', help="path to SQLite database")
+    parser.add_argument('--redis-host', default='127.0.0.1')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+    logger.configure(logging.DEBUG)
+    start_socketio(args.host, args.port, args.db, args.redis_host, args.redis_port)
\ No newline at end of file
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+import redis
+
+REDIS_HOST = os.environ.get('REDIS_HOST', '127.0.0.1')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+# tests flush this database
+REDIS_DB = int(os.environ.get('REDIS_DB', 15))
+
+
+class RedisTestCase(unittest.TestCase):
+    """
+    Test of code running Redis commands and Lua scripts against a real server. Skipped if the server is not
+    available, its test database is flushed before every test.
+    """
+    pool = None
+
+    @classmethod
+    def setUpClass(cls):
+        pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+        try:
+            redis.Redis(connection_pool=pool).ping()
+        except redis.exceptions.ConnectionError as err:
+            raise unittest.SkipTest("Redis is not available on {}:{}: {}".format(REDIS_HOST, REDIS_PORT, err))
+        cls.pool = pool
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.pool is not None:
+            cls.pool.disconnect()
+
+    def setUp(self):
+        self.server = redis.Redis(connection_pool=self.pool)
+        self.server.flushdb()
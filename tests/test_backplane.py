@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import unittest
+import redis
+try:
+    from cachelib.backplane import Backplane
+except ImportError:
+    # gevent is not installed
+    Backplane = None
+
+
+class FakeServer(object):
+
+    def __init__(self, error=None):
+        self.published = []
+        self.error = error
+
+    def publish(self, channel, message):
+        if self.error is not None:
+            raise self.error
+        self.published.append((channel, message))
+
+
+@unittest.skipIf(Backplane is None, "gevent is not installed")
+class BackplaneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.delivered = []
+        self.origin = self.create_backplane()
+        self.other = self.create_backplane()
+
+    def create_backplane(self, handler=None):
+        backplane = Backplane(handler or (lambda event, message: self.delivered.append((event, message))))
+        backplane.server = self.server
+        return backplane
+
+    def test_event_is_delivered_to_other_process(self):
+        self.origin.publish('chat', [1, 'text'])
+        channel, data = self.server.published[0]
+        self.assertEqual(channel, Backplane.CHANNEL)
+        self.origin.receive(data)
+        self.assertEqual(self.delivered, [])
+        self.other.receive(data)
+        self.assertEqual(self.delivered, [('chat', [1, 'text'])])
+
+    def test_malformed_event_is_skipped(self):
+        receive = self.other._log.getChild('receive')
+        receive.disabled = True
+        try:
+            self.other.receive('{')
+        finally:
+            receive.disabled = False
+        self.assertEqual(self.delivered, [])
+
+    def test_handler_error_is_not_raised(self):
+        def fail(event, message):
+            raise KeyError(event)
+        backplane = self.create_backplane(fail)
+        self.origin.publish('enter', 'alice')
+        receive = backplane._log.getChild('receive')
+        receive.disabled = True
+        try:
+            backplane.receive(self.server.published[0][1])
+        finally:
+            receive.disabled = False
+
+    def test_publish_error_is_not_raised(self):
+        self.server.error = redis.exceptions.ConnectionError('lost')
+        publish = self.origin._log.getChild('publish')
+        publish.disabled = True
+        try:
+            self.origin.publish('exit', 'alice')
+        finally:
+            publish.disabled = False
+        self.assertEqual(self.server.published, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import logging
+import unittest
+from cachelib.localcache import LocalCache
+from cachelib.sessioncache import Unauthorized
+try:
+    from databasehandler.dbhandler import DatabaseHandler
+except ImportError:
+    # sqlalchemy is not installed
+    DatabaseHandler = None
+
+
+class Stop(BaseException):
+    pass
+
+
+class FakePubSub(object):
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.closed = False
+
+    def subscribe(self, channel):
+        pass
+
+    def listen(self):
+        for message in self.messages:
+            yield message
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer(object):
+
+    def __init__(self, subscriptions):
+        self.subscriptions = list(subscriptions)
+        self.published = []
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        if not self.subscriptions:
+            raise Stop()
+        return FakePubSub(self.subscriptions.pop(0))
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class FakeSessionCache(object):
+
+    def __init__(self, server=None):
+        self.server = server or FakeServer([])
+        self.users = {'good': '1'}
+        self.calls = 0
+        self.onCall = None
+
+    def get_authorized_user_id(self, cookie):
+        self.calls += 1
+        if self.onCall is not None:
+            self.onCall()
+        if cookie not in self.users:
+            raise Unauthorized
+        return self.users[cookie]
+
+
+@unittest.skipIf(DatabaseHandler is None, "sqlalchemy is not installed")
+class AuthCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        # handler without database and Redis, its session cache is replaced
+        self.handler = DatabaseHandler.__new__(DatabaseHandler)
+        self.handler._log = logging.getLogger(DatabaseHandler.__name__)
+        self.handler.sessionCache = FakeSessionCache()
+        self.handler.authCache = LocalCache('auth', 10, 60)
+        self.handler.unauthorizedCache = LocalCache('unauthorized', 10, 60)
+        self.handler.authGeneration = 0
+        self.handler.INVALIDATION_RETRY = 0
+        self.handler.INVALIDATION_MAX_RETRY = 0
+
+    def test_cookie_is_cached(self):
+        self.assertEqual(self.handler.get_authorized_user_id('good'), '1')
+        self.assertEqual(self.handler.get_authorized_user_id('good'), '1')
+        self.assertEqual(self.handler.sessionCache.calls, 1)
+
+    def test_unknown_cookie_is_cached(self):
+        for x in range(2):
+            self.assertRaises(Unauthorized, self.handler.get_authorized_user_id, 'bad')
+        self.assertEqual(self.handler.sessionCache.calls, 1)
+
+    def test_invalidation_during_lookup_does_not_fill_cache(self):
+        self.handler.sessionCache.onCall = lambda: self.handler.invalidate_cookies(['good'])
+        self.assertEqual(self.handler.get_authorized_user_id('good'), '1')
+        self.assertIs(self.handler.authCache.get('good'), LocalCache.MISSING)
+        self.assertEqual(self.handler.sessionCache.server.published,
+                         [(DatabaseHandler.INVALIDATION_CHANNEL, 'good')])
+
+    def test_listener_survives_malformed_message(self):
+        self.handler.sessionCache.server = FakeServer([[{'data': None}], []])
+        logger = logging.getLogger(DatabaseHandler.__name__).getChild('listen_invalidations')
+        logger.disabled = True
+        try:
+            self.assertRaises(Stop, self.handler.listen_invalidations)
+        finally:
+            logger.disabled = False
+        self.assertEqual(self.handler.sessionCache.server.subscriptions, [])
+
+if __name__ == '__main__':
+    unittest.main()
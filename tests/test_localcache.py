@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from cachelib.localcache import LocalCache
+
+
+class LocalCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache('test', 3, 60)
+
+    def test_get_and_set(self):
+        self.assertIs(self.cache.get('a'), LocalCache.MISSING)
+        self.cache.set('a', None)
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_least_recently_used_is_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+        self.assertIs(self.cache.get('b'), LocalCache.MISSING)
+        self.assertEqual([self.cache.get(key) for key in ('a', 'c', 'd')], ['a', 'c', 'd'])
+        self.assertEqual(len(self.cache), 3)
+
+    def test_entry_expires(self):
+        cache = LocalCache('test', 3, 0.05)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.06)
+        self.assertIs(cache.get('a'), LocalCache.MISSING)
+        self.assertEqual(len(cache), 0)
+
+    def test_delete(self):
+        self.cache.set('a', 1)
+        self.assertTrue(self.cache.delete('a'))
+        self.assertFalse(self.cache.delete('a'))
+        self.assertIs(self.cache.get('a'), LocalCache.MISSING)
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIs(self.cache.get('a'), LocalCache.MISSING)
+
+if __name__ == '__main__':
+    unittest.main()
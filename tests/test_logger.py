@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import Queue
+import logging
+import unittest
+from cStringIO import StringIO
+from utils.logger import QueueHandler
+from utils.logger import RateLimitFilter
+
+
+def create_record(level=logging.INFO, msg='message'):
+    return logging.LogRecord('test', level, __file__, 1, msg, (), None)
+
+
+class RateLimitFilterTest(unittest.TestCase):
+
+    def test_rate_limit(self):
+        loggerFilter = RateLimitFilter(rate=0.001, burst=3)
+        passed = [loggerFilter.filter(create_record()) for x in range(10)]
+        self.assertEqual(passed, [True] * 3 + [False] * 7)
+
+    def test_warning_is_limited_error_is_not(self):
+        loggerFilter = RateLimitFilter(rate=0.001, burst=1)
+        self.assertTrue(loggerFilter.filter(create_record(logging.WARNING)))
+        self.assertFalse(loggerFilter.filter(create_record(logging.WARNING)))
+        self.assertTrue(loggerFilter.filter(create_record(logging.ERROR)))
+
+    def test_sample(self):
+        loggerFilter = RateLimitFilter(sample=4)
+        passed = [loggerFilter.filter(create_record()) for x in range(8)]
+        self.assertEqual(passed.count(True), 2)
+
+
+class QueueHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO()
+        streamHandler = logging.StreamHandler(self.stream)
+        streamHandler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.handler = QueueHandler([streamHandler], queuesize=2)
+
+    def test_records_are_written_by_writer_thread(self):
+        self.handler.handle(create_record(msg='first'))
+        self.handler.handle(create_record(logging.ERROR, 'second'))
+        self.handler.stop()
+        self.assertEqual(self.stream.getvalue(), 'INFO first\nERROR second\n')
+
+    def test_full_queue_drops_records(self):
+        # queue of current process without writer thread
+        self.handler.queue = Queue.Queue(self.handler.queueSize)
+        self.handler.pid = os.getpid()
+        for x in range(3):
+            self.handler.handle(create_record())
+        self.assertEqual(self.handler.dropped, 1)
+        self.assertEqual(self.stream.getvalue(), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import unittest
+from http.message import RequestParser
+from http.message import HeadersTooLarge
+from http.message import BodyTooLarge
+
+GET = b'GET /index.html?x=1 HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n'
+POST = b'POST /auth HTTP/1.1\r\nHost: localhost\r\nContent-Length: 25\r\n\r\nlogin=alice&password=1234'
+
+
+class RequestParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = RequestParser()
+
+    def test_request_in_one_chunk(self):
+        requestList = self.parser.feed(GET)
+        self.assertEqual(len(requestList), 1)
+        request = requestList[0]
+        self.assertEqual(request.method, 'GET')
+        self.assertEqual(request.path, '/index.html')
+        self.assertEqual(request.query, 'x=1')
+        self.assertEqual(request.version, '1.1')
+        self.assertEqual(request.headers['Host'], 'localhost')
+        self.assertEqual(request.headers['Connection'], 'keep-alive')
+
+    def test_request_byte_by_byte(self):
+        requestList = []
+        for index in range(len(POST)):
+            requestList.extend(self.parser.feed(POST[index:index + 1]))
+        self.assertEqual(len(requestList), 1)
+        self.assertEqual(requestList[0].content, 'login=alice&password=1234')
+        self.assertEqual(requestList[0].get_param('login'), 'alice')
+        self.assertEqual(requestList[0].get_param('password'), '1234')
+
+    def test_pipelined_requests(self):
+        requestList = self.parser.feed(GET + POST + GET[:10])
+        self.assertEqual([request.method for request in requestList], ['GET', 'POST'])
+        requestList = self.parser.feed(GET[10:])
+        self.assertEqual([request.path for request in requestList], ['/index.html'])
+
+    def test_body_split_across_feeds(self):
+        head, body = POST.split(b'\r\n\r\n')
+        self.assertEqual(self.parser.feed(head + b'\r\n\r\n' + body[:5]), [])
+        self.assertIsNotNone(self.parser.bodyStarted)
+        requestList = self.parser.feed(body[5:])
+        self.assertEqual(requestList[0].content, body)
+
+    def test_bare_line_feeds(self):
+        requestList = self.parser.feed(b'GET / HTTP/1.0\nHost: localhost\n\n')
+        self.assertEqual(len(requestList), 1)
+        self.assertEqual(requestList[0].headers['Host'], 'localhost')
+
+    def test_state_is_reset_after_request(self):
+        self.parser.feed(GET)
+        self.assertIsNone(self.parser.started)
+        self.assertIsNone(self.parser.bodyStarted)
+        self.parser.feed(GET[:5])
+        self.assertIsNotNone(self.parser.started)
+
+    def test_request_times(self):
+        request = self.parser.feed(GET)[0]
+        self.assertIsNotNone(request.started)
+        self.assertGreaterEqual(request.received, request.started)
+
+    def test_headers_too_large_without_terminator(self):
+        parser = RequestParser(maxheadersize=64)
+        self.assertRaises(HeadersTooLarge, parser.feed, b'GET / HTTP/1.1\r\nX-Long: ' + b'x' * 100)
+
+    def test_headers_too_large_with_terminator(self):
+        parser = RequestParser(maxheadersize=64)
+        self.assertRaises(HeadersTooLarge, parser.feed, b'GET / HTTP/1.1\r\nX-Long: ' + b'x' * 100 + b'\r\n\r\n')
+
+    def test_body_too_large(self):
+        parser = RequestParser(maxbodysize=10)
+        self.assertRaises(BodyTooLarge, parser.feed, POST)
+
+    def test_malformed_request_line(self):
+        self.assertRaises(ValueError, self.parser.feed, b'GET /\r\n\r\n')
+        self.assertRaises(ValueError, RequestParser().feed, b'GET / FTP/1.0\r\n\r\n')
+
+    def test_bad_content_length(self):
+        self.assertRaises(ValueError, self.parser.feed, b'POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+        self.assertRaises(ValueError, RequestParser().feed, b'POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n')
+
+    def test_cookie(self):
+        request = self.parser.feed(b'GET / HTTP/1.1\r\nCookie: a=1; chat_cookie=abc\r\n\r\n')[0]
+        self.assertEqual(request.get_cookie('chat_cookie'), 'abc')
+        self.assertIsNone(request.get_cookie('missing'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from cachelib.messagecache import MessageCache
+from tests.redistest import RedisTestCase
+
+
+class MessageCacheTest(RedisTestCase):
+
+    def setUp(self):
+        RedisTestCase.setUp(self)
+        self.cache = MessageCache(self.pool)
+
+    def add_messages(self, count):
+        for messageId in range(1, count + 1):
+            self.cache.add_message(messageId, 'message {}'.format(messageId), 'alice', '2015-01-01 12:00:00')
+
+    def get_ids(self, messages):
+        return [int(message[0]) for message in messages]
+
+    def test_latest_page(self):
+        self.add_messages(10)
+        messages = self.cache.get_messages(count=3)
+        self.assertEqual(self.get_ids(messages), [8, 9, 10])
+        self.assertEqual(messages[-1][1:], [b'message 10', b'alice', b'2015-01-01 12:00:00'])
+
+    def test_pages_by_cursor(self):
+        self.add_messages(10)
+        pages = []
+        before = None
+        while True:
+            page = self.get_ids(self.cache.get_messages(before, 4))
+            if not page:
+                break
+            pages.append(page)
+            before = page[0]
+        self.assertEqual(pages, [[7, 8, 9, 10], [3, 4, 5, 6], [1, 2]])
+
+    def test_expired_messages_are_pruned(self):
+        self.add_messages(5)
+        self.server.pexpire(self.cache._get_message_key(4), 1)
+        self.server.delete(self.cache._get_message_key(2))
+        time.sleep(0.01)
+        self.assertEqual(self.get_ids(self.cache.get_messages(count=3)), [3, 5])
+        self.assertEqual(self.server.zrange(self.cache.INDEX_KEY, 0, -1), [b'1', b'2', b'3', b'5'])
+        self.assertEqual(self.get_ids(self.cache.get_messages(3, 3)), [1])
+        self.assertEqual(self.server.zrange(self.cache.INDEX_KEY, 0, -1), [b'1', b'3', b'5'])
+
+    def test_deleted_message_is_not_indexed(self):
+        self.add_messages(3)
+        self.cache.delete_message(2)
+        self.assertEqual(self.get_ids(self.cache.get_messages()), [1, 3])
+        self.assertEqual(self.server.zcard(self.cache.INDEX_KEY), 2)
+
+    def test_index_size_is_capped(self):
+        self.cache.MAX_INDEX_SIZE = 3
+        self.add_messages(5)
+        self.assertEqual(self.server.zrange(self.cache.INDEX_KEY, 0, -1), [b'3', b'4', b'5'])
+
+    def test_build_index(self):
+        self.add_messages(3)
+        self.server.delete(self.cache.INDEX_KEY)
+        self.assertEqual(self.cache.build_index(), 3)
+        self.assertEqual(self.cache.build_index(), 0)
+        self.assertEqual(self.get_ids(self.cache.get_messages()), [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import unittest
+from utils import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = metrics.Counter('requests_total', "Requests", ('route', 'code'), registry=self.registry)
+        counter.labels('/auth', 200).inc()
+        counter.labels('/auth', 200).inc(2)
+        counter.labels('say "hi"', 500).inc()
+        lines = self.registry.expose().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{route="/auth",code="200"} 3', lines)
+        self.assertIn('requests_total{route="say \\"hi\\"",code="500"} 1', lines)
+
+    def test_gauge(self):
+        gauge = metrics.Gauge('open', "Open", registry=self.registry)
+        gauge.inc(3)
+        gauge.dec()
+        computed = metrics.Gauge('computed', "Computed", registry=self.registry, func=lambda: 7)
+        self.assertEqual(gauge.default.get(), 2)
+        self.assertEqual(computed.default.get(), 7)
+        self.assertIn('computed 7', self.registry.expose().splitlines())
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('duration', "Duration", registry=self.registry, buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        lines = self.registry.expose().splitlines()
+        self.assertIn('duration_bucket{le="0.1"} 2', lines)
+        self.assertIn('duration_bucket{le="1.0"} 3', lines)
+        self.assertIn('duration_bucket{le="+Inf"} 4', lines)
+        self.assertIn('duration_count 4', lines)
+        self.assertIn('duration_sum 2.65', lines)
+
+    def test_duplicate_name(self):
+        metrics.Counter('requests_total', "Requests", registry=self.registry)
+        self.assertRaises(ValueError, metrics.Counter, 'requests_total', "Requests", registry=self.registry)
+
+    def test_timed(self):
+        histogram = metrics.Histogram('call', "Call", registry=self.registry)
+
+        @metrics.timed(histogram)
+        def fail():
+            raise KeyError()
+
+        self.assertRaises(KeyError, fail)
+        self.assertEqual(histogram.default.count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
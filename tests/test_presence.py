@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import unittest
+from utils.presence import PresenceIndex
+
+
+class PresenceIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PresenceIndex()
+
+    def test_first_and_last_session(self):
+        self.assertTrue(self.index.add(1, 'alice', 'a'))
+        self.assertFalse(self.index.add(1, 'alice', 'b'))
+        self.assertTrue(self.index.is_online(1))
+        self.assertFalse(self.index.remove(1, 'alice', 'a'))
+        self.assertTrue(self.index.is_online(1))
+        self.assertTrue(self.index.remove(1, 'alice', 'b'))
+        self.assertFalse(self.index.is_online(1))
+        self.assertEqual(self.index.get_users(), {})
+
+    def test_session_is_counted_once(self):
+        self.assertTrue(self.index.add(1, 'alice', 'a'))
+        self.assertFalse(self.index.add(1, 'alice', 'a'))
+        self.assertTrue(self.index.remove(1, 'alice', 'a'))
+        self.assertFalse(self.index.remove(1, 'alice', 'a'))
+        self.assertFalse(self.index.remove(2, 'bob', 'b'))
+        self.assertEqual(self.index.get_snapshot()[1], ())
+
+    def test_users(self):
+        self.index.add(1, 'alice', 'a')
+        self.index.add(2, 'bob', 'b')
+        users = self.index.get_users()
+        self.assertEqual(users, {1: 'alice', 2: 'bob'})
+        # copy is returned
+        users.clear()
+        self.assertEqual(len(self.index.get_users()), 2)
+
+    def test_snapshot_changes_only_on_enter_and_exit(self):
+        self.index.add(1, 'alice', 'a')
+        version, snapshot = self.index.get_snapshot()
+        self.assertEqual(snapshot, ('alice',))
+        self.index.add(1, 'alice', 'b')
+        self.index.remove(1, 'alice', 'b')
+        self.assertEqual(self.index.get_snapshot()[0], version)
+        self.assertIs(self.index.get_snapshot()[1], snapshot)
+        self.index.add(2, 'bob', 'c')
+        version, snapshot = self.index.get_snapshot()
+        self.assertEqual(sorted(snapshot), ['alice', 'bob'])
+        self.index.remove(1, 'alice', 'a')
+        self.assertGreater(self.index.get_snapshot()[0], version)
+        self.assertEqual(self.index.get_snapshot()[1], ('bob',))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+from tests.redistest import RedisTestCase
+try:
+    from cachelib.presence import PresenceRegistry
+except ImportError:
+    # gevent is not installed
+    PresenceRegistry = None
+
+
+@unittest.skipIf(PresenceRegistry is None, "gevent is not installed")
+class PresenceRegistryTest(RedisTestCase):
+
+    def setUp(self):
+        RedisTestCase.setUp(self)
+        self.entered = []
+        self.exited = []
+
+    def create_registry(self, users=None, **options):
+        users = users if users is not None else {}
+        return PresenceRegistry(lambda: dict(users), self.entered.append, self.exited.append, self.pool,
+                                **options)
+
+    def test_user_enters_and_exits_once(self):
+        first, second = self.create_registry(), self.create_registry()
+        self.assertTrue(first.join(1, 'alice'))
+        self.assertFalse(first.join(1, 'alice'))
+        self.assertFalse(second.join(1, 'alice'))
+        self.assertFalse(first.leave(1))
+        self.assertFalse(first.leave(1))
+        self.assertTrue(second.leave(1))
+
+    def test_online_logins(self):
+        first, second = self.create_registry(), self.create_registry()
+        first.join(1, 'alice')
+        second.join(2, 'bob')
+        first.heartbeat()
+        version, snapshot = first.get_snapshot()
+        self.assertEqual(sorted(snapshot), ['alice', 'bob'])
+        first.heartbeat()
+        self.assertEqual(first.get_snapshot()[0], version)
+        second.leave(2)
+        first.heartbeat()
+        self.assertEqual(first.get_snapshot()[1], ('alice',))
+
+    def test_users_of_dead_worker_exit(self):
+        dead = self.create_registry(ttl=0.05)
+        dead.heartbeat()
+        dead.join(1, 'alice')
+        dead.join(2, 'bob')
+        alive = self.create_registry()
+        alive.heartbeat()
+        alive.join(2, 'bob')
+        time.sleep(0.1)
+        alive.heartbeat()
+        self.assertEqual(self.exited, ['alice'])
+        self.assertEqual(alive.get_snapshot()[1], ('bob',))
+        self.assertEqual(self.server.zrange(alive.workersKey, 0, -1), [alive.workerId.encode()])
+
+    def test_removed_worker_registers_users_again(self):
+        users = {1: 'alice'}
+        registry = self.create_registry(users, ttl=0.05)
+        registry.heartbeat()
+        registry.join(1, 'alice')
+        time.sleep(0.1)
+        self.create_registry().heartbeat()
+        self.assertEqual(self.exited, ['alice'])
+        registry._log.disabled = True
+        try:
+            registry.heartbeat()
+        finally:
+            registry._log.disabled = False
+        self.assertEqual(self.entered, ['alice'])
+        self.assertEqual(registry.get_snapshot()[1], ('alice',))
+
+    def test_stop(self):
+        users = {1: 'alice', 2: 'bob'}
+        registry = self.create_registry(users)
+        other = self.create_registry()
+        registry.heartbeat()
+        for userId, login in users.items():
+            registry.join(userId, login)
+        other.join(2, 'bob')
+        self.assertEqual(registry.stop(), ['alice'])
+        self.assertFalse(self.server.exists(registry.workerKey))
+        self.assertEqual(self.server.zrange(registry.workersKey, 0, -1), [])
+        other.heartbeat()
+        self.assertEqual(other.get_snapshot()[1], ('bob',))
+
+if __name__ == '__main__':
+    unittest.main()
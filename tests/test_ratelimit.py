@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+import redis
+from cachelib import ratelimit
+from cachelib.ratelimit import RateLimiter
+from cachelib.ratelimit import RateLimited
+from cachelib.ratelimit import CHECKS
+from tests.redistest import RedisTestCase
+
+
+class CountingRateLimiter(RateLimiter):
+    """
+    Rate limiter counting calls of Lua script
+    """
+
+    def __init__(self, *args, **kwargs):
+        RateLimiter.__init__(self, *args, **kwargs)
+        self.calls = 0
+        tokenBucket = self.tokenBucket
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            return tokenBucket(*args, **kwargs)
+        self.tokenBucket = call
+
+
+class RateLimiterTest(RedisTestCase):
+
+    def create_limiter(self, limits):
+        return CountingRateLimiter(limits, self.pool)
+
+    def test_leased_tokens_are_spent_locally(self):
+        limiter = self.create_limiter({'auth': (0.001, 8)})
+        for x in range(8):
+            limiter.check('auth', '203.0.113.1')
+        self.assertEqual(limiter.calls, 4)
+        self.assertRaises(RateLimited, limiter.check, 'auth', '203.0.113.1')
+        limiter.check('auth', '203.0.113.2')
+
+    def test_bucket_is_shared_by_processes(self):
+        limiters = [self.create_limiter({'auth': (0.001, 4)}) for x in range(2)]
+        for x in range(2):
+            for limiter in limiters:
+                limiter.check('auth', 'key')
+        for limiter in limiters:
+            self.assertRaises(RateLimited, limiter.check, 'auth', 'key')
+
+    def test_refusal_lasts_until_next_token(self):
+        limiter = self.create_limiter({'registration': (0.05, 1)})
+        # leases expire at once, refusal lasts on its own
+        limiter.leases.ttl = 0
+        limiter.check('registration', 'key')
+        try:
+            limiter.check('registration', 'key')
+        except RateLimited as err:
+            self.assertGreater(err.get_retry_after(), 15)
+        else:
+            self.fail("RateLimited is not raised")
+        calls = limiter.calls
+        refused = CHECKS.labels('registration', 'local_refused').value
+        self.assertRaises(RateLimited, limiter.check, 'registration', 'key')
+        self.assertEqual(limiter.calls, calls)
+        self.assertEqual(CHECKS.labels('registration', 'local_refused').value, refused + 1)
+
+    def test_refusal_expires_when_token_is_due(self):
+        limiter = self.create_limiter({'chat': (20.0, 1)})
+        limiter.check('chat', 'key')
+        self.assertRaises(RateLimited, limiter.check, 'chat', 'key')
+        time.sleep(0.1)
+        limiter.check('chat', 'key')
+
+    def test_bucket_is_refilled_by_redis_clock(self):
+        self.create_limiter({'auth': (1.0, 1)}).check('auth', 'key')
+        skewed = self.create_limiter({'auth': (1.0, 1)})
+        realTime = ratelimit.time.time
+        ratelimit.time.time = lambda: realTime() + 3600
+        try:
+            self.assertRaises(RateLimited, skewed.check, 'auth', 'key')
+        finally:
+            ratelimit.time.time = realTime
+
+
+class UnavailableRedisTest(unittest.TestCase):
+
+    def test_redis_is_not_available(self):
+        pool = redis.ConnectionPool(host='127.0.0.1', port=1)
+        limiter = RateLimiter({'auth': (0.001, 1)}, pool)
+        limiter._log.getChild('check').disabled = True
+        errors = CHECKS.labels('auth', 'error').value
+        try:
+            for x in range(3):
+                limiter.check('auth', 'key')
+        finally:
+            limiter._log.getChild('check').disabled = False
+        self.assertEqual(CHECKS.labels('auth', 'error').value, errors + 3)
+
+if __name__ == '__main__':
+    unittest.main()
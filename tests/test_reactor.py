@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import unittest
+from http.reactor import Reactor
+from http.reactor import TimerWheel
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=1.0, slots=8)
+        self.now = self.wheel.current * self.wheel.tick
+
+    def test_timer_fires_at_tick_after_deadline(self):
+        self.wheel.schedule(2.5, 'callback', 1)
+        self.assertEqual(self.wheel.count, 1)
+        self.assertEqual(self.wheel.advance(self.now + 2.5), [])
+        self.assertEqual(self.wheel.advance(self.now + 4.0), [('callback', (1,))])
+        self.assertEqual(self.wheel.count, 0)
+        self.assertIsNone(self.wheel.get_deadline())
+
+    def test_cancelled_timer(self):
+        timer = self.wheel.schedule(1.0, 'callback')
+        timer.cancel()
+        timer.cancel()
+        self.assertEqual(self.wheel.count, 0)
+        self.assertEqual(self.wheel.advance(self.now + 10.0), [])
+
+    def test_timer_after_several_turns(self):
+        self.wheel.schedule(20.0, 'callback')
+        self.assertEqual(self.wheel.advance(self.now + 8.0), [])
+        self.assertEqual(self.wheel.advance(self.now + 16.0), [])
+        self.assertEqual(self.wheel.advance(self.now + 22.0), [('callback', ())])
+
+
+class ReactorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+        self.calls = []
+
+    def tearDown(self):
+        self.reactor.waker.close()
+        if self.reactor.epoll is not None:
+            self.reactor.epoll.close()
+
+    def run_until(self, condition, timeout=1.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            self.reactor.run_once(0.05)
+        return condition()
+
+    def test_call_later_order(self):
+        self.reactor.call_later(0.02, self.calls.append, 2)
+        self.reactor.call_later(0.01, self.calls.append, 1)
+        self.reactor.call_later(0.03, self.calls.append, 3).cancel()
+        self.assertTrue(self.run_until(lambda: len(self.calls) == 2))
+        self.reactor.run_once(0.05)
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_call_soon_threadsafe(self):
+        thread = threading.Thread(target=self.reactor.call_soon_threadsafe, args=(self.calls.append, 1))
+        thread.start()
+        thread.join()
+        start = time.time()
+        self.reactor.run_once(1.0)
+        self.assertEqual(self.calls, [1])
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_failed_callback_does_not_stop_reactor(self):
+        self.reactor.call_later(0, lambda: 1 / 0)
+        self.reactor.call_later(0, self.calls.append, 1)
+        self.assertTrue(self.run_until(lambda: self.calls))
+
+if __name__ == '__main__':
+    unittest.main()
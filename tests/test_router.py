@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import unittest
+from http.router import Router
+from http.router import RouteNotFound
+from http.router import MethodNotAllowed
+from http.router import MethodNotImplemented
+
+
+def handler(session, request):
+    pass
+
+
+class RouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router()
+        self.index = self.router.add('GET', '/', handler, blocking=True)
+        self.auth = self.router.add('POST', '/auth', handler, blocking=True)
+        self.authPage = self.router.add('GET', '/auth', handler)
+        self.static = self.router.add_fallback('GET', handler, name='static')
+        self.js = self.router.add_prefix('GET', '/js/', handler, name='js')
+        self.user = self.router.add_pattern('GET', r'/user/(?P<userid>\d+)', handler)
+
+    def test_exact_route(self):
+        route, params = self.router.match('GET', '/')
+        self.assertIs(route, self.index)
+        self.assertIsNone(params)
+        self.assertTrue(route.blocking)
+
+    def test_method_selects_route(self):
+        self.assertIs(self.router.match('POST', '/auth')[0], self.auth)
+        self.assertIs(self.router.match('GET', '/auth')[0], self.authPage)
+
+    def test_method_is_case_insensitive(self):
+        self.assertIs(self.router.match('post', '/auth')[0], self.auth)
+
+    def test_exact_route_wins_over_prefix(self):
+        self.assertIs(self.router.match('GET', '/auth')[0], self.authPage)
+
+    def test_longest_prefix(self):
+        self.router.add_prefix('GET', '/js/lib/', handler)
+        self.assertIs(self.router.match('GET', '/js/chat.js')[0], self.js)
+        self.assertEqual(self.router.match('GET', '/js/lib/x.js')[0].path, '/js/lib/')
+
+    def test_fallback(self):
+        self.assertIs(self.router.match('GET', '/css/style.css')[0], self.static)
+        self.assertEqual(self.router.match('GET', '/css/style.css')[0].name, 'static')
+
+    def test_fallback_of_other_method_is_not_found(self):
+        try:
+            self.router.match('POST', '/missing')
+        except MethodNotAllowed:
+            self.fail("MethodNotAllowed is raised for path routed only by fallback")
+        except RouteNotFound:
+            pass
+
+    def test_prefix_of_other_method_is_not_allowed(self):
+        try:
+            self.router.match('POST', '/js/chat.js')
+        except MethodNotAllowed as err:
+            self.assertEqual(err.allowed, ['GET'])
+        else:
+            self.fail("MethodNotAllowed is not raised")
+
+    def test_pattern_groups(self):
+        route, params = self.router.match('GET', '/user/42')
+        self.assertIs(route, self.user)
+        self.assertEqual(params, {'userid': '42'})
+
+    def test_pattern_matches_whole_path(self):
+        self.assertIs(self.router.match('GET', '/user/42/x')[0], self.static)
+
+    def test_method_not_allowed(self):
+        try:
+            self.router.match('POST', '/')
+        except MethodNotAllowed as err:
+            self.assertEqual(err.allowed, ['GET'])
+        else:
+            self.fail("MethodNotAllowed is not raised")
+
+    def test_method_not_allowed_lists_all_methods(self):
+        self.router.add('PUT', '/auth', handler)
+        self.router.add('DELETE', '/other', handler)
+        try:
+            self.router.match('DELETE', '/auth')
+        except MethodNotAllowed as err:
+            self.assertEqual(err.allowed, ['GET', 'POST', 'PUT'])
+        else:
+            self.fail("MethodNotAllowed is not raised")
+
+    def test_method_not_implemented(self):
+        self.assertRaises(MethodNotImplemented, self.router.match, 'PATCH', '/')
+
+    def test_route_not_found(self):
+        router = Router()
+        router.add('GET', '/', handler)
+        self.assertRaises(RouteNotFound, router.match, 'GET', '/missing')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import errno
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+from http.server import Server
+from http.server import Session
+from http.message import Response
+from http.message import Request
+from http.reactor import Reactor
+from http.workerpool import WorkerPool
+
+TIMEOUT = 0.5
+GET = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+FILE_SIZE = 8388608
+
+
+class RecordingSession(Session):
+    """
+    Session keeping exceptions which asyncore only logs before closing connection
+    """
+    errors = []
+
+    def handle_error(self):
+        self.errors.append(sys.exc_info()[1])
+        Session.handle_error(self)
+
+
+class DeferredSession(Session):
+    """
+    Session rendering requests in worker pool, workers wait until release is set
+    """
+    release = threading.Event()
+
+    def render(self, request):
+        self.defer('wait', self.render_deferred, request)
+
+    def render_deferred(self, request):
+        self.release.wait(5.0)
+        Session.render(self, request)
+
+
+class LargeResponseSession(Session):
+    BODY = 'x' * 1048576
+
+    def render(self, request):
+        self.write(Response(body=self.BODY))
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Server and clients in one thread: the reactor is run while test waits for a condition
+    """
+
+    def setUp(self):
+        Session.sessions.clear()
+        Session.pausedSessions = 0
+        self.reactor = Reactor()
+        self.server = None
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        for session in list(Session.sessions.values()):
+            session.handle_close()
+        if self.server is not None:
+            self.server.close()
+        self.reactor.waker.close()
+        if self.reactor.epoll is not None:
+            self.reactor.epoll.close()
+
+    def start_server(self, handler=Session, **options):
+        for name in ('keepalivetimeout', 'headertimeout', 'bodytimeout', 'sendtimeout'):
+            options.setdefault(name, TIMEOUT)
+        self.server = Server('127.0.0.1', 0, handler, map=self.reactor.map, **options)
+        return self.server
+
+    def connect(self, rcvbuf=None):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if rcvbuf is not None:
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        client.connect(self.server.socket.getsockname())
+        client.setblocking(0)
+        self.clients.append(client)
+        self.run_until(lambda: Session.sessions, 1.0)
+        return client
+
+    def run_until(self, condition, timeout=3.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            self.reactor.run_once(0.05)
+        return condition()
+
+    def receive(self, client, timeout=3.0):
+        """
+        Read from client socket until server closes connection
+        :return: (received bytes, connection is closed)
+        """
+        chunks = []
+        closed = []
+
+        def read():
+            while True:
+                try:
+                    chunk = client.recv(65536)
+                except socket.error as err:
+                    if err.args[0] == errno.ECONNRESET:
+                        closed.append(True)
+                        return True
+                    return False
+                if not chunk:
+                    closed.append(True)
+                    return True
+                chunks.append(chunk)
+        self.run_until(read, timeout)
+        return b''.join(chunks), bool(closed)
+
+
+class SessionTest(ServerTestCase):
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        self.start_server()
+        client = self.connect()
+        client.send(GET + b'GET /x HTTP/1.1\r\nConnection: close\r\n\r\n')
+        data, closed = self.receive(client)
+        self.assertTrue(closed)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 2)
+        self.assertIn(b'Connection: keep-alive', data.split(b'HTTP/1.1 200')[1])
+        self.assertIn(b'Connection: close', data.split(b'HTTP/1.1 200')[2])
+
+    def test_http_1_0_connection_is_closed(self):
+        self.start_server()
+        client = self.connect()
+        client.send(b'GET / HTTP/1.0\r\n\r\n')
+        data, closed = self.receive(client)
+        self.assertTrue(closed)
+        self.assertTrue(data.startswith(b'HTTP/1.0 200'), data)
+        self.assertNotIn(b'Connection: keep-alive', data)
+
+    def test_max_requests(self):
+        self.start_server(maxrequests=2)
+        client = self.connect()
+        client.send(GET * 3)
+        data, closed = self.receive(client)
+        self.assertTrue(closed)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 2)
+
+    def test_request_of_buffer_size(self):
+        self.start_server()
+        client = self.connect()
+        session = list(Session.sessions.values())[0]
+        request = self.pad_request(b'GET / HTTP/1.1\r\nX-Pad: ', b'\r\n\r\n', session.in_buffer_size)
+        client.send(request)
+        self.assertTrue(self.run_until(lambda: session.requestCount == 1))
+        # reactor reads drained socket again
+        self.assertFalse(self.run_until(lambda: not session.connected, 0.2))
+        client.send(b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        data, closed = self.receive(client)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 2)
+
+    def test_headers_of_buffer_size(self):
+        self.start_server()
+        client = self.connect()
+        session = list(Session.sessions.values())[0]
+        client.send(self.pad_request(b'POST / HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\nX-Pad: ',
+                                     b'\r\n\r\n', session.in_buffer_size * 2))
+        self.assertTrue(self.run_until(lambda: session.parser.bodyStarted is not None))
+        self.assertFalse(self.run_until(lambda: not session.connected, 0.2))
+        client.send(b'login')
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.1 200'), data)
+        self.assertTrue(closed)
+
+    @staticmethod
+    def pad_request(head, tail, size):
+        return head + b'x' * (size - len(head) - len(tail)) + tail
+
+    def test_requests_are_not_read_while_deferred(self):
+        DeferredSession.release.clear()
+        pool = WorkerPool(workers=1)
+        try:
+            self.start_server(DeferredSession, workerpool=pool)
+            client = self.connect()
+            session = list(Session.sessions.values())[0]
+            for x in range(20):
+                try:
+                    client.send(GET * 1000)
+                except socket.error:
+                    pass
+                self.reactor.run_once(0.01)
+            self.assertTrue(session.busy)
+            # at most one read is parsed after the request queue is full
+            self.assertLessEqual(len(session.requests), session.in_buffer_size // len(GET) + Session.MAX_PIPELINED)
+            DeferredSession.release.set()
+            self.assertTrue(self.run_until(lambda: session.requestCount > Session.MAX_PIPELINED, 5.0))
+        finally:
+            DeferredSession.release.set()
+            pool.stop()
+
+    def test_bad_request(self):
+        self.start_server()
+        client = self.connect()
+        client.send(b'garbage\r\n\r\n')
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.0 400'), data)
+        self.assertTrue(closed)
+
+    def test_headers_too_large(self):
+        self.start_server(maxheadersize=64)
+        client = self.connect()
+        client.send(b'GET / HTTP/1.1\r\nX-Long: ' + b'x' * 100 + b'\r\n\r\n')
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.0 431'), data)
+
+    def test_idle_keep_alive_connection_is_closed(self):
+        self.start_server()
+        client = self.connect()
+        client.send(GET)
+        start = time.time()
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.1 200'))
+        self.assertIn(b'Connection: keep-alive', data)
+        self.assertTrue(closed)
+        self.assertGreaterEqual(time.time() - start, TIMEOUT)
+        self.assertEqual(Session.sessions, {})
+
+
+class TimeoutTest(ServerTestCase):
+
+    def test_incomplete_headers_get_408(self):
+        self.start_server(keepalivetimeout=10)
+        client = self.connect()
+        client.send(b'GET / HTTP/1.1\r\nHost: loc')
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.0 408'), data)
+        self.assertTrue(closed)
+
+    def test_incomplete_body_gets_408(self):
+        self.start_server(keepalivetimeout=10, headertimeout=10)
+        client = self.connect()
+        client.send(b'POST /auth HTTP/1.1\r\nContent-Length: 10\r\n\r\nlogin')
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.0 408'), data)
+        self.assertTrue(closed)
+
+    def test_client_not_reading_responses_is_closed(self):
+        self.start_server(LargeResponseSession, keepalivetimeout=10, headertimeout=10, bodytimeout=10)
+        client = self.connect(rcvbuf=4096)
+        client.send(GET * 10)
+        self.assertTrue(self.run_until(lambda: not Session.sessions, 3.0))
+
+    def test_client_reading_responses_is_not_closed(self):
+        self.start_server(LargeResponseSession, keepalivetimeout=10, headertimeout=10, bodytimeout=10)
+        client = self.connect()
+        client.send(GET * 3 + b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        data, closed = self.receive(client, 10.0)
+        self.assertTrue(closed)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 4)
+
+
+class BackpressureTest(ServerTestCase):
+
+    def test_session_is_paused_until_client_reads(self):
+        self.start_server(LargeResponseSession, sendtimeout=10)
+        pauses = Session.pauseCount
+        client = self.connect(rcvbuf=4096)
+        client.send(GET * 9 + b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertTrue(self.run_until(lambda: Session.pausedSessions == 1, 1.0))
+        self.assertGreater(Session.pauseCount, pauses)
+        session = list(Session.sessions.values())[0]
+        self.assertFalse(session.readable())
+        self.assertLess(session.wsize, session.highWater + len(LargeResponseSession.BODY) + 1024)
+        data, closed = self.receive(client, 10.0)
+        self.assertTrue(closed)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 10)
+        self.assertEqual(Session.pausedSessions, 0)
+
+    def test_paused_session_closed_by_send_timeout(self):
+        self.start_server(LargeResponseSession, keepalivetimeout=10, headertimeout=10, bodytimeout=10)
+        client = self.connect(rcvbuf=4096)
+        client.send(GET * 10)
+        self.assertTrue(self.run_until(lambda: Session.pausedSessions == 1, 1.0))
+        self.assertTrue(self.run_until(lambda: not Session.sessions, 3.0))
+        self.assertEqual(Session.pausedSessions, 0)
+
+class FileTest(ServerTestCase):
+
+    def setUp(self):
+        ServerTestCase.setUp(self)
+        self.file = tempfile.NamedTemporaryFile()
+        self.file.write(b'x' * FILE_SIZE)
+        self.file.flush()
+
+    def tearDown(self):
+        ServerTestCase.tearDown(self)
+        self.file.close()
+
+    def push_file(self, rcvbuf=None):
+        RecordingSession.errors = []
+        self.start_server(RecordingSession)
+        client = self.connect(rcvbuf)
+        session = list(Session.sessions.values())[0]
+        session.push_file(open(self.file.name, 'rb'), 0, FILE_SIZE)
+        self.run_until(lambda: session.wsize < FILE_SIZE, 1.0)
+        return client, session
+
+    def test_file_is_sent(self):
+        client, session = self.push_file()
+        session.finish()
+        data, closed = self.receive(client)
+        self.assertTrue(closed)
+        self.assertEqual(len(data), FILE_SIZE)
+
+    def test_client_reset_during_file_download(self):
+        client, session = self.push_file()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        client.close()
+        self.clients.remove(client)
+        time.sleep(0.1)
+        # write before the reactor reports the reset, send() closes the session and the file
+        session.writeReady = True
+        session.flush()
+        self.assertFalse(session.connected)
+        self.assertEqual(RecordingSession.errors, [])
+        self.assertEqual(session.wsize, 0)
+        self.assertEqual(len(session.wqueue), 0)
+
+    def test_file_truncated_during_download(self):
+        client, session = self.push_file(rcvbuf=4096)
+        self.file.truncate(0)
+        data, closed = self.receive(client)
+        self.assertTrue(closed)
+        self.assertLess(len(data), FILE_SIZE)
+        self.assertEqual(RecordingSession.errors, [])
+        self.assertFalse(session.connected)
+        self.assertEqual(len(session.wqueue), 0)
+
+
+class ConnectionLimitTest(ServerTestCase):
+
+    def test_per_ip_limit(self):
+        self.start_server(maxperip=1, trustedproxies=())
+        self.connect()
+        client = socket.create_connection(self.server.socket.getsockname())
+        client.setblocking(0)
+        self.clients.append(client)
+        data, closed = self.receive(client)
+        self.assertTrue(data.startswith(b'HTTP/1.1 503'), data)
+        self.assertEqual(self.server.rejected, 1)
+
+    def test_max_connections(self):
+        server = self.start_server(maxconnections=1)
+        server.connections = 1
+        self.assertFalse(server.is_allowed('203.0.113.1'))
+
+    def test_trusted_proxy_is_not_limited_per_ip(self):
+        server = self.start_server(maxperip=1)
+        self.assertTrue(server.is_allowed(''))
+        server.ipConnections['127.0.0.1'] = 5
+        self.assertTrue(server.is_allowed('127.0.0.1'))
+        server.ipConnections['203.0.113.1'] = 1
+        self.assertFalse(server.is_allowed('203.0.113.1'))
+
+
+class ClientAddressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+
+    def tearDown(self):
+        Session.sessions.clear()
+        self.reactor.waker.close()
+        if self.reactor.epoll is not None:
+            self.reactor.epoll.close()
+
+    def get_client_address(self, addr, headers, **options):
+        session = Session(None, map=self.reactor.map, addr=addr, **options)
+        return session.get_client_address(Request(headers=headers))
+
+    def test_direct_client(self):
+        self.assertEqual(self.get_client_address(('203.0.113.1', 1000), {'X-Real-Ip': '127.0.0.1'}), '203.0.113.1')
+
+    def test_loopback_proxy(self):
+        self.assertEqual(self.get_client_address(('127.0.0.1', 1000), {'X-Real-Ip': '203.0.113.1'}), '203.0.113.1')
+        self.assertEqual(self.get_client_address(('127.0.0.1', 1000), {}), '127.0.0.1')
+
+    def test_forwarded_for_uses_address_added_by_proxy(self):
+        headers = {'X-Forwarded-For': '10.0.0.1, 203.0.113.1'}
+        self.assertEqual(self.get_client_address(('127.0.0.1', 1000), headers), '203.0.113.1')
+
+    def test_unix_socket_client(self):
+        self.assertEqual(self.get_client_address('', {'X-Real-Ip': '203.0.113.1'}), '203.0.113.1')
+        self.assertEqual(self.get_client_address('', {}), Session.LOCAL_CLIENT)
+
+    def test_configured_proxy(self):
+        self.assertEqual(self.get_client_address(('10.0.0.2', 1000), {'X-Real-Ip': '203.0.113.1'},
+                                                 trustedproxies=('10.0.0.2',)), '203.0.113.1')
+        self.assertEqual(self.get_client_address(('127.0.0.1', 1000), {'X-Real-Ip': '203.0.113.1'},
+                                                 trustedproxies=('10.0.0.2',)), '127.0.0.1')
+
+if __name__ == '__main__':
+    unittest.main()
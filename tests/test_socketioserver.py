@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import unittest
+try:
+    from socketioserver import ChatNamespace
+except ImportError:
+    # gevent-socketio or sqlalchemy is not installed
+    ChatNamespace = None
+
+
+class FakeSocket(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def put_client_msg(self, message):
+        self.messages.append(message)
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.socket = FakeSocket()
+
+
+@unittest.skipIf(ChatNamespace is None, "gevent-socketio is not installed")
+class BroadcastTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions = dict((str(x), FakeSession()) for x in range(3))
+        ChatNamespace._sessions = self.sessions
+
+    def tearDown(self):
+        ChatNamespace._sessions = {}
+
+    def test_packet_is_encoded_once(self):
+        original = ChatNamespace.__dict__['_encode_event']
+        encode = ChatNamespace._encode_event
+        calls = []
+
+        def count(event, message):
+            calls.append(event)
+            return encode(event, message)
+        ChatNamespace._encode_event = staticmethod(count)
+        try:
+            ChatNamespace.deliver(ChatNamespace.CHAT_METHOD, [1, 'text', 'login', '12:00'])
+        finally:
+            ChatNamespace._encode_event = original
+        self.assertEqual(calls, [ChatNamespace.CHAT_METHOD])
+        packets = [session.socket.messages for session in self.sessions.values()]
+        self.assertEqual(len(packets[0]), 1)
+        for messages in packets:
+            self.assertIs(messages[0], packets[0][0])
+        self.assertIn('"text"', packets[0][0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+from email.utils import formatdate
+from http.message import Request
+from http.static import StaticFile
+from http.static import StaticCache
+from http.static import RangeNotSatisfiable
+from http.static import CACHE_FILES
+
+CONTENT = b'var message = "hello";\n' * 100
+
+
+def create_request(**headers):
+    return Request(headers=dict((key.replace('_', '-'), value) for key, value in headers.items()))
+
+
+class StaticFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'chat.js')
+        with open(self.path, 'wb') as file:
+            file.write(CONTENT)
+        self.entry = StaticFile(self.path, os.stat(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_content_and_validators(self):
+        self.assertEqual(self.entry.content, CONTENT)
+        self.assertEqual(self.entry.size, len(CONTENT))
+        self.assertTrue(self.entry.etag.startswith('"') and self.entry.etag.endswith('"'))
+        self.assertIn('javascript', self.entry.contentType)
+
+    def test_range(self):
+        self.assertEqual(self.entry.get_range(create_request(Range='bytes=0-9')), (0, 9))
+
+    def test_open_range(self):
+        self.assertEqual(self.entry.get_range(create_request(Range='bytes=100-')), (100, len(CONTENT) - 1))
+
+    def test_suffix_range(self):
+        self.assertEqual(self.entry.get_range(create_request(Range='bytes=-10')),
+                         (len(CONTENT) - 10, len(CONTENT) - 1))
+
+    def test_range_end_is_clamped(self):
+        self.assertEqual(self.entry.get_range(create_request(Range='bytes=10-100000')), (10, len(CONTENT) - 1))
+
+    def test_range_out_of_file(self):
+        self.assertRaises(RangeNotSatisfiable, self.entry.get_range,
+                          create_request(Range='bytes={}-'.format(len(CONTENT))))
+
+    def test_unsupported_ranges_are_ignored(self):
+        for value in ('bytes=0-1,5-6', 'items=0-1', 'bytes=a-b', 'bytes=5'):
+            self.assertIsNone(self.entry.get_range(create_request(Range=value)), value)
+
+    def test_if_range(self):
+        request = create_request(Range='bytes=0-9', If_Range=self.entry.etag)
+        self.assertEqual(self.entry.get_range(request), (0, 9))
+        request = create_request(Range='bytes=0-9', If_Range=self.entry.lastModified)
+        self.assertEqual(self.entry.get_range(request), (0, 9))
+        request = create_request(Range='bytes=0-9', If_Range='"other"')
+        self.assertIsNone(self.entry.get_range(request))
+
+    def test_not_modified_by_etag(self):
+        self.assertTrue(self.entry.is_not_modified(create_request(If_None_Match=self.entry.etag)))
+        self.assertTrue(self.entry.is_not_modified(create_request(If_None_Match='"x", W/' + self.entry.etag)))
+        self.assertTrue(self.entry.is_not_modified(create_request(If_None_Match='*')))
+        self.assertFalse(self.entry.is_not_modified(create_request(If_None_Match='"x"')))
+
+    def test_etag_wins_over_modification_date(self):
+        request = create_request(If_None_Match='"x"', If_Modified_Since=self.entry.lastModified)
+        self.assertFalse(self.entry.is_not_modified(request))
+
+    def test_not_modified_by_date(self):
+        self.assertTrue(self.entry.is_not_modified(create_request(If_Modified_Since=self.entry.lastModified)))
+        older = formatdate(int(self.entry.mtime) - 60, usegmt=True)
+        self.assertFalse(self.entry.is_not_modified(create_request(If_Modified_Since=older)))
+        self.assertFalse(self.entry.is_not_modified(create_request(If_Modified_Since='garbage')))
+        self.assertFalse(self.entry.is_not_modified(create_request()))
+
+    def test_gzip_variant(self):
+        content, etag, encoding = self.entry.get_variant(create_request(Accept_Encoding='deflate, gzip'))
+        self.assertEqual(encoding, 'gzip')
+        self.assertNotEqual(etag, self.entry.etag)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(content)).read(), CONTENT)
+        self.assertTrue(self.entry.is_not_modified(create_request(If_None_Match=etag), etag))
+
+    def test_identity_variant(self):
+        for request in (create_request(), create_request(Accept_Encoding='gzip;q=0')):
+            self.assertEqual(self.entry.get_variant(request), (CONTENT, self.entry.etag, None))
+
+    def test_range_is_not_compressed(self):
+        request = create_request(Accept_Encoding='gzip', Range='bytes=0-9')
+        self.assertEqual(self.entry.get_variant(request), (CONTENT, self.entry.etag, None))
+
+    def test_large_file_is_not_kept_in_memory(self):
+        entry = StaticFile(self.path, os.stat(self.path), large=True)
+        self.assertIsNone(entry.content)
+        self.assertIsNone(entry.gzipContent)
+        self.assertFalse(entry.compressible)
+        self.assertEqual(entry.etag, self.entry.etag)
+        self.assertEqual(entry.get_variant(create_request(Accept_Encoding='gzip')), (None, entry.etag, None))
+
+    def test_incompressible_file(self):
+        path = os.path.join(self.root, 'image.png')
+        with open(path, 'wb') as file:
+            file.write(CONTENT)
+        entry = StaticFile(path, os.stat(path))
+        self.assertEqual(entry.get_variant(create_request(Accept_Encoding='gzip')), (CONTENT, entry.etag, None))
+
+
+class StaticCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'js'))
+        self.path = os.path.join(self.root, 'js', 'chat.js')
+        with open(self.path, 'wb') as file:
+            file.write(CONTENT)
+        self.cache = StaticCache(self.root, checkinterval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_preload(self):
+        entry = self.cache.get('/js/chat.js?v=1')
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.content, CONTENT)
+        self.assertIs(self.cache.get('/js/chat.js'), entry)
+        self.assertEqual(CACHE_FILES.default.get(), 1)
+
+    def test_large_file(self):
+        cache = StaticCache(self.root, checkinterval=0, largefilesize=1024)
+        entry = cache.get('/js/chat.js')
+        self.assertTrue(entry.large)
+        self.assertIsNone(entry.content)
+
+    def test_path_out_of_root(self):
+        self.assertIsNone(self.cache.get('/../etc/passwd'))
+        self.assertIsNone(self.cache.get('/js'))
+
+    def test_reload_changed_file(self):
+        entry = self.cache.get('/js/chat.js')
+        with open(self.path, 'wb') as file:
+            file.write(b'changed')
+        os.utime(self.path, (entry.mtime + 10, entry.mtime + 10))
+        reloaded = self.cache.get('/js/chat.js')
+        self.assertIsNot(reloaded, entry)
+        self.assertEqual(reloaded.content, b'changed')
+
+    def test_removed_file(self):
+        os.unlink(self.path)
+        self.assertIsNone(self.cache.get('/js/chat.js'))
+        self.assertEqual(CACHE_FILES.default.get(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import unittest
+from utils import metrics
+from utils import tracing
+from utils.tracing import Trace
+from utils.tracing import SlowRequestLog
+
+
+def create_trace():
+    trace = Trace('GET', '/chat.html', '203.0.113.1', 1.0, 1.5, 1.75, 2.0)
+    trace.handlerStart = 2.5
+    trace.handlerEnd = 3.0
+    trace.queued = 3.25
+    trace.flushed = 4.0
+    return trace
+
+
+class TraceTest(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.activate(None)
+
+    def test_phases(self):
+        trace = create_trace()
+        trace.add('db', 0.25)
+        self.assertEqual(trace.get_phases(), [('connect', 0.5), ('parse', 0.25), ('wait', 0.25), ('pool', 0.5),
+                                              ('handler', 0.5), ('db', 0.25), ('loop', 0.25), ('flush', 0.75)])
+        self.assertEqual(trace.get_total(), 2.5)
+
+    def test_spans_of_current_trace(self):
+        trace = create_trace()
+        tracing.add('db', 1.0)
+        tracing.activate(trace)
+        tracing.add('db', 1.0)
+        with tracing.span('redis'):
+            pass
+        self.assertEqual(trace.spans['db'], 1.0)
+        self.assertIn('redis', trace.spans)
+        self.assertIs(tracing.current(), trace)
+
+    def test_trace_is_per_thread(self):
+        tracing.activate(create_trace())
+        found = []
+        thread = threading.Thread(target=lambda: found.append(tracing.current()))
+        thread.start()
+        thread.join()
+        self.assertEqual(found, [None])
+
+    def test_timed_adds_span(self):
+        histogram = metrics.Histogram('traced', "Traced", registry=None)
+        trace = create_trace()
+        tracing.activate(trace)
+        metrics.timed(histogram, lambda seconds: tracing.add('call', seconds))(lambda: None)()
+        self.assertIn('call', trace.spans)
+        self.assertEqual(histogram.default.count, 1)
+
+
+class SlowRequestLogTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger(SlowRequestLog.__name__).disabled = True
+
+    def tearDown(self):
+        logging.getLogger(SlowRequestLog.__name__).disabled = False
+
+    def test_only_slow_requests_are_kept(self):
+        log = SlowRequestLog(threshold=1.0, size=2)
+        fast = create_trace()
+        fast.started = fast.flushed - 0.5
+        log.record(fast)
+        self.assertEqual(log.get_traces(), [])
+        for url in ('/a', '/b', '/c'):
+            trace = create_trace()
+            trace.url = url
+            log.record(trace)
+        traces = log.get_traces()
+        self.assertEqual([trace['url'] for trace in traces], ['/c', '/b'])
+        self.assertEqual(traces[0]['total_ms'], 2500.0)
+
+if __name__ == '__main__':
+    unittest.main()
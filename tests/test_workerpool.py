@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+from http.workerpool import WorkerPool
+from http.workerpool import QUEUE_DEPTH
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(workers=2, routelimits={'slow': 1})
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.done = []
+        self.doneLock = threading.Condition()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.stop()
+
+    def block(self, name):
+        self.started.set()
+        self.release.wait(5.0)
+
+    def finished(self):
+        with self.doneLock:
+            self.done.append(True)
+            self.doneLock.notify_all()
+
+    def wait_done(self, count):
+        with self.doneLock:
+            while len(self.done) < count:
+                self.doneLock.wait(5.0)
+
+    def test_route_limit(self):
+        for x in range(3):
+            self.pool.submit('slow', self.block, self.finished, x)
+        self.assertTrue(self.started.wait(5.0))
+        self.assertEqual(self.pool.stats()['slow'], (1, 2))
+        self.assertEqual(self.pool.queue_depth(), 2)
+        self.assertEqual(QUEUE_DEPTH.labels('slow').get(), 2)
+        self.release.set()
+        self.wait_done(3)
+        self.assertEqual(self.pool.queue_depth(), 0)
+        self.assertEqual(QUEUE_DEPTH.labels('slow').get(), 0)
+
+    def test_other_route_is_not_blocked(self):
+        self.pool.submit('slow', self.block, self.finished, 1)
+        self.pool.submit('slow', self.block, self.finished, 2)
+        event = threading.Event()
+        self.pool.submit('fast', lambda: None, event.set)
+        self.assertTrue(event.wait(5.0))
+        self.release.set()
+        self.wait_done(2)
+
+    def test_failed_task_releases_route(self):
+        self.pool.submit('slow', lambda: 1 / 0, self.finished)
+        self.pool.submit('slow', lambda: None, self.finished)
+        self.wait_done(2)
+        self.assertEqual(self.pool.stats()['slow'], (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import atexit
+import logging
+import threading
+import Queue
+from utils import metrics
+
+FORMAT = u'%(filename)s[LINE:%(lineno)d]# %(levelname)-8s [%(asctime)s] %(name)s > %(message)s'
+QUEUE_SIZE = 10000
+
+DROPPED = metrics.Counter('log_records_dropped_total', "Log records dropped because log queue was full")
+SUPPRESSED = metrics.Counter('log_records_suppressed_total', "Log records suppressed by rate limit or sampling",
+                             ('logger',))
+
+
+class QueueHandler(logging.Handler):
+    """
+    Handler putting records into a bounded queue, a writer thread passes them to target handlers.
+    Message is formatted by the writer thread, so callers pay for the record only. When the queue is full
+    the record is dropped and counted, logging never blocks the event loop on a slow disk.
+    Writer thread is started again in a forked child, threads do not survive fork.
+    """
+
+    def __init__(self, handlers, queuesize=QUEUE_SIZE):
+        """
+        Constructor
+        :param handlers: target handlers
+        :param queuesize: max queued records
+        """
+        logging.Handler.__init__(self)
+        self.handlers = list(handlers)
+        self.queueSize = queuesize
+        self.dropped = 0
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.startLock = threading.Lock()
+
+    def start(self):
+        """
+        Start writer thread in current process
+        """
+        with self.startLock:
+            if self.pid == os.getpid():
+                return
+            self.queue = Queue.Queue(self.queueSize)
+            self.thread = threading.Thread(target=self.write_records, name='log-writer')
+            self.thread.daemon = True
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def stop(self, timeout=5.0):
+        """
+        Write queued records and stop writer thread
+        :param timeout: seconds to wait for writer thread
+        """
+        if self.pid != os.getpid():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Queue.Full:
+            return
+        self.thread.join(timeout)
+        self.pid = None
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        if record.exc_info:
+            # traceback keeps frames of caller alive, render it now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+            DROPPED.inc()
+
+    def write_records(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Filter for per-request messages: token bucket of rate records per second per logger,
+    optionally only one of every sample records passes. Records above level always pass.
+    """
+
+    def __init__(self, rate=None, burst=None, sample=1, level=logging.WARNING):
+        """
+        Constructor
+        :param rate: records per second, None - not limited
+        :param burst: bucket size, defaults to rate
+        :param sample: pass one of every sample records
+        :param level: the highest limited level, records above it are not limited
+        """
+        logging.Filter.__init__(self)
+        self.rate = rate
+        self.burst = burst or rate
+        self.sample = sample
+        self.level = level
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        with self.lock:
+            self.counter += 1
+            allowed = self.counter % self.sample == 0
+            if allowed and self.rate is not None:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                allowed = self.tokens >= 1
+                if allowed:
+                    self.tokens -= 1
+        if not allowed:
+            SUPPRESSED.labels(record.name).inc()
+        return allowed
+
+
+def limit(name, rate=None, burst=None, sample=1, level=logging.WARNING):
+    """
+    Rate limit or sample records of logger. Filters of a logger do not apply to its children,
+    so the logger has to be the one the records are logged to.
+    :param name: logger name
+    :param rate: records per second, None - not limited
+    :param burst: bucket size, defaults to rate
+    :param sample: pass one of every sample records
+    :param level: the highest limited level, records above it are not limited
+    :return: RateLimitFilter
+    """
+    loggerFilter = RateLimitFilter(rate, burst, sample, level)
+    logging.getLogger(name).addFilter(loggerFilter)
+    return loggerFilter
+
+
+def configure(level=logging.INFO, format=FORMAT, queuesize=QUEUE_SIZE, stream=None):
+    """
+    Send records of root logger through a bounded queue to a stream written by background thread
+    :param level: root logger level
+    :param format: record format
+    :param queuesize: max queued records, the rest is dropped
+    :param stream: output stream, defaults to stderr
+    :return: QueueHandler
+    """
+    streamHandler = logging.StreamHandler(stream or sys.stderr)
+    streamHandler.setFormatter(logging.Formatter(format))
+    handler = QueueHandler([streamHandler], queuesize)
+    root = logging.getLogger()
+    for item in list(root.handlers):
+        root.removeHandler(item)
+    root.addHandler(handler)
+    root.setLevel(level)
+    handler.start()
+    atexit.register(handler.stop)
+    return handler
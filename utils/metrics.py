@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+import bisect
+import functools
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_value(value):
+    """
+    Format sample value in Prometheus text format
+    :param value: number
+    :return: str
+    """
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+def format_labels(names, values):
+    """
+    Format label set
+    :param names: label names
+    :param values: label values
+    :return: str like {name="value"} or empty string
+    """
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                          .replace('\n', '\\n')) for name, value in zip(names, values))
+
+
+class Registry(object):
+    """
+    Collection of metrics exposed together
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add metric
+        :param metric: Metric
+        :raise ValueError: metric with the same name is already registered
+        """
+        with self.lock:
+            if any(item.name == metric.name for item in self.metrics):
+                raise ValueError("Metric {} is already registered".format(metric.name))
+            self.metrics.append(metric)
+
+    def expose(self):
+        """
+        Build Prometheus text exposition of all metrics
+        :return: str
+        """
+        lines = []
+        for metric in list(self.metrics):
+            lines.extend(metric.expose())
+        lines.append('')
+        return '\n'.join(lines)
+
+REGISTRY = Registry()
+
+
+class Metric(object):
+    """
+    Base metric. Labelled children are created on the first use of label values and then reused,
+    so callers on hot paths keep the child and record without lookups.
+    """
+    TYPE = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        """
+        Constructor
+        :param name: metric name
+        :param help: metric description
+        :param labelnames: label names
+        :param registry: Registry to expose metric in, None - do not register
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+        self.default = self.labels() if not self.labelNames else None
+
+    def labels(self, *values):
+        """
+        Get child of label values
+        :param values: label values in order of label names
+        :return: child metric
+        """
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelNames):
+                raise ValueError("Metric {} has labels {}".format(self.name, self.labelNames))
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self.create_child()
+        return child
+
+    def create_child(self):
+        raise NotImplementedError
+
+    def expose(self):
+        """
+        Get text exposition lines
+        :return: list of str
+        """
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.TYPE)]
+        for values, child in sorted(self.children.items()):
+            lines.extend(child.expose(self.name, self.labelNames, values))
+        return lines
+
+
+class CounterValue(object):
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def expose(self, name, labelnames, values):
+        return ['%s%s %s' % (name, format_labels(labelnames, values), format_value(self.value))]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    TYPE = 'counter'
+
+    def create_child(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+
+class GaugeValue(object):
+    __slots__ = ('value', 'func', 'lock')
+
+    def __init__(self, func=None):
+        self.value = 0
+        self.func = func
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def get(self):
+        return self.func() if self.func is not None else self.value
+
+    def expose(self, name, labelnames, values):
+        return ['%s%s %s' % (name, format_labels(labelnames, values), format_value(self.get()))]
+
+
+class Gauge(Metric):
+    """
+    Value which goes up and down. Unlabelled gauge may be computed by a function at exposition time.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, func=None):
+        """
+        Constructor
+        :param func: callable returning current value, for unlabelled gauge only
+        """
+        self.func = func
+        Metric.__init__(self, name, help, labelnames, registry)
+
+    def create_child(self):
+        return GaugeValue(self.func if not self.labelNames else None)
+
+    def set(self, value):
+        self.default.set(value)
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def dec(self, amount=1):
+        self.default.dec(amount)
+
+
+class HistogramValue(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Record value. Buckets are preallocated, so it costs one binary search over a fixed number of bounds.
+        :param value: observed value
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def expose(self, name, labelnames, values):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+        lines = []
+        cumulative = 0
+        bucketLabels = labelnames + ('le',)
+        for bound, bucketCount in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucketCount
+            lines.append('%s_bucket%s %d' % (name, format_labels(bucketLabels, values + (format_value(bound),)),
+                                             cumulative))
+        labels = format_labels(labelnames, values)
+        lines.append('%s_sum%s %s' % (name, labels, format_value(total)))
+        lines.append('%s_count%s %d' % (name, labels, count))
+        return lines
+
+
+class Histogram(Metric):
+    """
+    Distribution of values over fixed buckets
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        """
+        Constructor
+        :param buckets: sorted upper bounds of buckets, +Inf bucket is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        Metric.__init__(self, name, help, labelnames, registry)
+
+    def create_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.default.observe(value)
+
+
+def timed(histogram, callback=None):
+    """
+    Decorator recording duration of function calls
+    :param histogram: Histogram or its labelled child
+    :param callback: function taking duration in seconds, called after every call, e.g. to add it to a trace
+    :return: decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                histogram.observe(elapsed)
+                if callback is not None:
+                    callback(elapsed)
+        return wrapper
+    return decorator
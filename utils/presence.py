@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+class PresenceIndex(object):
+    """
+    Online users of process: sessions by user identifier and number of sessions by login.
+    Online login list is kept as a snapshot, it is rebuilt only after a user enters or exits, and version
+    of the snapshot changes with it.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.users = {}
+        self.logins = {}
+        self.version = 0
+        self.snapshot = ()
+        self.snapshotVersion = 0
+
+    def add(self, userid, login, sessionid):
+        """
+        Add session of user
+        :param userid: user identifier
+        :param login: user login
+        :param sessionid: session identifier
+        :return: True if it is the first session of user
+        """
+        sessions = self.sessions.setdefault(userid, set())
+        if sessionid in sessions:
+            return False
+        sessions.add(sessionid)
+        self.users[userid] = login
+        count = self.logins.get(login, 0)
+        self.logins[login] = count + 1
+        if not count:
+            self.version += 1
+        return len(sessions) == 1
+
+    def remove(self, userid, login, sessionid):
+        """
+        Remove session of user
+        :param userid: user identifier
+        :param login: user login
+        :param sessionid: session identifier
+        :return: True if it was the last session of user
+        """
+        sessions = self.sessions.get(userid)
+        if sessions is None or sessionid not in sessions:
+            return False
+        sessions.discard(sessionid)
+        count = self.logins.get(login, 0) - 1
+        if count > 0:
+            self.logins[login] = count
+        else:
+            self.logins.pop(login, None)
+            self.version += 1
+        if sessions:
+            return False
+        del self.sessions[userid]
+        del self.users[userid]
+        return True
+
+    def is_online(self, userid):
+        """
+        Check if user has sessions
+        :param userid: user identifier
+        :return: bool
+        """
+        return userid in self.sessions
+
+    def get_users(self):
+        """
+        Get users with sessions
+        :return: dictionary of user identifier to login
+        """
+        return dict(self.users)
+
+    def get_snapshot(self):
+        """
+        Get online logins
+        :return: (version, tuple of logins)
+        """
+        if self.snapshotVersion != self.version:
+            self.snapshot = tuple(self.logins)
+            self.snapshotVersion = self.version
+        return self.version, self.snapshot
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import logging
+from collections import deque
+
+_local = threading.local()
+
+def activate(trace):
+    """
+    Make trace current in calling thread
+    :param trace: Trace or None
+    """
+    _local.trace = trace
+
+def current():
+    """
+    Get trace of the request handled by calling thread
+    :return: Trace or None
+    """
+    return getattr(_local, 'trace', None)
+
+def add(name, seconds):
+    """
+    Add time to a span of current trace, if there is one
+    :param name: span name
+    :param seconds: duration
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class span(object):
+    """
+    Context manager adding its duration to a span of current trace
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        add(self.name, time.time() - self.start)
+
+
+class Trace(object):
+    """
+    Timestamps and spans of one request. Timestamps are filled in by the session as the request moves from
+    the socket to the handler and back, spans are added by code running on behalf of the request.
+    """
+    __slots__ = ('method', 'url', 'route', 'code', 'client', 'accepted', 'started', 'received', 'dequeued',
+                 'handlerStart', 'handlerEnd', 'queued', 'flushed', 'spans')
+
+    def __init__(self, method, url, client, accepted, started, received, dequeued):
+        """
+        Constructor
+        :param method: HTTP method
+        :param url: HTTP url
+        :param client: client address
+        :param accepted: connection accept timestamp for the first request of connection, else None
+        :param started: timestamp of the first request byte
+        :param received: timestamp of the last request byte
+        :param dequeued: timestamp when processing started
+        """
+        self.method = method
+        self.url = url
+        self.route = None
+        self.code = None
+        self.client = client
+        self.accepted = accepted
+        self.started = started
+        self.received = received
+        self.dequeued = dequeued
+        self.handlerStart = None
+        self.handlerEnd = None
+        self.queued = None
+        self.flushed = None
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def get_total(self):
+        """
+        Get time from the first request byte to the last response byte handed to the kernel
+        :return: seconds
+        """
+        return (self.flushed or self.queued or time.time()) - (self.started or self.dequeued)
+
+    def get_phases(self):
+        """
+        Get request phases in order
+        :return: list of (phase, seconds)
+        """
+        phases = []
+        if self.accepted is not None and self.started is not None:
+            phases.append(('connect', self.started - self.accepted))
+        if self.started is not None and self.received is not None:
+            phases.append(('parse', self.received - self.started))
+            phases.append(('wait', self.dequeued - self.received))
+        if self.handlerStart is not None:
+            phases.append(('pool', self.handlerStart - self.dequeued))
+            phases.append(('handler', self.handlerEnd - self.handlerStart))
+            phases.extend(sorted(self.spans.items()))
+            phases.append(('loop', self.queued - self.handlerEnd))
+        elif self.queued is not None:
+            phases.append(('handler', self.queued - self.dequeued))
+        if self.flushed is not None:
+            phases.append(('flush', self.flushed - self.queued))
+        return phases
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'url': self.url,
+            'route': self.route,
+            'code': self.code,
+            'client': str(self.client),
+            'start': self.started or self.dequeued,
+            'total_ms': round(self.get_total() * 1000, 3),
+            'phases_ms': [(name, round(seconds * 1000, 3)) for name, seconds in self.get_phases()],
+        }
+
+    def __str__(self):
+        return "%s %s -> %s, %.1f ms: %s" % (self.method, self.url, self.code, self.get_total() * 1000,
+                                            ', '.join('%s %.1f' % (name, seconds * 1000)
+                                                      for name, seconds in self.get_phases()))
+
+
+class SlowRequestLog(object):
+    """
+    Log of requests slower than threshold. The last traces are kept in memory for inspection.
+    """
+    THRESHOLD = 0.5
+    SIZE = 100
+
+    def __init__(self, threshold=THRESHOLD, size=SIZE):
+        """
+        Constructor
+        :param threshold: seconds, slower requests are logged
+        :param size: number of traces kept in memory
+        """
+        self._log = logging.getLogger(self.__class__.__name__)
+        self.threshold = threshold
+        self.traces = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, trace):
+        """
+        Log trace of finished request if it is slow
+        :param trace: Trace
+        """
+        if trace.get_total() < self.threshold:
+            return
+        self._log.warning("Slow request from %s: %s", trace.client, trace)
+        with self.lock:
+            self.traces.append(trace)
+
+    def get_traces(self):
+        """
+        Get kept slow traces, the newest first
+        :return: list of dicts
+        """
+        with self.lock:
+            traces = list(self.traces)
+        return [trace.to_dict() for trace in reversed(traces)]